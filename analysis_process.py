@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 code to run the ASUS G20 sound lighting analysis in its own
+process
+
+IMPORTANT: run as administrator
+
+Sound capture and analysis run in a child process, on a core of their
+own, so they neither hold up nor are held up by a GUI. The child writes
+each lighting frame into a FrameRing, a ring of colors in shared memory
+from multiprocessing.RawArray, and the parent takes the newest frame
+from it and writes it to the device. Nothing is pickled after the child
+starts, and there are no locks between the processes: the ring has one
+writer and is large enough that a frame being read is never reused.
+
+The sound never leaves the child, only the frames of 3 colors do, and
+new settings go the other way down a pipe, so a SoundLightSession
+changes them while the lights keep going. A setting the child cannot
+apply leaves it running as it was, and the error comes back on a second
+pipe. When the lights stop, the session pauses the child's sound stream
+rather than ending it, so a restart needs neither a new process nor a
+new PyAudio.
+
+"""
+
+import ctypes
+import multiprocessing
+import sys
+import threading
+
+import numpy
+
+import light_acpi as la
+import audio_capture as acap
+import asus_soundlighting as asl
+import color_blend as cb
+from effect_worker import StopToken
+
+FRAME_RING_SIZE = 64
+# largest analysis window a running session may change to, in frames
+MAX_WINDOW = 2**18
+
+
+def check_config(config):
+    """
+    raise ValueError unless a running SoundPipeline can change to config:
+    its ring always holds MAX_WINDOW frames and a second of sound, so the
+    window must be at most MAX_WINDOW and the hop at most a second
+    the band edges were checked against the Nyquist frequency by
+    asus_soundlighting.make_config
+    """
+    if config.window > MAX_WINDOW:
+        raise ValueError("window of %d frames is over MAX_WINDOW, %d" %
+                         (config.window, MAX_WINDOW))
+    if config.hop > config.samplerate:
+        raise ValueError("hop of %d frames is over a second, %d frames" %
+                         (config.hop, config.samplerate))
+
+def error_message(error):
+    """
+    an exception as a string for the parent, which may not unpickle it
+    """
+    return "%s: %s" % (error.__class__.__name__, error)
+
+
+class FrameRing(object):
+    """
+    Ring of lighting frames in shared memory, appended by one process and
+    read by others
+    written counts all frames ever appended, and is only advanced after
+    a frame is in place
+    """
+    def __init__(self, capacity=FRAME_RING_SIZE, zones=la.ZONES):
+        self.capacity = capacity
+        self.zones = tuple(zones)
+        self.raw = multiprocessing.RawArray(ctypes.c_uint32,
+                                            capacity * len(self.zones))
+        self.raw_written = multiprocessing.RawValue(ctypes.c_longlong, 0)
+        self.colors = None
+        self._attach()
+
+    def _attach(self):
+        """
+        view the shared colors as a (capacity, zones) array
+        """
+        self.colors = numpy.frombuffer(self.raw, dtype=numpy.uint32).reshape(
+            self.capacity, len(self.zones))
+
+    def __getstate__(self):
+        # only the shared memory goes to the child, not the view of it
+        state = self.__dict__.copy()
+        state['colors'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    @property
+    def written(self):
+        """
+        number of frames ever appended
+        """
+        return self.raw_written.value
+
+    def append(self, frame):
+        """
+        add a frame, a dict of light position to color
+        """
+        count = self.raw_written.value
+        self.colors[count % self.capacity] = [frame[zone]
+                                              for zone in self.zones]
+        self.raw_written.value = count + 1
+
+    def latest(self, after=0):
+        """
+        (written, frame) of the newest frame if more than after frames
+        have been written, else None
+        """
+        count = self.raw_written.value
+        if count <= after:
+            return None
+        colors = self.colors[(count - 1) % self.capacity].tolist()
+        return count, dict(zip(self.zones, [int(color) for color in colors]))
+
+
+class SoundPipeline(object):
+    """
+    The sound capture and frame maker of a SoundLightConfig, which a new
+    config changes in place: only a new device or samplerate reopens the
+    sound stream, a new window or hop retimes it, and the other settings
+    go to the frame maker
+    pause stops the sound stream without closing it, and resume starts it
+    A config that cannot be applied is sent as an error message on the
+    errors connection if given, else raised, and the old one kept
+    """
+    def __init__(self, config, errors=None):
+        self.config = config
+        self.errors = errors
+        self.capture = self.open_capture(config)
+        self.maker = asl.SoundFrameMaker.from_config(config)
+        self.paused = False
+
+    @staticmethod
+    def open_capture(config):
+        """
+        a callback capture for config, whose window may grow to MAX_WINDOW
+        """
+        return acap.CallbackCapture(config.device, config.samplerate,
+                                    asl.CHANNELS, config.window, config.hop,
+                                    max_window=MAX_WINDOW)
+
+    def reconfigure(self, config):
+        """
+        apply a new config, returning whether the stream was reopened
+        if it cannot be applied, the old config stays and the error is
+        raised
+        """
+        old = self.config
+        changed = set(name for name in config._fields
+                      if getattr(config, name) != getattr(old, name))
+        if changed & set(['device', 'samplerate']):
+            maker = asl.SoundFrameMaker.from_config(config)
+            self.capture.close()
+            try:
+                self.capture = self.open_capture(config)
+            except Exception:
+                # back to the stream that worked
+                self.capture = self.open_capture(old)
+                raise
+            finally:
+                # unless the old stream could not be opened again either
+                if self.paused and not self.capture.closed:
+                    self.capture.pause()
+            self.maker = maker
+            self.config = config
+            return True
+        settings = dict((name, getattr(config, name)) for name in changed
+                        if name in ('rotation_interval', 'stereo', 'beats',
+                                    'hop', 'attack', 'release'))
+        # what can fail comes before anything changes
+        if changed & set(['band_layout', 'nbands']):
+            settings['band_edges'] = asl.config_band_edges(config)
+        if changed & set(['window', 'hop']):
+            self.capture.retime(config.window, config.hop)
+        if settings:
+            self.maker.configure(**settings)
+        self.config = config
+        return False
+
+    def command(self, name, config):
+        """
+        apply a command from the parent, 'config', 'pause' or 'resume'
+        with the config to run, returning whether the windows being taken
+        have ended because the stream was reopened, paused or resumed
+        """
+        if name == 'pause':
+            if not self.paused:
+                self.capture.pause()
+                self.paused = True
+            return True
+        capture = self.capture
+        try:
+            reopened = self.reconfigure(config)
+        except Exception as error: #pylint: disable-msg=W0703
+            if self.errors is None:
+                raise
+            self.errors.send(error_message(error))
+            # the old stream may have been opened again
+            reopened = self.capture is not capture
+        if name == 'resume' and self.paused:
+            self.capture.resume()
+            self.paused = False
+            return True
+        return reopened
+
+    def frames(self, stop, commands=None):
+        """
+        generate lighting frames until the stop token is set, applying
+        each (command, config) sent on the commands connection, if given,
+        after each frame or while paused
+        """
+        while not stop.stopped():
+            if self.paused:
+                if commands.poll(acap.STOP_POLL):
+                    self.command(*commands.recv())
+                continue
+            restart = False
+            for data in self.capture.windows(stop=stop):
+                yield self.maker.make_frame(data)
+                while commands is not None and commands.poll():
+                    restart = self.command(*commands.recv()) or restart
+                if restart:
+                    break
+            if not restart:
+                return
+
+    def close(self):
+        """
+        close the sound stream, if a failed reopen has not closed it
+        """
+        if not self.capture.closed:
+            self.capture.close()
+
+
+def analyze_sound(ring, stop_event, commands, errors, config): #pylint: disable-msg=R0913
+    """
+    the child process: capture sound and append its lighting frames to
+    ring until stop_event is set, applying each command received on the
+    commands connection and sending errors on the errors connection,
+    including the one it ends with, if any
+    the config is passed whole, since the child does not see module
+    settings changed in the parent
+    """
+    try:
+        pipeline = SoundPipeline(config, errors)
+        try:
+            for frame in pipeline.frames(StopToken(stop_event), commands):
+                ring.append(frame)
+        finally:
+            pipeline.close()
+    except Exception as error:
+        errors.send(error_message(error))
+        raise
+
+
+class AnalysisProcess(object):
+    """
+    The sound analysis running in a child process, writing to a FrameRing
+    config is a SoundLightConfig, by default from the settings of
+    asus_soundlighting in this process, and update sends the child a new
+    one while it runs
+    pause and resume stop and start the child's sound stream, the child
+    and its PyAudio staying open between them
+    """
+    def __init__(self, config=None):
+        if config is None:
+            config = asl.make_config()
+        self.config = config
+        self.ring = FrameRing()
+        self.stop_event = multiprocessing.Event()
+        self.commands, sender = multiprocessing.Pipe(duplex=False)
+        self.sender = sender
+        self.errors, error_sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=analyze_sound, name='sound analysis',
+            args=(self.ring, self.stop_event, self.commands, error_sender,
+                  config))
+        self.process.daemon = True
+
+    @property
+    def samplerate(self):
+        """
+        sound frames a second
+        """
+        return self.config.samplerate
+
+    @property
+    def hop(self):
+        """
+        sound frames between lighting frames
+        """
+        return self.config.hop
+
+    def start(self):
+        """
+        start the child process, returning self
+        """
+        self.process.start()
+        return self
+
+    def update(self, config):
+        """
+        have the child apply a new SoundLightConfig after its next frame
+        """
+        self.config = config
+        self.sender.send(('config', config))
+
+    def pause(self):
+        """
+        have the child stop its sound stream after its next frame, keeping
+        the stream open for resume
+        """
+        self.sender.send(('pause', None))
+
+    def resume(self, config=None):
+        """
+        have the child start its sound stream again, with a new
+        SoundLightConfig if given
+        """
+        if config is not None:
+            self.config = config
+        self.sender.send(('resume', self.config))
+
+    def error(self):
+        """
+        the newest error message the child sent since the last call, or
+        None
+        """
+        message = None
+        try:
+            while self.errors.poll():
+                message = self.errors.recv()
+        except EOFError:
+            # the child has ended, after sending all it had
+            pass
+        return message
+
+    def frames(self, stop=None, after=0):
+        """
+        generate the newest frame each time one is written, of those after
+        the first after frames, until the stop token is set if given or
+        the child exits
+        frames written faster than they are taken are skipped
+        """
+        if stop is None:
+            stop = StopToken()
+        seen = after
+        while not stop.stopped():
+            latest = self.ring.latest(seen)
+            if latest is not None:
+                seen, frame = latest
+                yield frame
+            elif not self.process.is_alive():
+                return
+            else:
+                # poll at a quarter hop, as the frames come every hop
+                stop.wait(self.hop / (4.0 * self.samplerate))
+
+    def stop(self, timeout=1.0):
+        """
+        ask the child to stop, closing its sound stream, and wait up to
+        timeout seconds for it before terminating it
+        """
+        self.stop_event.set()
+        if self.process.pid is None:
+            return
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+class SoundLightSession(object):
+    """
+    Sound lighting from a child process, whose settings may change while
+    it runs without going dark: update sends the running analysis a new
+    SoundLightConfig, and the sound stream, child process and device
+    writer all stay open
+    The child outlives each run, paused in between, so running again
+    resumes it; close ends it
+    Settings are checked here before they are sent, and take_error gives
+    the newest error of the child, such as a device it could not open
+    """
+    def __init__(self, config=None, dll_path=None):
+        if config is None:
+            config = asl.make_config()
+        check_config(config)
+        self.config = config
+        self.dll_path = dll_path
+        self.analysis = None
+        self.active = False
+        self.device = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    def update(self, **changes):
+        """
+        change settings of the SoundLightConfig, applying them to the
+        running lighting if there is one, and return the new config
+        raises ValueError for a bad setting, leaving the config as it was
+        """
+        config = asl.make_config(self.config, **changes)
+        check_config(config)
+        with self.lock:
+            self.config = config
+            if self.active:
+                self.analysis.update(self.config)
+                self.device.stats.set_requested_rate(
+                    float(self.config.samplerate) / self.config.hop)
+            return self.config
+
+    def running(self):
+        """
+        whether the lighting is running
+        """
+        with self.lock:
+            return self.active
+
+    def take_error(self):
+        """
+        the newest error message of the analysis since the last call, or
+        None
+        the analysis keeps running after a setting it could not apply,
+        with the settings it had, and ends after any other error
+        """
+        with self.lock:
+            self._collect_error()
+            error, self.error = self.error, None
+            return error
+
+    def _collect_error(self):
+        """
+        keep the newest error of the analysis, with the lock held
+        """
+        if self.analysis is not None:
+            self.error = self.analysis.error() or self.error
+
+    def run(self, stop=None, do_print=False, fade_seconds=0.0):
+        """
+        write the sound lighting to the lights until Ctrl+C or the stop
+        token is set if given
+        fade_seconds fades in from the colors last set, instead of snapping
+        """
+        with self.lock:
+            analysis = self.analysis
+            if analysis is None or not analysis.process.is_alive():
+                self._collect_error()
+                analysis = AnalysisProcess(self.config).start()
+                self.analysis = analysis
+            else:
+                analysis.resume(self.config)
+            # frames from before the pause are stale
+            after = analysis.ring.written
+            self.active = True
+            self.device = la.get_session(self.dll_path)
+            self.device.stats.set_requested_rate(
+                float(analysis.samplerate) / analysis.hop)
+        writer = la.LatestValueWriter(self.device).start()
+        frames = cb.fade_frames(analysis.frames(stop, after),
+                                dict(self.device.requested), fade_seconds)
+
+        if do_print:
+            print "Starting, use Ctrl+C to stop"
+        try:
+            for frame in frames:
+                writer.commit_frame(frame)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            with self.lock:
+                self.active = False
+            analysis.pause()
+            writer.stop()
+            if do_print:
+                print "\nStopped, %d frames analyzed" % analysis.ring.written
+                error = self.take_error()
+                if error is not None:
+                    print "Sound analysis error, %s" % error
+
+    def close(self):
+        """
+        end the child process, once the lighting has stopped
+        """
+        with self.lock:
+            self._collect_error()
+            analysis, self.analysis = self.analysis, None
+        if analysis is not None:
+            analysis.stop()
+
+
+def process_soundlight(do_print=True, stop=None, fade_seconds=0.0):
+    """
+    asus_soundlighting.asus_soundlight with the analysis in a child
+    process, writing the frames to the lights from this one, until Ctrl+C
+    or the stop token is set if given
+    fade_seconds fades in from the colors last set, instead of snapping
+    """
+    session = SoundLightSession(dll_path=la.DPATH)
+    try:
+        session.run(stop, do_print, fade_seconds)
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    process_soundlight(do_print=True)
+    sys.exit(0)
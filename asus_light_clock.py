@@ -101,17 +101,69 @@ def pulsate_hour(colr, hrs, secs):
         ret = red + green + blue
     return ret
 
-if __name__ == '__main__':
+def numpy_int(values):
+    """
+    values as an int64 array
+    """
+    return np.asarray(values, dtype=np.int64)
 
-    LLI = li.ASUSLighting(li.DPATH, li.LEFT_VERTICAL)
-    RLI = li.ASUSLighting(li.DPATH, li.RIGHT_VERTICAL)
-    BLI = li.ASUSLighting(li.DPATH, li.BASE_HORIZONTAL)
-    CHRS, CMINS, CSECS = hrminsec_colors()
+def pulsate_hours(colrs, hrs, secs):
+    """
+    pulsate_hour for arrays of colors, hours and seconds
+    """
+    colrs = numpy_int(colrs)
+    hrs = numpy_int(hrs)
+    secs = numpy_int(secs)
+    pulse = np.in1d(secs % 30, OFF_SECS).reshape(np.shape(secs)) & \
+            ((hrs % 12) * 2 > secs % 30)
+    swapped = (colrs & 0xff) * 0x10000 + (colrs & 0xff0000) // 0x100 + \
+              (colrs & 0xff00) // 0x100
+    return np.where(pulse, swapped, colrs)
+
+def make_day_table(chrs=None, cmins=None, csecs=None):
+    """
+    (86400, 3) array of the (base, left, right) colors that
+    localtime_colors gives for each second of the day
+    """
+    if chrs is None:
+        chrs, cmins, csecs = hrminsec_colors()
+    day = np.arange(86400)
+    hrs = day // 3600
+    mins = day // 60 % 60
+    secs = day % 60
+    table = np.empty((86400, 3), dtype=np.uint32)
+    table[:, 0] = numpy_int(chrs)[hrs]
+    table[:, 1] = pulsate_hours(numpy_int(cmins)[mins], hrs, secs)
+    table[:, 2] = numpy_int(csecs)[secs]
+    return table
+
+def second_of_day(sltime):
+    """
+    index in the day table of a time.struct_time
+    """
+    return sltime[3] * 3600 + sltime[4] * 60 + min(sltime[5], 59)
 
+def run_clock(output, table=None):
+    """
+    show the clock on output, a light_acpi session or writer, forever
+    Sleeps until each second starts, and commits that second's colors
+    from the day table, so only zones whose color changed are written
+    """
+    if table is None:
+        table = make_day_table()
     while True:
-        CBASE, CLEFT, CRIGHT = localtime_colors(CHRS, CMINS, CSECS)
-        LLI.set_color(CLEFT)
-        RLI.set_color(CRIGHT)
-        BLI.set_color(CBASE)
-        time.sleep(0.25)
+        now = time.time()
+        cbase, cleft, cright = table[second_of_day(time.localtime(now))]
+        output.commit_frame({li.LEFT_VERTICAL: cleft,
+                             li.RIGHT_VERTICAL: cright,
+                             li.BASE_HORIZONTAL: cbase})
+        # the colors change with the wall clock second
+        next_second = int(now) + 1
+        while time.time() < next_second:
+            time.sleep(max(next_second - time.time(), 0.001))
+
+if __name__ == '__main__':
 
+    SESSION = li.get_session(li.DPATH)
+    SESSION.stats.set_requested_rate(1.0)
+    run_clock(SESSION)
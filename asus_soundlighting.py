@@ -17,46 +17,214 @@ This file's code structure owes greatly to the following project:
 
 """
 
-import pyaudio
+from collections import namedtuple
+import math
+
 import numpy
-import matplotlib.mlab
-import struct
 
 import light_acpi as lacpi
+import audio_capture as acap
+import color_tables as ctab
+import audio_devices as adev
+from audio_capture import pcm_frames
 
 MAX = 0
 SEGMENTS = 9
-CHUNK_EXPONENT = 15
+# the analysis window is 2**CHUNK_EXPONENT frames, 4096 or 93 ms, a few
+# hops long so the lights follow the sound closely; 15, a 0.74 s window,
+# smooths more but lags as much
+CHUNK_EXPONENT = 12
+CHANNELS = 2
 LIGHT_ROTATION_INTERVAL = 0
-DEVICE_NUMBER = 2
+DEVICE_NUMBER = adev.DEFAULT_DEVICE
+# milliseconds between analyses of overlapping windows, 0 to read
+# whole chunks with blocking reads instead
+HOP_MS = 25
+
+# the low and mid bass is contaminated by psd edge artifact, so use
+# portions of high bass instead, and the treble bands are tweaked for
+# better color changes during vocals
+# bands are (low, high] between consecutive edges in Hz, any number of
+# them, see make_band_edges, and are mixed down to the SEGMENTS levels
+BAND_EDGES = (100, 200, 300, 400, 640, 1280, 2560, 7000, 10240, 20480)
+BAND_LAYOUTS = ('classic', 'log', 'mel')
+# in stereo, the left channel lights the left, the right channel the right
+# and their mix the base, each in colors from its bass, mid and treble
+STEREO = False
+# flash the lights toward white on each beat found by BeatDetector
+BEATS = False
+# seconds for the levels to rise and fall, see EnvelopeFollower, 0 for
+# no smoothing
+ATTACK_SECONDS = 0.0
+RELEASE_SECONDS = 0.0
+
+def log_band_edges(nbands, low=100.0, high=20480.0):
+    """
+    edges of nbands bands of equal width in octaves
+    """
+    edges = numpy.logspace(numpy.log10(low), numpy.log10(high), nbands + 1)
+    edges[0], edges[-1] = low, high
+    return tuple(edges)
 
-def list_devices(do_print=True):
+def mel_band_edges(nbands, low=100.0, high=20480.0):
+    """
+    edges of nbands bands of equal width in mels, closer to pitch as heard
+    """
+    mels = numpy.linspace(2595.0 * numpy.log10(1.0 + low / 700.0),
+                          2595.0 * numpy.log10(1.0 + high / 700.0),
+                          nbands + 1)
+    edges = 700.0 * (10.0 ** (mels / 2595.0) - 1.0)
+    edges[0], edges[-1] = low, high
+    return tuple(edges)
+
+def make_band_edges(layout='classic', nbands=SEGMENTS, low=100.0, #pylint: disable-msg=R0913
+                    high=20480.0, samplerate=None):
+    """
+    band edges for a layout of BAND_LAYOUTS, or for a layout given as a
+    sequence of edges, those edges
+    classic is BAND_EDGES, which always has 9 bands
+    With a samplerate, log and mel bands end at its Nyquist frequency if
+    that is below high, and other edges must start below it; bands above
+    it are 0
+    """
+    nyquist = None if samplerate is None else samplerate / 2.0
+    if not isinstance(layout, basestring):
+        edges = tuple(float(edge) for edge in layout)
+        if len(edges) < 2 or list(edges) != sorted(edges):
+            raise ValueError("band edges must be at least 2 rising values")
+        check_band_edges(edges, samplerate)
+        return edges
+    if nyquist is not None:
+        high = min(high, nyquist)
+        if low >= high:
+            raise ValueError("bands from %g Hz are all above the Nyquist "
+                             "frequency, %g Hz" % (low, nyquist))
+    if layout == 'classic':
+        check_band_edges(BAND_EDGES, samplerate)
+        return BAND_EDGES
+    if layout == 'log':
+        return log_band_edges(nbands, low, high)
+    if layout == 'mel':
+        return mel_band_edges(nbands, low, high)
+    raise ValueError("unknown band layout %r, not one of %s" %
+                     (layout, ', '.join(BAND_LAYOUTS)))
+
+# the settings of a running sound lighting session, which may change
+# while it runs, see make_config; window and hop are in sound frames
+SoundLightConfig = namedtuple('SoundLightConfig', [
+    'device', 'samplerate', 'window', 'hop', 'rotation_interval', 'stereo',
+    'band_layout', 'nbands', 'beats', 'attack', 'release'])
+def parse_bool(value):
+    """
+    a bool setting of a bool, 0 or 1, or a string of true or false, yes
+    or no, on or off, or 1 or 0, in any case
+    raises ValueError for anything else, as bool('False') would be True
+    """
+    if isinstance(value, basestring):
+        word = value.strip().lower()
+        if word in ('true', 'yes', 'on', '1'):
+            return True
+        if word in ('false', 'no', 'off', '0'):
+            return False
+    elif value in (True, False):
+        return bool(value)
+    raise ValueError("%r is not a true or false setting" % (value,))
+
+CONFIG_TYPES = SoundLightConfig(int, int, int, int, int, parse_bool, str,
+                                int, parse_bool, float, float)
+
+def make_config(config=None, **changes):
+    """
+    SoundLightConfig of config, or of the module settings if None, with
+    changes, each converted to its CONFIG_TYPES type
+    raises ValueError for an unknown setting, a value that does not
+    convert or is out of range, or bands all above the Nyquist frequency
+    """
+    if config is None:
+        samplerate = 44100
+        config = SoundLightConfig(
+            DEVICE_NUMBER, samplerate, 2**CHUNK_EXPONENT,
+            int(samplerate * (HOP_MS or 25) / 1000.0),
+            LIGHT_ROTATION_INTERVAL, STEREO, 'classic', SEGMENTS, BEATS,
+            ATTACK_SECONDS, RELEASE_SECONDS)
+    unknown = set(changes) - set(SoundLightConfig._fields)
+    if unknown:
+        raise ValueError("unknown sound lighting settings: %s" %
+                         ', '.join(sorted(unknown)))
+    converted = {}
+    for name, value in changes.items():
+        try:
+            converted[name] = getattr(CONFIG_TYPES, name)(value)
+        except (TypeError, ValueError):
+            raise ValueError("bad sound lighting setting %s=%r" %
+                             (name, value))
+    config = config._replace(**converted)
+    if min(config.samplerate, config.window, config.hop, config.nbands) < 1:
+        raise ValueError("samplerate, window, hop and nbands must be "
+                         "positive")
+    if min(config.rotation_interval, config.attack, config.release) < 0:
+        raise ValueError("rotation_interval, attack and release must not "
+                         "be negative")
+    # the band edges must start below the Nyquist frequency
+    config_band_edges(config)
+    return config
+
+def config_band_edges(config):
+    """
+    the band edges of a SoundLightConfig, log and mel bands ending at its
+    Nyquist frequency if that is lower
+    """
+    return make_band_edges(config.band_layout, config.nbands,
+                           samplerate=config.samplerate)
+
+def check_band_edges(edges, samplerate=None):
+    """
+    raise ValueError unless the band edges start below the Nyquist
+    frequency of samplerate, if given, so at least one band has sound
+    """
+    if samplerate is not None and edges[0] >= samplerate / 2.0:
+        raise ValueError("band edges from %g Hz are all above the Nyquist "
+                         "frequency, %g Hz" % (edges[0], samplerate / 2.0))
+
+def band_mixer(nbands, nlevels=SEGMENTS):
+    """
+    (nlevels, nbands) matrix summing bands into levels, each level
+    taking the next nbands / nlevels bands, with a band on the boundary
+    of two levels split between them in proportion
+    For nlevels equal to nbands it is the identity
+    """
+    bounds = numpy.arange(nlevels + 1) * float(nbands) / nlevels
+    bands = numpy.arange(nbands)
+    low = numpy.maximum(bounds[:-1, numpy.newaxis], bands)
+    high = numpy.minimum(bounds[1:, numpy.newaxis], bands + 1)
+    return numpy.maximum(high - low, 0.0)
+
+def list_devices(do_print=True, refresh=False):
     """
     List all audio input devices
+    the list is cached by audio_devices, refresh enumerates them again
     """
-    paud = pyaudio.PyAudio()
+    ndev, names = adev.input_devices(refresh)
     text = "Audio Device Options:\n"
     devs = {}
-    i = 0
-    ndev = paud.get_device_count()
-    while i < ndev:
-        dev = paud.get_device_info_by_index(i)
-        if dev['maxInputChannels'] > 0:
-            dev_line = str(i) + '. ' + dev['name']
-            devs[i] = dev_line
-            text = text + dev_line + "\n"
-        i += 1
+    for i in sorted(names):
+        dev_line = str(i) + '. ' + names[i]
+        devs[i] = dev_line
+        text = text + dev_line + "\n"
     if do_print:
         print text
     return ndev, devs
 
-def asus_soundlight(do_print=True):
+def asus_soundlight(do_print=True, stop=None):
     """
-    Get sound samples and adjust LED light color accordingly
+    Get sound samples and adjust LED light color accordingly, until
+    Ctrl+C or the stop token is set if given
     """
-    # Change chunk if too fast/slow, never less than 2**13
+    # Change chunk if too fast/slow, never less than 2**11, the nfft
+    # it is the analysis window, the lights change every hop
     chunk = 2**CHUNK_EXPONENT
     samplerate = 44100
+    hop = int(samplerate * HOP_MS / 1000.0)
 
     # CHANGE THIS TO CORRECT INPUT DEVICE
     # Look at recording devices and right click to show hidden devices,
@@ -66,62 +234,208 @@ def asus_soundlight(do_print=True):
     # and choose the mixed device as input device below
     device = DEVICE_NUMBER
 
-    paud = pyaudio.PyAudio()
-    stream = paud.open(format=pyaudio.paInt16,
-                       channels=2,
-                       rate=samplerate,
-                       input=True,
-                       frames_per_buffer=chunk,
-                       input_device_index=device)
+    capture = acap.open_capture(device, samplerate, CHANNELS, chunk, hop)
+
+    # the writer thread keeps the slow device calls out of this loop
+    session = lacpi.get_session(lacpi.DPATH)
+    session.stats.set_requested_rate(float(samplerate) / capture.hop)
+    writer = lacpi.LatestValueWriter(session)
+    writer.start()
 
     if do_print:
         print "Starting, use Ctrl+C to stop"
     try:
-        l_lighting = lacpi.ASUSLighting(lacpi.DPATH, lacpi.LEFT_VERTICAL)
-        r_lighting = lacpi.ASUSLighting(lacpi.DPATH, lacpi.RIGHT_VERTICAL)
-        b_lighting = lacpi.ASUSLighting(lacpi.DPATH, lacpi.BASE_HORIZONTAL)
-
-        do_rotate_interval = LIGHT_ROTATION_INTERVAL
-        rotate_state = 0
-
-        while True:
-            try:
-                data = stream.read(chunk)
-            except IOError:
-                pass
-            # Do FFT
-            levels = get_cutouts(data, samplerate)
-
-            # Make all levels to be <= 255
-            l_max = max(levels)
-            for idx in range(0, SEGMENTS):
-                levels[idx] = int(round(levels[idx] * 255.0 / l_max))
-
-            saturate_color(levels)
-
-            if do_rotate_interval == 1:
-                rotate_state += 1
-                rotate_state %= 3
-                do_rotate_interval = LIGHT_ROTATION_INTERVAL
-
-            if do_rotate_interval > 0:
-                do_rotate_interval -= 1
-                rotate_levels(levels, rotate_state)
-
-            # set ASUS G20aj lighting colors
-            b_lighting.set_rgb(levels[0], levels[1], levels[2])
-            r_lighting.set_rgb(levels[3], levels[4], levels[5])
-            l_lighting.set_rgb(levels[6], levels[7], levels[8])
-
+        for frame in sound_frames(capture.windows(stop=stop), samplerate,
+                                  hop=capture.hop):
+            # set ASUS G20aj lighting colors, unchanged zones are skipped
+            writer.commit_frame(frame)
 
     except KeyboardInterrupt:
         pass
 
     finally:
         if do_print:
-            print "\nStopping"
-        stream.close()
-        paud.terminate()
+            print "\nStopping, %d overruns, %d hops skipped" % \
+                (capture.overruns, capture.skipped)
+        writer.stop()
+        capture.close()
+
+class SoundFrameMaker(object):
+    """
+    Makes lighting frames, dicts of light position to color, from sound
+    data chunks or (frames, channels) arrays one at a time, rotating the
+    colors around the lights every rotation_interval frames if it is not 0
+    With stereo, each light follows its own channel, see stereo_levels
+    band_edges defaults to BAND_EDGES
+    With beats, the lights flash on each beat, and last_beat is the Beat
+    found in the latest chunk, or None. Chunks are taken to start hop
+    frames apart, or if hop is None, one after the other, and the beats
+    are found in the newest beat_window(hop) frames of each, whatever
+    its length
+    The levels are smoothed by an EnvelopeFollower with attack and release
+    seconds, if either is not 0
+    """
+    def __init__(self, samplerate, rotation_interval=None, stereo=None, #pylint: disable-msg=R0913
+                 band_edges=None, beats=None, hop=None, attack=None,
+                 release=None):
+        if rotation_interval is None:
+            rotation_interval = LIGHT_ROTATION_INTERVAL
+        if stereo is None:
+            stereo = STEREO
+        if beats is None:
+            beats = BEATS
+        if attack is None:
+            attack = ATTACK_SECONDS
+        if release is None:
+            release = RELEASE_SECONDS
+        self.samplerate = samplerate
+        self.stereo = stereo
+        self.analyzer = get_analyzer(samplerate, band_edges=band_edges)
+        self.rotation_interval = rotation_interval
+        self.do_rotate_interval = rotation_interval
+        self.rotate_state = 0
+        self.beats = beats
+        self.hop = hop
+        self.detector = None
+        self.beat_analyzer = None
+        self.last_beat = None
+        self.flash = 0.0
+        self.attack = attack
+        self.release = release
+        self.envelope = None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        a frame maker for a SoundLightConfig
+        """
+        return cls(config.samplerate, config.rotation_interval,
+                   config.stereo, config_band_edges(config), config.beats,
+                   config.hop, config.attack, config.release)
+
+    def configure(self, **settings):
+        """
+        change constructor settings other than samplerate between frames,
+        rebuilding only the stages they affect
+        the smoothed levels carry over new smoothing or hop times, and the
+        beat tempo is found again after a new hop or band edges
+        """
+        unknown = set(settings) - set(['rotation_interval', 'stereo',
+                                       'band_edges', 'beats', 'hop',
+                                       'attack', 'release'])
+        if unknown:
+            raise ValueError("cannot configure %s" %
+                             ', '.join(sorted(unknown)))
+        if 'rotation_interval' in settings:
+            self.rotation_interval = settings['rotation_interval']
+            self.do_rotate_interval = self.rotation_interval
+        if 'band_edges' in settings:
+            self.analyzer = get_analyzer(self.samplerate,
+                                         band_edges=settings['band_edges'])
+            self.detector = None
+        if 'beats' in settings:
+            self.beats = settings['beats']
+            if not self.beats:
+                self.detector = None
+                self.last_beat = None
+                self.flash = 0.0
+        if 'hop' in settings:
+            self.hop = settings['hop']
+            self.detector = None
+        if 'stereo' in settings and settings['stereo'] != self.stereo:
+            self.stereo = settings['stereo']
+            # the levels change shape between mono and stereo
+            self.envelope = None
+        self.attack = settings.get('attack', self.attack)
+        self.release = settings.get('release', self.release)
+        if not self.smoothing():
+            self.envelope = None
+        elif self.envelope is not None:
+            hop_seconds = self.hop_seconds() if self.hop else \
+                          self.envelope.hop_seconds
+            self.envelope.retime(hop_seconds, self.attack, self.release)
+
+    def hop_seconds(self, data=None):
+        """
+        seconds between chunks, of data's length if hop is None
+        """
+        return float(self.hop or len(data)) / self.samplerate
+
+    def make_frame(self, data):
+        """
+        the lighting frame for a chunk of sound
+        """
+        if self.do_rotate_interval == 1:
+            self.rotate_state += 1
+            self.rotate_state %= 3
+            self.do_rotate_interval = self.rotation_interval
+
+        if self.do_rotate_interval > 0:
+            self.do_rotate_interval -= 1
+            rtype = self.rotate_state
+        else:
+            rtype = 0
+
+        # Do FFT, then equalize, scale, saturate and rotate in one stage
+        if not isinstance(data, numpy.ndarray):
+            data = pcm_frames(data, CHANNELS)
+        if self.stereo:
+            bands = stereo_band_levels(data, analyzer=self.analyzer)
+            levels = self.analyzer.mix(bands, 3).ravel()
+        else:
+            bands = band_levels(data, analyzer=self.analyzer)
+            levels = self.analyzer.mix(bands)
+        if self.envelope is None and self.smoothing():
+            self.envelope = EnvelopeFollower(self.hop_seconds(data),
+                                             self.attack, self.release)
+        levels = shape_levels(levels, rtype, envelope=self.envelope)
+        base, right, left = levels_to_colors(levels)
+
+        if self.beats:
+            base, right, left = self.flash_beats(data, (base, right, left))
+
+        return {lacpi.BASE_HORIZONTAL: base,
+                lacpi.RIGHT_VERTICAL: right,
+                lacpi.LEFT_VERTICAL: left}
+
+    def smoothing(self):
+        """
+        whether the levels are smoothed
+        """
+        return bool(numpy.any(numpy.asarray(self.attack) > 0) or
+                    numpy.any(numpy.asarray(self.release) > 0))
+
+    def flash_beats(self, data, colors):
+        """
+        colors flashed toward white on a beat of the mono band levels of
+        the newest sound, the flash fading over FLASH_SECONDS
+        """
+        hop = self.hop or len(data)
+        if self.detector is None:
+            self.detector = BeatDetector(float(hop) / self.samplerate)
+            self.beat_analyzer = get_analyzer(self.samplerate,
+                                              beat_window(hop),
+                                              self.analyzer.band_edges)
+        # only the newest sound, as an onset is smeared over a long window,
+        # and not normalized, so the levels follow the loudness
+        mono = data[-self.beat_analyzer.nfft:].mean(axis=1)
+        self.last_beat = self.detector.update(
+            self.beat_analyzer.band_levels(mono))
+        if self.last_beat is not None:
+            self.flash = min(1.0, self.last_beat.strength / 2.0)
+        colors = flash_colors(colors, self.flash)
+        self.flash *= math.exp(-float(hop) / (self.samplerate * FLASH_SECONDS))
+        return colors
+
+def sound_frames(chunks, samplerate, **settings):
+    """
+    generate lighting frames, dicts of light position to color,
+    from an iterable of sound data chunks or (frames, channels) arrays
+    settings are SoundFrameMaker keyword arguments
+    """
+    maker = SoundFrameMaker(samplerate, **settings)
+    for data in chunks:
+        yield maker.make_frame(data)
 
 def rotate_levels(seq, rtype):
     """
@@ -151,12 +465,13 @@ def sat_trip(cred, cgreen, cblue):
 
 def saturate_color(col):
     """
-    saturate the colrs representing sound levels
+    saturate the colrs representing sound levels, in red, green, blue
+    triples, when there are a multiple of 3
     """
-    if len(col) == 9:
-        col[0], col[1], col[2] = sat_trip(col[0], col[1], col[2])
-        col[3], col[4], col[5] = sat_trip(col[3], col[4], col[5])
-        col[6], col[7], col[8] = sat_trip(col[6], col[7], col[8])
+    if len(col) % 3 == 0:
+        for idx in range(0, len(col), 3):
+            col[idx], col[idx + 1], col[idx + 2] = \
+                sat_trip(col[idx], col[idx + 1], col[idx + 2])
     return col
 
 def equalize(levels, within_factor=3.0):
@@ -180,7 +495,416 @@ def equalize(levels, within_factor=3.0):
     return new_levels
 
 
-def get_cutouts(chunkdata, srate, nfft=2048): #pylint: disable-msg=R0914
+# level orders of rotate_levels rtype 0, 1 and 2
+ROTATIONS = numpy.array([[0, 1, 2, 3, 4, 5, 6, 7, 8],
+                         [6, 7, 8, 0, 1, 2, 3, 4, 5],
+                         [3, 4, 5, 6, 7, 8, 0, 1, 2]])
+
+def equalize_levels(levels, within_factor=3.0, max_loops=100):
+    """
+    equalize for an array of levels, or a (frames, levels) batch of them
+    Gives the same result as equalize, with the number of doublings of
+    each level found in closed form, and the same limit of max_loops
+    doublings in total for each frame
+    """
+    levs = numpy.maximum(numpy.abs(numpy.asarray(levels, dtype=float)),
+                         0.0001)
+    least_allowed = levs.max(axis=-1)[..., numpy.newaxis] / within_factor
+    with numpy.errstate(divide='ignore'):
+        doublings = numpy.ceil(numpy.log2(least_allowed / levs))
+    doublings = numpy.maximum(doublings, 0).astype(int)
+    # the log can be off by one, so check against the exact doubling
+    doublings -= (doublings > 0) & \
+                 (numpy.ldexp(levs, doublings - 1) >= least_allowed)
+    doublings += numpy.ldexp(levs, doublings) < least_allowed
+    # equalize stops after max_loops doublings, counting from the first
+    total = numpy.cumsum(doublings, axis=-1)
+    doublings = numpy.minimum(total, max_loops) - \
+                numpy.minimum(total - doublings, max_loops)
+    return numpy.ldexp(levs, doublings)
+
+def shape_levels(levels, rtype=0, within_factor=3.0, envelope=None):
+    """
+    equalize, scale to at most 255, saturate and rotate sound levels,
+    as int arrays, giving the same results as equalize, scaling each
+    level by 255 / max, saturate_color and rotate_levels in turn
+    levels may be a (frames, levels) batch, and rtype then a scalar or
+    one rotation for each frame
+    Any multiple of 3 levels is saturated, only SEGMENTS are rotated
+    With an EnvelopeFollower, the equalized levels are smoothed by it
+    before they are scaled, one frame at a time
+    """
+    levs = equalize_levels(levels, within_factor)
+    l_max = levs.max(axis=-1)[..., numpy.newaxis]
+    if envelope is None:
+        levs = ctab.round_half_up(levs * 255.0 / l_max)
+    else:
+        # smooth the levels relative to the largest, which are steady
+        # however the chunk normalizing moves the absolute levels
+        levs = ctab.round_half_up(envelope.update(levs / l_max) * 255.0)
+    if levs.shape[-1] % 3 == 0:
+        # sat_trip on each red, green, blue triple, by table lookup
+        levs = ctab.saturate_levels(levs)
+    if levs.shape[-1] == SEGMENTS:
+        rtype = numpy.asarray(rtype)
+        if rtype.ndim == 0:
+            levs = levs[..., ROTATIONS[rtype]]
+        else:
+            rows = numpy.arange(len(levs))[:, numpy.newaxis]
+            levs = levs[rows, ROTATIONS[rtype]]
+    return levs.astype(int)
+
+def levels_to_colors(levels):
+    """
+    pack shaped levels in groups of 3 as 0x00rrggbb colors, in the order
+    base, right, left for 9 levels
+    """
+    trips = numpy.asarray(levels).reshape(numpy.shape(levels)[:-1] + (-1, 3))
+    trips = trips & 255
+    return trips[..., 0] * 0x10000 + trips[..., 1] * 0x100 + trips[..., 2]
+
+class EnvelopeFollower(object):
+    """
+    One-pole attack and release smoothing of all the levels at once
+    A level rises toward a higher input with a time constant of attack
+    seconds and falls toward a lower one with release seconds, each a
+    number for all levels or a sequence of one per level, and 0 to
+    follow at once. Updates come every hop_seconds
+    """
+    def __init__(self, hop_seconds, attack=0.01, release=0.2):
+        self.hop_seconds = hop_seconds
+        self.attack_coef = self.coefficient(attack)
+        self.release_coef = self.coefficient(release)
+        self.value = None
+
+    def retime(self, hop_seconds, attack, release):
+        """
+        change the hop and smoothing times, keeping the smoothed levels
+        """
+        self.hop_seconds = hop_seconds
+        self.attack_coef = self.coefficient(attack)
+        self.release_coef = self.coefficient(release)
+
+    def coefficient(self, seconds):
+        """
+        the share of the gap to the input closed each hop
+        """
+        seconds = numpy.asarray(seconds, dtype=float)
+        with numpy.errstate(divide='ignore'):
+            return -numpy.expm1(-self.hop_seconds / seconds)
+
+    def reset(self):
+        """
+        forget the state, so the next input is followed at once
+        """
+        self.value = None
+
+    def update(self, levels):
+        """
+        the smoothed levels after taking the next levels, as a new array
+        """
+        levels = numpy.asarray(levels, dtype=float)
+        if self.value is None:
+            self.value = levels.copy()
+        else:
+            coef = numpy.where(levels > self.value, self.attack_coef,
+                               self.release_coef)
+            self.value += coef * (levels - self.value)
+        return self.value.copy()
+
+
+def flash_colors(colors, amount):
+    """
+    colors moved amount of the way to white, as ints
+    """
+    if amount <= 0:
+        return colors
+    amount = min(amount, 1.0)
+    flashed = []
+    for color in colors:
+        red, green, blue = [int(round(chan + (255 - chan) * amount))
+                            for chan in ((color >> 16) & 255,
+                                         (color >> 8) & 255, color & 255)]
+        flashed.append(red * 0x10000 + green * 0x100 + blue)
+    return tuple(flashed)
+
+
+Beat = namedtuple('Beat', 'time strength bpm')
+FLASH_SECONDS = 0.15
+# most frames of the newest sound beats are found in, about 46 ms at 44.1 kHz
+BEAT_WINDOW = 2048
+
+def beat_window(hop):
+    """
+    frames of sound the beats are found in each hop: the hop rounded up
+    to a power of 2, at most BEAT_WINDOW
+    """
+    window = 1
+    while window < min(hop, BEAT_WINDOW):
+        window *= 2
+    return window
+
+class BeatDetector(object): #pylint: disable-msg=R0902
+    """
+    Incremental onset and beat detection on band levels, one hop at a time
+    The onset strength is the spectral flux, the mean rise of the log band
+    levels since the last hop. A hop whose flux is above an adaptive
+    threshold, the running mean of the flux plus sensitivity times its
+    running deviation over about memory seconds, and at least
+    min_interval after the last beat, is a beat. The tempo follows the
+    intervals between beats that are close to a whole number of beat
+    periods, within tempo_range beats a minute, and after 4 beats in a
+    row that are not, the tempo starts again from the latest interval
+    Each hop costs O(bands), whatever memory is
+    """
+    def __init__(self, hop_seconds, sensitivity=2.0, memory=2.0, #pylint: disable-msg=R0913
+                 min_interval=0.25, tempo_range=(60.0, 200.0)):
+        self.hop_seconds = hop_seconds
+        self.sensitivity = sensitivity
+        self.alpha = 1.0 - math.exp(-hop_seconds / memory)
+        self.min_interval = min_interval
+        self.min_period = 60.0 / tempo_range[1]
+        self.max_period = 60.0 / tempo_range[0]
+        self.time = 0.0
+        self.prev = None
+        self.level = None
+        self.mean = 0.0
+        self.var = 0.0
+        self.last_beat = None
+        self.period = None
+        self.misses = 0
+
+    def bpm(self):
+        """
+        the tracked tempo in beats a minute, or None until it is found
+        """
+        if self.period is None:
+            return None
+        return 60.0 / self.period
+
+    def update(self, levels):
+        """
+        take the band levels of the next hop, returning a Beat if the hop
+        starts one, else None
+        """
+        self.time += self.hop_seconds
+        levels = numpy.asarray(levels, dtype=float)
+        total = levels.sum()
+        # a floor following the loudness keeps quiet noise from counting
+        if self.level is None:
+            self.level = total
+        self.level += self.alpha * (total - self.level)
+        logs = numpy.log(levels + 1e-3 * self.level / len(levels) + 1e-300)
+        prev, self.prev = self.prev, logs
+        if prev is None:
+            return None
+        flux = numpy.maximum(logs - prev, 0.0).mean()
+
+        threshold = self.mean + self.sensitivity * math.sqrt(self.var)
+        beat = None
+        if flux > threshold and (self.last_beat is None or self.time -
+                                 self.last_beat >= self.min_interval):
+            self.track_tempo(self.time)
+            strength = (flux - self.mean) / (math.sqrt(self.var) or 1.0)
+            beat = Beat(self.time, strength, self.bpm())
+
+        delta = flux - self.mean
+        self.mean += self.alpha * delta
+        self.var = (1.0 - self.alpha) * (self.var + self.alpha * delta ** 2)
+        return beat
+
+    def track_tempo(self, now):
+        """
+        update the beat period with a beat at now
+        """
+        if self.last_beat is not None:
+            interval = now - self.last_beat
+            beats = 0
+            if self.period is not None:
+                beats = int(round(interval / self.period))
+            if beats >= 1 and \
+                    abs(interval / beats - self.period) < 0.1 * self.period:
+                self.misses = 0
+                self.period += 0.25 * (interval / beats - self.period)
+                self.period = min(max(self.period, self.min_period),
+                                  self.max_period)
+            elif self.period is None or self.misses >= 3:
+                if self.min_period <= interval <= self.max_period:
+                    self.period = interval
+                    self.misses = 0
+            else:
+                self.misses += 1
+        self.last_beat = now
+
+
+class SpectrumAnalyzer(object):
+    """
+    Summed power spectral density of sound samples in frequency bands
+    Gives the same band sums as matplotlib.mlab.psd with its defaults
+    (Hanning window, no overlap, one-sided density), but the window, the
+    scaling and the band bin ranges are computed once for a samplerate
+    and nfft, so each chunk costs one rFFT and one segmented sum
+    Bands are (low, high] between consecutive band_edges in Hz, compiled
+    to bin offsets once, so the cost of a chunk does not grow with the
+    number of bands; bands above the Nyquist frequency are 0, as they
+    were from mlab.psd
+    """
+    def __init__(self, samplerate, nfft=2048, band_edges=BAND_EDGES):
+        self.samplerate = samplerate
+        self.nfft = nfft
+        self.band_edges = tuple(band_edges)
+        self.window = numpy.hanning(nfft)
+        freqs = numpy.arange(nfft // 2 + 1) * float(samplerate) / nfft
+        # density scaling, doubled for the one-sided spectrum
+        # except at DC and, for an even nfft, at the Nyquist frequency
+        scale = numpy.empty(len(freqs))
+        scale.fill(2.0 / (samplerate * (self.window ** 2).sum()))
+        scale[0] /= 2.0
+        if nfft % 2 == 0:
+            scale[-1] /= 2.0
+        check_band_edges(self.band_edges, samplerate)
+        edges = numpy.asarray(band_edges, dtype=float)
+        starts = numpy.searchsorted(freqs, edges[:-1], side='right')
+        ends = numpy.searchsorted(freqs, edges[1:], side='right')
+        self.first = int(starts[0])
+        self.last = int(ends[-1])
+        self.offsets = numpy.minimum(starts, ends) - self.first
+        self.empty = starts >= ends
+        # bands starting at or above the Nyquist frequency have no bins,
+        # and reduceat only takes offsets inside the spectrum
+        self.summed = int(numpy.count_nonzero(
+            self.offsets < self.last - self.first))
+        self.scale = scale[self.first:self.last]
+        self.mixers = {}
+
+    def spectrum(self, samples):
+        """
+        windowed rFFT of the nfft sample segments of a signal, or of the
+        last axis of an array of signals, as a (..., segments, bins)
+        array of only the bins in the bands
+        """
+        samples = numpy.asarray(samples, dtype=float)
+        if samples.shape[-1] < self.nfft:
+            padded = numpy.zeros(samples.shape[:-1] + (self.nfft,))
+            padded[..., :samples.shape[-1]] = samples
+            samples = padded
+        nseg = samples.shape[-1] // self.nfft
+        shape = samples.shape[:-1] + (nseg,)
+        # one batch of segments for the rFFT, which is slower in 3-D
+        segments = samples[..., :nseg * self.nfft].reshape(-1, self.nfft)
+        spec = numpy.fft.rfft(segments * self.window, axis=-1)
+        return spec[:, self.first:self.last].reshape(shape + (-1,))
+
+    def band_power(self, spec):
+        """
+        summed power density in each band of a spectrum, averaged over
+        its segments
+        """
+        power = (spec.real ** 2 + spec.imag ** 2).mean(axis=-2) * self.scale
+        levels = numpy.zeros(power.shape[:-1] + (len(self.offsets),))
+        if self.summed > 0:
+            levels[..., :self.summed] = numpy.add.reduceat(
+                power, self.offsets[:self.summed], axis=-1)
+        levels[..., self.empty] = 0.0
+        return levels
+
+    def band_levels(self, samples):
+        """
+        array of the summed power density in each band of a 1-D signal,
+        or (signals, bands) for a 2-D array of signals
+        """
+        return self.band_power(self.spectrum(samples))
+
+    def mix(self, levels, nlevels=SEGMENTS):
+        """
+        band levels, or a (..., bands) array of them, summed into nlevels
+        levels by band_mixer, unchanged if there are nlevels bands
+        """
+        nbands = len(self.offsets)
+        if nbands == nlevels:
+            return levels
+        mixer = self.mixers.get(nlevels)
+        if mixer is None:
+            mixer = self.mixers[nlevels] = band_mixer(nbands, nlevels).T
+        return numpy.dot(levels, mixer)
+
+
+_ANALYZERS = {}
+
+def get_analyzer(srate, nfft=2048, band_edges=None):
+    """
+    get the spectrum analyzer for a samplerate, nfft and band edges,
+    which default to BAND_EDGES, made once
+    """
+    if band_edges is None:
+        band_edges = BAND_EDGES
+    key = (srate, nfft, tuple(band_edges))
+    analyzer = _ANALYZERS.get(key)
+    if analyzer is None:
+        analyzer = SpectrumAnalyzer(srate, nfft, band_edges)
+        _ANALYZERS[key] = analyzer
+    return analyzer
+
+def normalize_signals(signals):
+    """
+    signals, or the last axis of an array of them, divided by their sums
+    with the integer division of the original get_cutouts, which keeps
+    the band levels on the scale the 0.0001 floor of equalize is for
+    a signal summing to 0 is left as it is
+    """
+    signals = numpy.asarray(signals)
+    sums = signals.sum(axis=-1)[..., numpy.newaxis]
+    return numpy.floor_divide(signals, numpy.where(sums != 0, sums, 1))
+
+def band_levels(chunkdata, srate=44100, nfft=2048, analyzer=None):
+    """
+    the band sums of get_cutouts before they are equalized, as an array
+    analyzer, if given, sets the samplerate, nfft and bands instead
+    """
+    # View raw sound data as signed stereo frames, and analyze their mix
+    if not isinstance(chunkdata, numpy.ndarray):
+        chunkdata = pcm_frames(chunkdata, CHANNELS)
+    np_chunk = chunkdata.sum(axis=1)
+
+    # normalize epoch and then psd
+    norm_chunk = normalize_signals(np_chunk)
+    if analyzer is None:
+        analyzer = get_analyzer(srate, nfft)
+    return analyzer.band_levels(norm_chunk)
+
+def stereo_band_levels(chunkdata, srate=44100, nfft=2048, analyzer=None):
+    """
+    (3, bands) array of the band sums of the mid, right and left signals
+    of stereo sound, each normalized by its sum as in band_levels, so
+    the mid levels are those of band_levels
+    The three signals go through one 2-D rFFT; the integer division of
+    the normalizing is not linear, so the mid spectrum is not the sum of
+    the channel spectra
+    analyzer, if given, sets the samplerate, nfft and bands instead
+    """
+    if not isinstance(chunkdata, numpy.ndarray):
+        chunkdata = pcm_frames(chunkdata, CHANNELS)
+    chans = chunkdata.T[:2]
+    if len(chans) == 1:
+        chans = chans.repeat(2, axis=0)
+    # as for mono, the mid signal is the mix of the channels
+    signals = numpy.array([chans.sum(axis=0), chans[1], chans[0]])
+    if analyzer is None:
+        analyzer = get_analyzer(srate, nfft)
+    return analyzer.band_power(analyzer.spectrum(normalize_signals(signals)))
+
+def stereo_levels(chunkdata, srate=44100, nfft=2048, analyzer=None):
+    """
+    the 9 levels of stereo sound for shape_levels: for the base, right
+    and left lights in turn, the summed bass, mid and treble bands of the
+    mid, right and left signals, as red, green and blue
+    """
+    if analyzer is None:
+        analyzer = get_analyzer(srate, nfft)
+    levels = stereo_band_levels(chunkdata, analyzer=analyzer)
+    return analyzer.mix(levels, 3).ravel()
+
+def get_cutouts(chunkdata, srate, nfft=2048):
     """
     get a summed amplitude of power spectrum between low_cut and high-cut
     normalize this, then get amplitudes of specific frequency ranges
@@ -195,37 +919,12 @@ def get_cutouts(chunkdata, srate, nfft=2048): #pylint: disable-msg=R0914
     2560 Hz - 5120 Hz = Low Treble
     5120 Hz - 10240 Hz = Mid treble
     10240 Hz- 20480 Hz = High Treble
-    """
-    # Convert raw sound data to Numpy array
-    fmt = "%dH"%(len(chunkdata)/2)
-    unpackdata = struct.unpack(fmt, chunkdata)
-    np_chunk = numpy.array(unpackdata, dtype='h')
 
-    # normalize epoch and then psd
-    sum_chunk = np_chunk.sum()
-    if sum_chunk != 0:
-        norm_chunk = np_chunk / sum_chunk
-    else:
-        norm_chunk = np_chunk
-    pxx, freqs = matplotlib.mlab.psd(norm_chunk, NFFT=nfft, Fs=srate)
-    # the low and mid bass is contaminated by psd edge artifact, so use
-    # portions of high bass instead.
-    lowbass = pxx[numpy.logical_and(freqs <= 200, freqs > 100)]
-    midbass = pxx[numpy.logical_and(freqs <= 300, freqs > 200)]
-    higbass = pxx[numpy.logical_and(freqs <= 400, freqs > 300)]
-    lowmidr = pxx[numpy.logical_and(freqs <= 640, freqs > 400)]
-    midmidr = pxx[numpy.logical_and(freqs <= 1280, freqs > 640)]
-    higmidr = pxx[numpy.logical_and(freqs <= 2560, freqs > 1280)]
-    # tweak to treble bands for better color changes during vocals
-    lowtreb = pxx[numpy.logical_and(freqs <= 7000, freqs > 2560)]
-    midtreb = pxx[numpy.logical_and(freqs <= 10240, freqs > 7000)]
-    higtreb = pxx[numpy.logical_and(freqs <= 20480, freqs > 10240)]
-
-    sound_levels = [sum(lowbass), sum(midbass), sum(higbass),
-                    sum(lowmidr), sum(midmidr), sum(higmidr),
-                    sum(lowtreb), sum(midtreb), sum(higtreb)]
-
-    return equalize(sound_levels)
+    (the bands actually used are those of BAND_EDGES)
+
+    chunkdata is raw PCM sound data, or a (frames, channels) array of it
+    """
+    return equalize(list(band_levels(chunkdata, srate, nfft)))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 code to capture sound for the ASUS G20 lighting effects
+
+Sound comes as (frames, channels) int16 windows of a fixed length, from
+either a blocking stream read of one window at a time, or a callback
+stream writing into a preallocated ring buffer, from which overlapping
+windows are taken every hop. With the callback stream the lighting
+update rate is set by the hop rather than by the window length.
+
+"""
+
+import threading
+
+import numpy
+
+# pyaudio is loaded when a capture is opened, analysis works without it
+import audio_devices as adev
+
+# seconds between checks of a stop token while waiting for sound
+STOP_POLL = 0.05
+
+
+def pcm_frames(chunkdata, channels=2):
+    """
+    view raw little-endian 16 bit PCM sound data as a (frames, channels)
+    int16 array, without copying it
+    a trailing partial frame is ignored
+    """
+    samples = numpy.frombuffer(chunkdata, dtype='<i2')
+    nframes = len(samples) // channels
+    return samples[:nframes * channels].reshape(nframes, channels)
+
+
+class RingBuffer(object):
+    """
+    Preallocated ring of (frames, channels) int16 sound
+    Frames are addressed by their absolute position in the stream, and
+    written counts all frames ever written
+    """
+    def __init__(self, capacity, channels=2):
+        self.capacity = capacity
+        self.channels = channels
+        self.data = numpy.zeros((capacity, channels), dtype='<i2')
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def write(self, frames):
+        """
+        append frames, overwriting the oldest ones
+        """
+        count = len(frames)
+        if count > self.capacity:
+            frames = frames[-self.capacity:]
+        nfr = len(frames)
+        with self.lock:
+            start = (self.written + count - nfr) % self.capacity
+            first = min(nfr, self.capacity - start)
+            self.data[start:start + first] = frames[:first]
+            self.data[:nfr - first] = frames[first:]
+            self.written += count
+
+    def read(self, end, count, out=None):
+        """
+        copy of the count frames before absolute position end
+        """
+        if out is None:
+            out = numpy.empty((count, self.channels), dtype='<i2')
+        with self.lock:
+            if end > self.written or end - count < self.written - self.capacity:
+                raise ValueError("frames %d to %d are not in the ring" %
+                                 (end - count, end))
+            start = (end - count) % self.capacity
+            first = min(count, self.capacity - start)
+            out[:first] = self.data[start:start + first]
+            out[first:] = self.data[:count - first]
+        return out
+
+
+class BlockingCapture(object):
+    """
+    Sound capture reading one whole window at a time from the stream
+    A failed read is counted in overruns and skipped
+    """
+    def __init__(self, device, samplerate=44100, channels=2, window=4096):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.window = window
+        self.hop = window
+        self.overruns = 0
+        self.skipped = 0
+        self.closed = False
+        pyaudio = adev.load_pyaudio()
+        self.paud = pyaudio.PyAudio()
+        self.stream = self.paud.open(format=pyaudio.paInt16,
+                                     channels=channels,
+                                     rate=samplerate,
+                                     input=True,
+                                     frames_per_buffer=window,
+                                     input_device_index=device)
+
+    def windows(self, stop=None):
+        """
+        generate (window, channels) arrays of sound, one per read, until
+        the stop token is set if given
+        a stop is noticed after the read in progress, at most a window
+        """
+        while not self.closed and not (stop is not None and stop.stopped()):
+            try:
+                data = self.stream.read(self.window)
+            except IOError:
+                self.overruns += 1
+                continue
+            yield pcm_frames(data, self.channels)
+
+    def close(self):
+        """
+        close the stream and release pyaudio
+        """
+        self.closed = True
+        self.stream.close()
+        self.paud.terminate()
+
+
+class CallbackCapture(object): #pylint: disable-msg=R0902
+    """
+    Sound capture by a stream callback writing into a RingBuffer
+    Windows of the newest sound are taken every hop frames, so they
+    overlap when hop is less than window; retime changes both without
+    reopening the stream. Input overflows reported by the stream are
+    counted in overruns, and hops the reader fell too far behind to
+    analyze are counted in skipped
+    """
+    def __init__(self, device, samplerate=44100, channels=2, window=4096, #pylint: disable-msg=R0913
+                 hop=1024, max_window=None):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.window = window
+        self.hop = hop
+        # a second of slack beyond the window for a slow reader, and room
+        # for retime to grow the window to max_window
+        self.ring = RingBuffer(max(window, max_window or 0) +
+                               max(hop, samplerate), channels)
+        self.next_end = window
+        self.overruns = 0
+        self.skipped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        pyaudio = adev.load_pyaudio()
+        self.paud = pyaudio.PyAudio()
+        self.stream = self.paud.open(format=pyaudio.paInt16,
+                                     channels=channels,
+                                     rate=samplerate,
+                                     input=True,
+                                     frames_per_buffer=hop,
+                                     input_device_index=device,
+                                     stream_callback=self._callback)
+
+    def _callback(self, in_data, frame_count, time_info, status): #pylint: disable-msg=W0613
+        """
+        called by the stream with each buffer of input
+        """
+        self.ring.write(pcm_frames(in_data, self.channels))
+        if status & adev.pyaudio.paInputOverflow:
+            self.overruns += 1
+        with self.cond:
+            self.cond.notify_all()
+        return (None, adev.pyaudio.paContinue)
+
+    def retime(self, window, hop):
+        """
+        take windows of window frames every hop frames from now on, the
+        stream going on as it is
+        raises ValueError if the window does not fit in the ring
+        """
+        if window + hop > self.ring.capacity:
+            raise ValueError("window of %d frames does not fit in the ring "
+                             "of %d, open the capture with a max_window" %
+                             (window, self.ring.capacity - hop))
+        with self.cond:
+            self.window = window
+            self.hop = hop
+            self.next_end = max(self.next_end, window)
+
+    def pause(self):
+        """
+        stop the stream, keeping it and pyaudio open for resume
+        """
+        self.stream.stop_stream()
+
+    def resume(self):
+        """
+        start the stream again, the first window ending a window of new
+        sound from now
+        """
+        with self.cond:
+            self.next_end = self.ring.written + self.window
+        self.stream.start_stream()
+
+    def poll(self):
+        """
+        the window ending on the next hop if it has been captured, or None
+        if the reader is more than a hop behind, it skips to the newest
+        """
+        if self.ring.written < self.next_end:
+            return None
+        behind = (self.ring.written - self.next_end) // self.hop
+        if behind > 0:
+            self.skipped += behind
+            self.next_end += behind * self.hop
+        frames = self.ring.read(self.next_end, self.window)
+        self.next_end += self.hop
+        return frames
+
+    def windows(self, timeout=0.5, stop=None):
+        """
+        generate (window, channels) arrays of sound ending on each hop,
+        waiting for each to be captured, until the stop token is set if
+        given
+        """
+        if stop is not None:
+            # the callback does not know the token, so wake up to check it
+            timeout = min(timeout, STOP_POLL)
+        while not self.closed:
+            with self.cond:
+                while self.ring.written < self.next_end and not self.closed:
+                    if stop is not None and stop.stopped():
+                        return
+                    self.cond.wait(timeout)
+            if self.closed or (stop is not None and stop.stopped()):
+                return
+            yield self.poll()
+
+    def close(self):
+        """
+        stop the stream and release pyaudio
+        """
+        self.closed = True
+        with self.cond:
+            self.cond.notify_all()
+        self.stream.stop_stream()
+        self.stream.close()
+        self.paud.terminate()
+
+
+def open_capture(device, samplerate=44100, channels=2, window=4096, hop=0):
+    """
+    a callback capture taking windows every hop frames, or if hop is 0
+    a blocking capture reading whole windows
+    """
+    if hop > 0:
+        return CallbackCapture(device, samplerate, channels, window, hop)
+    return BlockingCapture(device, samplerate, channels, window)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 code to find the audio input devices for the ASUS G20 sound
+lighting
+
+pyaudio is only imported when it is first needed, and the device list is
+kept from the first enumeration until it is refreshed, so starting a GUI
+neither loads the sound libraries twice nor leaves a PyAudio instance
+open. This module imports nothing slow, not even numpy.
+
+"""
+
+import sys
+
+# stereo mix on the G20aj, see asus_soundlighting
+DEFAULT_DEVICE = 2
+
+pyaudio = None #pylint: disable-msg=C0103
+_CACHE = {}
+
+def load_pyaudio():
+    """
+    the pyaudio module, imported on first use
+    raises ImportError if it is not installed
+    """
+    global pyaudio #pylint: disable-msg=W0603
+    if pyaudio is None:
+        import pyaudio as module
+        pyaudio = module
+    return pyaudio
+
+def input_devices(refresh=False):
+    """
+    (number of devices, dict of device index to name of those with input
+    channels), enumerated on the first call and then cached
+    refresh enumerates the devices again, e.g. after one is plugged in
+    """
+    if refresh or 'inputs' not in _CACHE:
+        paud = load_pyaudio().PyAudio()
+        try:
+            ndev = paud.get_device_count()
+            devs = {}
+            for idx in xrange(ndev):
+                dev = paud.get_device_info_by_index(idx)
+                if dev['maxInputChannels'] > 0:
+                    devs[idx] = dev['name']
+        finally:
+            paud.terminate()
+        _CACHE['inputs'] = (ndev, devs)
+    ndev, devs = _CACHE['inputs']
+    return ndev, dict(devs)
+
+def clear_cache():
+    """
+    forget the enumerated devices
+    """
+    _CACHE.clear()
+
+
+if __name__ == '__main__':
+    for DEV_INDEX, DEV_NAME in sorted(input_devices()[1].items()):
+        print "%d. %s" % (DEV_INDEX, DEV_NAME)
+    sys.exit(0)
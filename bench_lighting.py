@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+"""
+Benchmarks of the per-frame compute of every lighting effect
+
+Runs without the lighting hardware or a sound card: the sound analysis
+is fed a fixed synthetic signal, and the full frame loops of each effect
+write to a simulated device through light_acpi.SimulatedBackend.
+The import benchmarks time a fresh interpreter importing each entry
+point, the cold start of the scripts and GUIs; import.none is the bare
+interpreter startup to subtract.
+
+Usage:
+    python bench_lighting.py                       print timings
+    python bench_lighting.py --save baseline.json  store them as baseline
+    python bench_lighting.py --compare baseline.json
+        exit with status 1 if any benchmark got slower than the baseline
+        by more than the tolerance
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+import numpy
+
+import light_acpi as la
+import asus_soundlighting as asl
+import hyperventilate as hv
+import asus_light_clock as alc
+import color_blend as cb
+
+SAMPLERATE = 44100
+CHUNK = 2**asl.CHUNK_EXPONENT
+SEED = 20151002
+HERE = os.path.dirname(os.path.abspath(__file__))
+# entry points whose cold start is timed, modules missing a dependency
+# here are left out
+IMPORT_MODULES = ('light_acpi', 'audio_devices', 'asus_soundlighting',
+                  'hyperventilate', 'asus_light_clock', 'lighting_daemon',
+                  'gui_asus_soundlighting', 'gui_breathing')
+
+def synthetic_chunk(frames=CHUNK, channels=2, seed=SEED):
+    """
+    reproducible interleaved 16 bit stereo sound data: a chord in noise
+    """
+    rand = numpy.random.RandomState(seed)
+    tsec = numpy.arange(frames * channels) / float(SAMPLERATE * channels)
+    wave = numpy.zeros_like(tsec)
+    for freq, amp in ((110.0, 0.3), (440.0, 0.2), (1760.0, 0.1),
+                      (7040.0, 0.05)):
+        wave += amp * numpy.sin(2.0 * numpy.pi * freq * tsec)
+    wave += 0.05 * rand.standard_normal(tsec.shape)
+    return (wave * 20000).astype('<i2').tostring()
+
+def simulated_session():
+    """
+    a device session on the in-process stand-in device
+    """
+    return la.DeviceSession(la.SimulatedBackend())
+
+def bench_sound_loop(chunks, stereo=False):
+    """
+    the sound effect's frame loop, end to end
+    """
+    session = simulated_session()
+    for frame in asl.sound_frames(chunks, SAMPLERATE, stereo=stereo):
+        session.commit_frame(frame)
+
+def bench_breathing_loop(frames=32, perceptual=False):
+    """
+    the three light breathing cycle, end to end without the sleeps
+    """
+    session = simulated_session()
+    lights = [la.ASUSLighting(None, zone, session=session)
+              for zone in la.ZONES]
+    clists = []
+    for color in (0xff0000, 0x0000ff, 0x00ff00):
+        if perceptual:
+            clists.append(cb.breathing_curve(color, frames))
+        else:
+            gam, orig_idx = hv.make_gamut(color)
+            clists.append(hv.dim_up_down_up_sequence(gam, orig_idx, frames))
+    hv.run_triple_sequence(lights, clists, 0)
+
+def bench_clock_loop(frames=240):
+    """
+    the clock's frame loop, end to end without the sleeps
+    """
+    session = simulated_session()
+    chrs, cmins, csecs = alc.hrminsec_colors()
+    for _ in range(frames):
+        cbase, cleft, cright = alc.localtime_colors(chrs, cmins, csecs)
+        session.commit_frame({la.LEFT_VERTICAL: cleft,
+                              la.RIGHT_VERTICAL: cright,
+                              la.BASE_HORIZONTAL: cbase})
+
+def bench_clock_table_loop(frames=240, table=None):
+    """
+    the day table clock's frame loop, one frame a second of the day
+    """
+    if table is None:
+        table = alc.make_day_table()
+    session = simulated_session()
+    for second in range(frames):
+        cbase, cleft, cright = table[second]
+        session.commit_frame({la.LEFT_VERTICAL: cleft,
+                              la.RIGHT_VERTICAL: cright,
+                              la.BASE_HORIZONTAL: cbase})
+
+def import_statement(module):
+    """
+    python source importing module, or doing nothing for None
+    """
+    return 'pass' if module is None else 'import ' + module
+
+def run_import(module):
+    """
+    import module in a new interpreter, returning its exit status
+    """
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call([sys.executable, '-c',
+                                import_statement(module)],
+                               cwd=HERE, stdout=devnull, stderr=devnull)
+
+def import_benchmarks():
+    """
+    dict of import benchmark name to a function of no arguments, for the
+    modules that import here
+    """
+    benchmarks = {'import.none': lambda: run_import(None)}
+    for module in IMPORT_MODULES:
+        if run_import(module) == 0:
+            benchmarks['import.' + module] = \
+                lambda module=module: run_import(module)
+    return benchmarks
+
+def make_benchmarks():
+    """
+    dict of benchmark name to a function of no arguments
+    """
+    chunk = synthetic_chunk()
+    cutouts = asl.get_cutouts(chunk, SAMPLERATE)
+    levels = [int(round(lev * 255.0 / max(cutouts))) for lev in cutouts]
+    raw = asl.band_levels(chunk, SAMPLERATE)
+    raw_batch = numpy.tile(raw, (256, 1))
+    detector = asl.BeatDetector(0.025)
+    envelope = asl.EnvelopeFollower(0.025, 0.01, 0.2)
+    mel64 = asl.get_analyzer(SAMPLERATE,
+                             band_edges=asl.make_band_edges('mel', 64))
+    gamut, gidx = hv.make_gamut(0x1111ff)
+    chrs, cmins, csecs = alc.hrminsec_colors()
+    day_table = alc.make_day_table()
+    frame_a = dict(zip(la.ZONES, (0xff0000, 0x0000ff, 0x00ff00)))
+    frame_b = dict(zip(la.ZONES, (0x00ff00, 0xff0000, 0x1111ff)))
+
+    return {
+        'sound.get_cutouts': lambda: asl.get_cutouts(chunk, SAMPLERATE),
+        'sound.band_levels': lambda: asl.band_levels(chunk, SAMPLERATE),
+        'sound.band_levels_mel64':
+            lambda: asl.band_levels(chunk, analyzer=mel64),
+        'sound.stereo_band_levels':
+            lambda: asl.stereo_band_levels(chunk, SAMPLERATE),
+        'sound.beat_detector_update': lambda: detector.update(raw),
+        'sound.envelope_update': lambda: envelope.update(cutouts),
+        'sound.equalize': lambda: asl.equalize(cutouts),
+        'sound.saturate_color': lambda: asl.saturate_color(list(levels)),
+        'sound.rotate_levels': lambda: asl.rotate_levels(list(levels), 1),
+        'sound.shape_levels': lambda: asl.shape_levels(raw, 1),
+        'sound.shape_levels_batch256':
+            lambda: asl.shape_levels(raw_batch, 1),
+        'sound.frame_loop_x8': lambda: bench_sound_loop([chunk] * 8),
+        'sound.stereo_frame_loop_x8':
+            lambda: bench_sound_loop([chunk] * 8, stereo=True),
+        'breathing.make_gamut': lambda: hv.make_gamut(0x1111ff),
+        'breathing.dim_up_down_up_sequence':
+            lambda: hv.dim_up_down_up_sequence(gamut, gidx, 32),
+        'breathing.breathing_sequence_cached':
+            lambda: hv.breathing_sequence(0x1111ff, 32),
+        'breathing.frame_loop_x32': bench_breathing_loop,
+        'breathing.breathing_curve': lambda: cb.breathing_curve(0x1111ff, 20),
+        'breathing.perceptual_frame_loop_x20':
+            lambda: bench_breathing_loop(20, perceptual=True),
+        'blend.fade_sequence_x3': lambda: cb.fade_sequence(
+            [0xff0000, 0x0000ff, 0x00ff00], [0x00ff00, 0xff0000, 0x0000ff],
+            16),
+        'blend.blend_frames':
+            lambda: cb.blend_frames(frame_a, frame_b, 0.5),
+        'clock.localtime_colors':
+            lambda: alc.localtime_colors(chrs, cmins, csecs),
+        'clock.pulsate_hour': lambda: alc.pulsate_hour(cmins[17], 9, 21),
+        'clock.frame_loop_x240': bench_clock_loop,
+        'clock.make_day_table': alc.make_day_table,
+        'clock.table_frame_loop_x240':
+            lambda: bench_clock_table_loop(table=day_table),
+        }
+
+def time_call(func, repeat=7, min_time=0.2):
+    """
+    median and best seconds per call of func, over repeat timings each
+    long enough to be above the timer resolution
+    """
+    number = 1
+    while True:
+        elapsed = timeit.timeit(func, number=number)
+        if elapsed >= min_time / repeat or number >= 1 << 20:
+            break
+        number *= 2
+    runs = sorted(timeit.repeat(func, number=number, repeat=repeat))
+    return {'median': runs[len(runs) // 2] / number,
+            'best': runs[0] / number,
+            'number': number,
+            'repeat': repeat}
+
+def run_benchmarks(names=None, repeat=7):
+    """
+    run the benchmarks, all or those whose name starts with one of names
+    """
+    benchmarks = make_benchmarks()
+    if not names or any('import.'.startswith(pre) or pre.startswith('import.')
+                        for pre in names):
+        benchmarks.update(import_benchmarks())
+    results = {}
+    for name, func in sorted(benchmarks.items()):
+        if names and not any(name.startswith(pre) for pre in names):
+            continue
+        results[name] = time_call(func, repeat=repeat)
+    return {'python': sys.version.split()[0],
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'results': results}
+
+def compare(current, baseline, tolerance=1.25):
+    """
+    list of (name, baseline median, current median, ratio, regressed)
+    for the benchmarks found in both
+    """
+    rows = []
+    for name, res in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = res['median'] / base['median']
+        rows.append((name, base['median'], res['median'], ratio,
+                     ratio > tolerance))
+    return rows
+
+def print_results(results):
+    """
+    print a table of median and best microseconds per call
+    """
+    print "%-40s %14s %14s" % ("benchmark", "median us", "best us")
+    for name, res in sorted(results['results'].items()):
+        print "%-40s %14.1f %14.1f" % (name, res['median'] * 1e6,
+                                       res['best'] * 1e6)
+
+def main(argv=None):
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('names', nargs='*',
+                        help='only run benchmarks starting with these')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--save', metavar='FILE',
+                        help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='slowdown ratio counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names, args.repeat)
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as outfile:
+            json.dump(results, outfile, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+        regressions = 0
+        print "\n%-40s %10s %10s %7s" % ("vs baseline", "base us",
+                                         "now us", "ratio")
+        for name, base, now, ratio, regressed in compare(
+                results, baseline, args.tolerance):
+            print "%-40s %10.1f %10.1f %7.2f%s" % (
+                name, base * 1e6, now * 1e6, ratio,
+                "  REGRESSION" if regressed else "")
+            regressions += regressed
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
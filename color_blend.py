@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 perceptual color mixing for the ASUS G20 lights
+
+Colors are mixed and dimmed in OKLab, where equal steps look equally
+large, rather than in the red, green and blue levels: a breath changes
+evenly in brightness and keeps its hue down to black, and a cross-fade
+between two colors does not pass through a dark or grey middle.
+
+The sRGB transfer curve is two lookup tables built once, level ->
+linear light and linear light -> level, so whole sequences and frames
+convert with a matrix product, a cube root and array indexing:
+
+    SRGB_TO_LINEAR[level]        float linear light of a level 0 to 255
+    LINEAR_TO_SRGB[index]        level of linear light index / LINEAR_STEPS
+
+Frames are dicts of light position to color, as everywhere else, and a
+frame source is an effect generator of lighting_daemon, yielding (frame,
+wait) pairs; crossfade_effect runs two of them into one.
+
+"""
+
+import numpy
+
+import light_acpi as la
+import color_tables as ctab
+
+# linear light resolution of LINEAR_TO_SRGB, fine enough that every
+# level converts to linear light and back to itself
+LINEAR_STEPS = 8192
+# seconds between the frames of a cross-fade
+FADE_INTERVAL = 0.04
+
+# linear sRGB to LMS cone response, and the cube roots of LMS to OKLab
+LMS_FROM_RGB = numpy.array([[0.4122214708, 0.5363325363, 0.0514459929],
+                            [0.2119034982, 0.6806995451, 0.1073969566],
+                            [0.0883024619, 0.2817188376, 0.6299787005]])
+LAB_FROM_LMS = numpy.array([[0.2104542553, 0.7936177850, -0.0040720468],
+                            [1.9779984951, -2.4285922050, 0.4505937099],
+                            [0.0259040371, 0.7827717662, -0.8086757660]])
+LMS_FROM_LAB = numpy.linalg.inv(LAB_FROM_LMS)
+RGB_FROM_LMS = numpy.linalg.inv(LMS_FROM_RGB)
+
+def srgb_to_linear_table():
+    """
+    float table of the linear light of each sRGB level
+    """
+    levels = numpy.arange(256) / 255.0
+    return numpy.where(levels <= 0.04045, levels / 12.92,
+                       ((levels + 0.055) / 1.055) ** 2.4)
+
+def linear_to_srgb_table(steps=LINEAR_STEPS):
+    """
+    uint8 table of the nearest sRGB level to each of steps + 1 evenly
+    spaced linear light values from 0 to 1
+    """
+    light = numpy.arange(steps + 1) / float(steps)
+    levels = numpy.where(light <= 0.0031308, light * 12.92,
+                         1.055 * light ** (1 / 2.4) - 0.055)
+    return numpy.round(levels * 255).astype(numpy.uint8)
+
+SRGB_TO_LINEAR = srgb_to_linear_table()
+LINEAR_TO_SRGB = linear_to_srgb_table()
+
+def to_oklab(colors):
+    """
+    (..., 3) float OKLab lightness, a and b of 0x00rrggbb colors
+    """
+    light = SRGB_TO_LINEAR[ctab.split_colors(colors)]
+    return numpy.cbrt(light.dot(LMS_FROM_RGB.T)).dot(LAB_FROM_LMS.T)
+
+def from_oklab(labs):
+    """
+    uint32 0x00rrggbb colors of a (..., 3) array of OKLab, with colors
+    outside the lights' gamut clipped
+    """
+    light = (numpy.asarray(labs, dtype=float).dot(LMS_FROM_LAB.T) ** 3).dot(
+        RGB_FROM_LMS.T)
+    index = numpy.rint(numpy.clip(light, 0.0, 1.0) * LINEAR_STEPS)
+    return ctab.join_colors(LINEAR_TO_SRGB[index.astype(numpy.intp)])
+
+def ease(amounts):
+    """
+    smoothstep of amounts from 0 to 1, so fades start and end gently
+    """
+    amounts = numpy.clip(amounts, 0.0, 1.0)
+    return amounts * amounts * (3.0 - 2.0 * amounts)
+
+def mix_colors(start, end, amounts):
+    """
+    uint32 colors amounts of the way from start to end in OKLab
+    start and end are colors or arrays of them, and amounts from 0 to 1
+    broadcasts against them, e.g. a column of amounts against a row of
+    colors gives a frame per amount
+    """
+    start = to_oklab(start)
+    end = to_oklab(end)
+    amounts = numpy.asarray(amounts, dtype=float)[..., numpy.newaxis]
+    return from_oklab(start + (end - start) * amounts)
+
+def fade_sequence(start, end, steps):
+    """
+    (steps, colors) uint32 array of an eased fade from the start colors
+    to the end colors, ending on end
+    """
+    amounts = ease(numpy.arange(1, steps + 1) / float(steps))
+    return mix_colors(start, end, amounts[:, numpy.newaxis])
+
+def breathing_curve(color, frames):
+    """
+    uint32 array of a breath of frames, OKLab lightness following a
+    cosine from color up to its full brightness, down to black and back
+    Dimming scales the OKLab color toward black, which is scaling its
+    linear light, so the hue holds; the cosine lingers at the top and
+    bottom where changes are least visible, so fewer frames look smooth
+    """
+    top = ctab.split_colors(color).max()
+    if top == 0:
+        return numpy.zeros(frames, dtype=numpy.uint32)
+    # the color's place on the curve, so a breath starts and ends on it:
+    # its brightest channel's linear light scaled to 1 is full brightness
+    level = numpy.cbrt(SRGB_TO_LINEAR[top])
+    lab = to_oklab(color) / level
+    phase = numpy.arccos(2.0 * level - 1.0)
+    angles = 2.0 * numpy.pi * numpy.arange(frames) / frames - phase
+    levels = (1.0 + numpy.cos(angles)) / 2.0
+    return from_oklab(levels[:, numpy.newaxis] * lab)
+
+def blend_frames(start, end, amount):
+    """
+    frame amount of the way from the start frame to the end frame
+    a light in only one of them keeps its color from that one
+    """
+    zones = [zone for zone in end if zone in start]
+    frame = dict(start)
+    frame.update(end)
+    if zones:
+        colors = mix_colors([start[zone] for zone in zones],
+                            [end[zone] for zone in zones], amount)
+        frame.update(zip(zones, [int(color) for color in colors]))
+    return frame
+
+def fade_frames(frames, start, seconds, timer=la.timer):
+    """
+    generate the frames of an iterable, faded in from the start frame
+    over the first seconds after the first frame
+    """
+    began = None
+    for frame in frames:
+        if began is None:
+            began = timer()
+        amount = (timer() - began) / seconds if seconds > 0 else 1.0
+        if amount < 1.0:
+            frame = blend_frames(start, frame, ease(amount))
+        yield frame
+
+def crossfade_effect(old, new, seconds, interval=FADE_INTERVAL):
+    """
+    effect generator fading from the old effect to the new one over
+    seconds, both running meanwhile, and then giving the new effect
+    old is closed when the fade ends, and new with this effect
+    """
+    frames = [{}, {}]
+    due = [la.timer(), la.timer()]
+    sources = [old, new]
+    began = la.timer()
+    try:
+        try:
+            while True:
+                now = la.timer()
+                amount = (now - began) / seconds if seconds > 0 else 1.0
+                if amount >= 1.0:
+                    break
+                for idx, source in enumerate(sources):
+                    if source is None or due[idx] > now:
+                        continue
+                    try:
+                        frame, wait = next(source)
+                    except StopIteration:
+                        sources[idx] = None
+                        continue
+                    if frame:
+                        frames[idx].update(frame)
+                    due[idx] = now + max(wait, 0)
+                if sources[1] is None:
+                    return
+                wait = min(due[idx] for idx in (0, 1)
+                           if sources[idx] is not None)
+                yield blend_frames(frames[0], frames[1], ease(amount)), \
+                      min(interval, wait - la.timer())
+        finally:
+            old.close()
+        # the end colors, then the new effect on its own
+        yield dict(frames[1]), max(due[1] - la.timer(), 0)
+        while True:
+            try:
+                item = next(new)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        new.close()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 lookup tables shaping the colors of the ASUS G20 lights
+
+Every table is built once and then applied by array indexing, to one
+color or to whole frames and sequences:
+
+    SATURATION[top, level]   asus_soundlighting.sat_trip of a level in a
+                             red, green, blue triple whose largest is top
+    gamma_table(gamma, cap)  level -> cap * (level / 255) ** gamma
+
+A ZoneCalibration holds a red, green and blue table for each zone, so
+zones whose LEDs differ are corrected separately. A light_acpi
+DeviceSession with one as its calibration applies it to every color it
+writes, and light_acpi.get_session gives each session it opens the one
+in light_acpi.CALIBRATION_PATH, so every effect is calibrated alike.
+Calibrations are stored as JSON, for example
+
+    {"left": {"gamma": 2.2, "cap": 200},
+     "base": {"gamma": [2.0, 2.4, 2.2]}}
+
+"""
+
+import json
+
+import numpy
+
+import light_acpi as la
+
+ZONES_BY_NAME = dict((name, zone) for zone, name in la.ZONE_NAMES.items())
+
+def round_half_up(values):
+    """
+    round non-negative values like Python 2 round, halves going up, as
+    floats; numpy rounds halves to even
+    """
+    values = numpy.asarray(values, dtype=float)
+    floor = numpy.floor(values)
+    return floor + (values - floor >= 0.5)
+
+def saturation_table():
+    """
+    (256, 256) uint8 table of sat_trip, indexed by the largest level of
+    a triple and then the level
+    levels above the largest never occur, and are capped at 255
+    """
+    tops = numpy.arange(256, dtype=float)[:, numpy.newaxis]
+    levels = numpy.arange(256, dtype=float)
+    # the same operations as sat_trip, so the truncation matches
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        table = 255.0 / tops ** 4 * levels ** 4
+    table[numpy.logical_not(numpy.isfinite(table))] = 0
+    return numpy.minimum(table, 255).astype(numpy.uint8)
+
+SATURATION = saturation_table()
+
+def saturate_levels(levels):
+    """
+    sat_trip on each red, green, blue triple of an int array of levels
+    from 0 to 255, of any shape whose last axis is a multiple of 3
+    """
+    levels = numpy.asarray(levels, dtype=numpy.intp)
+    trips = levels.reshape(levels.shape[:-1] + (-1, 3))
+    tops = trips.max(axis=-1)[..., numpy.newaxis]
+    return SATURATION[tops, trips].reshape(levels.shape)
+
+def gamma_table(gamma=1.0, cap=255):
+    """
+    uint8 table of level -> cap * (level / 255) ** gamma, rounded
+    """
+    levels = numpy.arange(256) / 255.0
+    return numpy.round(cap * levels ** gamma).astype(numpy.uint8)
+
+def split_colors(colors):
+    """
+    (..., 3) int array of the red, green and blue of 0x00rrggbb colors
+    """
+    colors = numpy.asarray(colors, dtype=numpy.uint32)
+    return numpy.stack([(colors >> 16) & 255, (colors >> 8) & 255,
+                        colors & 255], axis=-1).astype(numpy.intp)
+
+def join_colors(chans):
+    """
+    uint32 0x00rrggbb colors of a (..., 3) array of red, green and blue
+    """
+    chans = numpy.asarray(chans, dtype=numpy.uint32)
+    return (chans[..., 0] << 16) | (chans[..., 1] << 8) | chans[..., 2]
+
+
+class ZoneCalibration(object):
+    """
+    Per-zone gamma correction and brightness caps, as a red, green and
+    blue lookup table for each zone
+    Zones without a calibration are passed through unchanged
+    """
+    def __init__(self):
+        self.tables = {}
+        self.lists = {}
+
+    def set_zone(self, zone, gamma=1.0, cap=255):
+        """
+        calibrate a zone, a light position, with gamma and cap each a
+        number for all of red, green and blue, or one for each
+        """
+        gammas = numpy.resize(numpy.asarray(gamma, dtype=float), 3)
+        caps = numpy.resize(numpy.asarray(cap, dtype=float), 3)
+        table = numpy.array([gamma_table(gam, top)
+                             for gam, top in zip(gammas, caps)])
+        self.tables[zone] = table
+        # plain lists are faster than arrays for a color at a time
+        self.lists[zone] = [chan.tolist() for chan in table]
+
+    def apply_color(self, zone, color):
+        """
+        the calibrated color of a zone
+        """
+        lists = self.lists.get(zone)
+        if lists is None:
+            return color
+        reds, greens, blues = lists
+        return (reds[(color >> 16) & 255] << 16) | \
+               (greens[(color >> 8) & 255] << 8) | blues[color & 255]
+
+    def apply(self, frame):
+        """
+        a frame, a dict of light position to color, calibrated
+        """
+        return dict((zone, self.apply_color(zone, int(color)))
+                    for zone, color in frame.items())
+
+    def apply_colors(self, zone, colors):
+        """
+        an array of colors of a zone calibrated, e.g. a whole breathing
+        sequence, as uint32
+        """
+        table = self.tables.get(zone)
+        if table is None:
+            return numpy.asarray(colors, dtype=numpy.uint32)
+        chans = split_colors(colors)
+        return join_colors(table[numpy.arange(3), chans])
+
+    @classmethod
+    def load(cls, path):
+        """
+        a calibration from a JSON file of zone name to gamma and cap
+        """
+        with open(path) as infile:
+            settings = json.load(infile)
+        calibration = cls()
+        for name, zone_settings in settings.items():
+            if name not in ZONES_BY_NAME:
+                raise ValueError("unknown zone %r in %s, not one of %s" %
+                                 (name, path, ', '.join(sorted(ZONES_BY_NAME))))
+            calibration.set_zone(ZONES_BY_NAME[name],
+                                 zone_settings.get('gamma', 1.0),
+                                 zone_settings.get('cap', 255))
+        return calibration
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 code to run lighting effects on a reusable worker thread
+
+An effect is a function taking a stop keyword argument, a StopToken it
+checks between frames and waits on instead of sleeping, so it returns
+soon after being asked to and its finally clauses close the audio stream
+and the device writer. Effects in this package wait at most
+STOP_LATENCY seconds between checks, outside of a single device call.
+
+EffectWorker keeps one thread for all the effects it runs, so starting
+an effect with new settings only waits for the old one to return.
+
+"""
+
+import threading
+import traceback
+
+# how long a stop may take, the longest effects wait between checks
+STOP_LATENCY = 0.05
+
+
+class StopToken(object):
+    """
+    A request to stop one run of an effect, set from another thread
+    event may be a multiprocessing.Event, to stop an effect in another
+    process
+    """
+    def __init__(self, event=None):
+        if event is None:
+            event = threading.Event()
+        self.event = event
+
+    def stop(self):
+        """
+        ask the effect to stop
+        """
+        self.event.set()
+
+    def stopped(self):
+        """
+        whether the effect has been asked to stop
+        """
+        return self.event.is_set()
+
+    def wait(self, seconds):
+        """
+        sleep for seconds, returning early if asked to stop
+        returns whether the effect has been asked to stop
+        """
+        self.event.wait(seconds)
+        return self.event.is_set()
+
+
+class EffectWorker(object):
+    """
+    A daemon thread running one effect at a time, reused for each start
+    An effect that raises is reported and the thread goes on waiting
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.job = None
+        self.token = None
+        self.busy = False
+        self.closed = False
+        self.thread = None
+
+    def start(self, effect, *args, **kwargs):
+        """
+        stop the running effect, then run effect(*args, stop=token,
+        **kwargs) on the worker thread
+        returns the token, which is set when the effect is stopped
+        """
+        self.stop()
+        token = StopToken()
+        with self.cond:
+            if self.closed:
+                raise ValueError("effect worker is shut down")
+            self.token = token
+            self.job = (effect, args, kwargs, token)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run_loop,
+                                               name='effect worker')
+                self.thread.daemon = True
+                self.thread.start()
+            self.cond.notify_all()
+        return token
+
+    def _run_loop(self):
+        """
+        run each effect handed over by start, until shutdown
+        """
+        while True:
+            with self.cond:
+                while self.job is None and not self.closed:
+                    self.cond.wait()
+                if self.job is None:
+                    return
+                effect, args, kwargs, token = self.job
+                self.job = None
+                self.busy = True
+            try:
+                effect(*args, stop=token, **kwargs)
+            except Exception: #pylint: disable-msg=W0703
+                traceback.print_exc()
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def running(self):
+        """
+        whether an effect is running or about to
+        """
+        with self.cond:
+            return self.busy or self.job is not None
+
+    def stop(self, timeout=1.0):
+        """
+        ask the effect to stop and wait up to timeout seconds for it
+        returns whether it stopped in time
+        """
+        with self.cond:
+            if self.token is not None:
+                self.token.stop()
+            self.job = None
+            waited = 0.0
+            while self.busy and waited < timeout:
+                self.cond.wait(STOP_LATENCY)
+                waited += STOP_LATENCY
+            return not self.busy
+
+    def shutdown(self, timeout=1.0):
+        """
+        stop the effect and end the thread
+        returns whether the effect stopped in time
+        """
+        stopped = self.stop(timeout)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        return stopped
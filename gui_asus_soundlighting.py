@@ -13,8 +13,7 @@ IMPORTANT: run as administrator
 """
 
 import os
-import ctypes
-import threading
+import multiprocessing
 
 import Tkinter as tki
 import ttk
@@ -22,34 +21,21 @@ import tkFileDialog as tkfd
 import tkMessageBox as mbox
 
 import light_acpi as la
-import asus_soundlighting as asl
+import audio_devices as adev
+from effect_worker import EffectWorker
 
 DLLNAME = 'ACPIWMI.dll'
+# seconds to fade from the last colors when the lighting restarts
+FADE_SECONDS = 0.3
+# milliseconds between checks for errors of the sound analysis
+ERROR_POLL_MS = 500
+
 def correct_dll_path(pathdir):
     """
     check that we have the right path to the dll
     """
     return os.path.isfile(os.path.join(pathdir, DLLNAME))
 
-def terminate_thread(thread):
-    """
-    Terminates a python thread from another thread.
-    :param thread: a threading.Thread instance
-    """
-    if not thread.isAlive():
-        return
-
-    exc = ctypes.py_object(SystemExit)
-    res = ctypes.pythonapi.PyThreadState_SetAsyncExc(
-        ctypes.c_long(thread.ident), exc)
-    if res == 0:
-        raise ValueError("nonexistent thread id")
-    elif res > 1:
-        # """if it returns a number greater than one, you're in trouble,
-        # and you should call it again with exc=NULL to revert the effect"""
-        ctypes.pythonapi.PyThreadState_SetAsyncExc(thread.ident, None)
-        raise SystemError("PyThreadState_SetAsyncExc failed")
-
 class SoundLightApp(tki.Frame):
     """
     app for the gui
@@ -68,19 +54,13 @@ class SoundLightApp(tki.Frame):
         tki.Label(root,
                   text="Audio Device Choices",
                   font="Verdana 12 bold").pack()
-        num_devices, aud_dict = asl.list_devices(do_print=False)
         self.audio_devnum = tki.IntVar()
-        self.audio_devnum.set(asl.DEVICE_NUMBER)
-        for device_num, device_text in aud_dict.iteritems():
-            rbut = tki.Radiobutton(root,
-                                   text=device_text,
-                                   indicatoron=0,
-                                   padx=20,
-                                   variable=self.audio_devnum,
-                                   value=device_num)
-            rbut.pack()
-            if device_text.find("Mix"):
-                rbut.select()
+        self.audio_devnum.set(adev.DEFAULT_DEVICE)
+        self.device_frame = tki.Frame(root)
+        self.device_frame.pack()
+        self.show_devices()
+        tki.Button(root, text='Refresh Devices',
+                   command=lambda: self.show_devices(refresh=True)).pack()
 
         ttk.Separator(root, orient=tki.HORIZONTAL).pack(fill=tki.BOTH, expand=1)
 
@@ -94,16 +74,17 @@ class SoundLightApp(tki.Frame):
 
         ttk.Separator(root, orient=tki.HORIZONTAL).pack(fill=tki.BOTH, expand=1)
 
-        # choose the lighting color update interval
+        # choose the analysis window, the lights change every hop
+        # whatever it is, but a longer one smooths more and lags more
         tki.Label(root,
-                  text="Doubling increment for Update Interval",
+                  text="Analysis Window (2**n frames)",
                   font="Verdana 12 bold").pack()
         self.slider = tki.Scale(root,
-                                from_=12, to=18,
+                                from_=11, to=18,
                                 tickinterval=1,
                                 sliderlength=10,
                                 orient=tki.HORIZONTAL)
-        self.slider.set(15)
+        self.slider.set(12)
         self.slider.pack()
 
         ttk.Separator(root, orient=tki.HORIZONTAL).pack(fill=tki.BOTH, expand=1)
@@ -122,9 +103,32 @@ class SoundLightApp(tki.Frame):
 
         ttk.Separator(root, orient=tki.HORIZONTAL).pack(fill=tki.BOTH, expand=1)
 
+        # smoothing lets short hops give steady colors
+        tki.Label(root,
+                  text="Smoothing Release (ms, 0 for Off)",
+                  font="Verdana 12 bold").pack()
+        self.release_slider = tki.Scale(root,
+                                        from_=0, to=500,
+                                        tickinterval=100,
+                                        resolution=10,
+                                        sliderlength=10,
+                                        orient=tki.HORIZONTAL)
+        self.release_slider.set(0)
+        self.release_slider.pack()
+
+        # stereo lights each side from its own channel
+        self.stereo = tki.IntVar()
+        tki.Checkbutton(root, text="Stereo (left and right by channel)",
+                        variable=self.stereo).pack()
+        self.beats = tki.IntVar()
+        tki.Checkbutton(root, text="Flash on beats",
+                        variable=self.beats).pack()
+
+        ttk.Separator(root, orient=tki.HORIZONTAL).pack(fill=tki.BOTH, expand=1)
+
         # start app button
         start_button = tki.Button(root,
-                                  text="Start", fg="green",
+                                  text="Start / Apply", fg="green",
                                   font="Verdana 14",
                                   command=self.audio_to_lighting)
         start_button.pack()
@@ -136,7 +140,30 @@ class SoundLightApp(tki.Frame):
                                  command=self.quit_app)
         quit_button.pack(side=tki.BOTTOM)
 
-        self.lighting_thread = None
+        # one thread runs each effect in turn, stopped by its token
+        self.worker = EffectWorker()
+        self.session = None
+        self.root.after(ERROR_POLL_MS, self.show_errors)
+
+    def show_devices(self, refresh=False):
+        """
+        a radio button for each audio input device, enumerated again if
+        refresh
+        """
+        for child in self.device_frame.winfo_children():
+            child.destroy()
+        aud_dict = adev.input_devices(refresh)[1]
+        for device_num, device_name in sorted(aud_dict.iteritems()):
+            device_text = str(device_num) + '. ' + device_name
+            rbut = tki.Radiobutton(self.device_frame,
+                                   text=device_text,
+                                   indicatoron=0,
+                                   padx=20,
+                                   variable=self.audio_devnum,
+                                   value=device_num)
+            rbut.pack()
+            if device_text.find("Mix"):
+                rbut.select()
 
     def pick_dll_path(self):
         """
@@ -168,10 +195,16 @@ class SoundLightApp(tki.Frame):
 
     def get_update_frequency(self):
         """
-        update interval is the exponent in (44100 / 2**chunk_exponent) secs
+        exponent of the analysis window, 2**exponent frames
         """
         return int(self.slider.get())
 
+    def get_release_seconds(self):
+        """
+        seconds for the smoothed levels to fall, they rise at once
+        """
+        return self.release_slider.get() / 1000.0
+
     def get_rotation_interval(self):
         """
         update interval is the exponent in (44100 / 2**chunk_exponent) secs
@@ -180,41 +213,80 @@ class SoundLightApp(tki.Frame):
 
     def audio_to_lighting(self):
         """
-        begin sampling display thread
+        begin sampling display thread, or apply the settings to the one
+        running
         """
-        if not self.lighting_thread == None:
-            terminate_thread(self.lighting_thread)
-        # get and set the audio port number
-        asl.DEVICE_NUMBER = self.audio_devnum.get()
-
-        # get and set the dll path directory
-        la.DPATH = self.optional_choose_dll_path()
-
-        # get and set the exponent for the chunk size
-        asl.CHUNK_EXPONENT = self.get_update_frequency()
-
-        # get and set the exponent for the rotation interval
-        asl.LIGHT_ROTATION_INTERVAL = self.get_rotation_interval()
-
-        def callback():
-            """
-            threaded function
-            """
-            asl.asus_soundlight(do_print=False)
-
-        self.lighting_thread = threading.Thread(target=callback)
-        self.lighting_thread.start()
+        # the analysis loads numpy, so it is imported on the first start
+        # rather than before the window appears
+        import asus_soundlighting as asl
+        import analysis_process as ap
+
+        dll_path = self.optional_choose_dll_path()
+        # the window slider is the exponent of the window size
+        settings = dict(device=self.audio_devnum.get(),
+                        window=2**self.get_update_frequency(),
+                        rotation_interval=self.get_rotation_interval(),
+                        release=self.get_release_seconds(),
+                        stereo=bool(self.stereo.get()),
+                        beats=bool(self.beats.get()))
+
+        # a running session takes the new settings as it goes, only a new
+        # device reopens the sound stream, and the lights never go dark;
+        # a stopped one resumes its paused child process
+        if self.session is not None and self.session.dll_path == dll_path:
+            try:
+                self.session.update(**settings)
+            except ValueError as error:
+                mbox.showwarning("Sound lighting settings", str(error))
+                return
+            if not self.worker.running():
+                self.worker.start(self.session.run,
+                                  fade_seconds=FADE_SECONDS)
+            return
+
+        # capture and analysis run in a child process, so they do not
+        # compete with the Tk mainloop, only the device writes run here
+        try:
+            session = ap.SoundLightSession(asl.make_config(**settings),
+                                           dll_path)
+        except ValueError as error:
+            mbox.showwarning("Sound lighting settings", str(error))
+            return
+
+        # the running effect returns within a hop, pausing its audio
+        # stream and closing its writer
+        self.worker.stop()
+        if self.session is not None:
+            self.session.close()
+        self.session = session
+        self.worker.start(self.session.run, fade_seconds=FADE_SECONDS)
+
+    def show_errors(self):
+        """
+        warn of an error of the sound analysis, such as a device it could
+        not open, and check again later
+        """
+        if self.session is not None:
+            error = self.session.take_error()
+            if error is not None:
+                mbox.showwarning("Sound analysis", error)
+        self.root.after(ERROR_POLL_MS, self.show_errors)
 
     def quit_app(self):
         """
         End execution of app
         """
-        if not self.lighting_thread == None:
-            terminate_thread(self.lighting_thread)
+        # an effect still writing keeps its device open, the process
+        # exit releases it
+        if self.worker.shutdown():
+            la.close_sessions()
+        if self.session is not None:
+            self.session.close()
         self.root.destroy()
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     ROOT = tki.Tk()
     APP = SoundLightApp(ROOT)
     ROOT.mainloop()
@@ -11,8 +11,6 @@ Color breathing gui program for G20aj series PC
 """
 
 import os
-import ctypes
-import threading
 
 import Tkinter as tki
 import ttk
@@ -21,34 +19,19 @@ import tkFileDialog as tkfd
 import tkMessageBox as mbox
 
 import light_acpi as la
+from effect_worker import EffectWorker
 import hyperventilate as hv
 
 DLLNAME = 'ACPIWMI.dll'
+# seconds to fade to new breathing settings
+FADE_SECONDS = 0.6
+
 def correct_dll_path(pathdir):
     """
     check that we have the right path to the dll
     """
     return os.path.isfile(os.path.join(pathdir, DLLNAME))
 
-def terminate_thread(thread):
-    """
-    Terminates a python thread from another thread.
-    :param thread: a threading.Thread instance
-    """
-    if not thread.isAlive():
-        return
-
-    exc = ctypes.py_object(SystemExit)
-    res = ctypes.pythonapi.PyThreadState_SetAsyncExc(
-        ctypes.c_long(thread.ident), exc)
-    if res == 0:
-        raise ValueError("nonexistent thread id")
-    elif res > 1:
-        # """if it returns a number greater than one, you're in trouble,
-        # and you should call it again with exc=NULL to revert the effect"""
-        ctypes.pythonapi.PyThreadState_SetAsyncExc(thread.ident, None)
-        raise SystemError("PyThreadState_SetAsyncExc failed")
-
 class BreathingApp(tki.Frame): #pylint: disable-msg=R0902
     """
     app for the gui
@@ -96,6 +79,11 @@ class BreathingApp(tki.Frame): #pylint: disable-msg=R0902
         self.slider.set(15)
         self.slider.pack(fill=tki.BOTH, expand=1)
 
+        # perceptual breathing dims evenly in brightness, keeping the hue
+        self.perceptual = tki.IntVar()
+        tki.Checkbutton(root, text="Perceptual breathing (OKLab)",
+                        variable=self.perceptual).pack()
+
         ttk.Separator(root, orient=tki.HORIZONTAL).pack(fill=tki.BOTH, expand=1)
 
         # start app button
@@ -106,7 +94,8 @@ class BreathingApp(tki.Frame): #pylint: disable-msg=R0902
         tki.Button(root, text="QUIT", fg="red", font="Verdana 14",
                    command=self.quit_app).pack(side=tki.BOTTOM)
 
-        self.lighting_thread = None
+        # one thread runs each effect in turn, stopped by its token
+        self.worker = EffectWorker()
 
     def pick_dll_path(self):
         """
@@ -168,39 +157,35 @@ class BreathingApp(tki.Frame): #pylint: disable-msg=R0902
         """
         begin sampling display thread
         """
-        if not self.lighting_thread == None:
-            terminate_thread(self.lighting_thread)
+        # the running effect returns within a frame, closing its writer
+        self.worker.stop()
 
         # get and set the dll path directory
         la.DPATH = self.optional_choose_dll_path()
 
-        # get breathing rate sleep/update time interval for frames
-        tinterval = 2.0 / self.get_resp_rate()
-        fnum = 30
-        # the ACPI call takes time, so shrink fnum for faster rates
-        if self.resp_rate > 8:
-            fnum -= int(self.resp_rate / 2)
-        if fnum < 5:
-            fnum = 5
+        # one breath is one pass through fnum frames, and the frames run
+        # to a schedule, so the device call time does not slow the rate
+        # the perceptual breath eases at its ends, so it needs fewer frames
+        perceptual = bool(self.perceptual.get())
+        fnum = 20 if perceptual else 30
+        tinterval = 60.0 / (self.get_resp_rate() * fnum)
 
         # get colors
         colors = [self.leftcolor, self.rightcolor, self.basecolor]
 
-        def callback():
-            """
-            threaded function
-            """
-            hv.all_cycle(colors, frames=fnum, sleepinterval=tinterval)
-
-        self.lighting_thread = threading.Thread(target=callback)
-        self.lighting_thread.start()
+        # fade from whatever the lights show, rather than snapping
+        self.worker.start(hv.all_cycle, colors, frames=fnum,
+                          sleepinterval=tinterval, perceptual=perceptual,
+                          fade_seconds=FADE_SECONDS)
 
     def quit_app(self):
         """
         End execution of app
         """
-        if not self.lighting_thread == None:
-            terminate_thread(self.lighting_thread)
+        # an effect still writing keeps its device open, the process
+        # exit releases it
+        if self.worker.shutdown():
+            la.close_sessions()
         self.root.destroy()
 
 
@@ -10,8 +10,16 @@ Color breathing package for G20aj series PC
 
 """
 
+from collections import OrderedDict
+
+import numpy
+
 import light_acpi as la
-from time import sleep
+import color_blend as cb
+import color_tables as ctab
+import timeline
+
+SEQUENCE_CACHE_SIZE = 32
 
 def make_rgb(cred, cgreen, cblue):
     """
@@ -27,6 +35,15 @@ def make_rgb(cred, cgreen, cblue):
         ret = 0x00ffffff
     return ret
 
+def make_rgb_array(reds, greens, blues):
+    """
+    make_rgb for arrays of components, as a uint32 array of colors
+    """
+    reds, greens, blues = [ctab.round_half_up(chans).astype(numpy.int64)
+                           for chans in (reds, greens, blues)]
+    ret = reds * 0x10000 + greens * 0x100 + blues
+    return numpy.clip(ret, 0, 0x00ffffff).astype(numpy.uint32)
+
 def split_rgb(color):
     """
     split rgb into red, green, blue
@@ -47,94 +64,185 @@ def make_ratios(cred, cgreen, cblue):
 
 def make_gamut(color):
     """
-    make a sequence of 256 colors
+    make a sequence of 256 colors, as a uint32 array, and the index in it
+    of color, or of the nearest color to it if rounding left it out
     """
-    sequence256 = []
     cred, cgreen, cblue = split_rgb(color)
+    if max(cred, cgreen, cblue) == 0:
+        return numpy.zeros(256, dtype=numpy.uint32), 0
     rred, rgreen, rblue = make_ratios(cred, cgreen, cblue)
-    for step in range(256):
-        tred = float(step) * rred
-        tgreen = float(step) * rgreen
-        tblue = float(step) * rblue
-        sequence256.append(make_rgb(tred, tgreen, tblue))
+    steps = numpy.arange(256, dtype=float)
+    sequence256 = make_rgb_array(steps * rred, steps * rgreen, steps * rblue)
 
-    return sequence256, sequence256.index(color)
+    found = numpy.flatnonzero(sequence256 == color)
+    if len(found) > 0:
+        return sequence256, int(found[0])
+    seq = sequence256.astype(numpy.int64)
+    distance = ((seq >> 16) - cred) ** 2 + \
+               (((seq >> 8) & 0xff) - cgreen) ** 2 + \
+               ((seq & 0xff) - cblue) ** 2
+    return sequence256, int(numpy.argmin(distance))
 
 
 def dim_up_down_up_sequence(gamut, idex, frames):
     """
     up color intensity to full
+    gamut may be a list or an array, the sequence is a uint32 array
     """
+    gamut = numpy.asarray(gamut, dtype=numpy.uint32)
     # initial compiled list is size 512
-    cseq = gamut[idex:] + gamut[::-1] + gamut[0:idex]
+    cseq = numpy.concatenate((gamut[idex:], gamut[::-1], gamut[0:idex]))
     # adjust size
-    reframed = []
     ratio = 512.0 / frames
-    for frameidx in range(frames):
-        gamut_pos = int(round(frameidx * ratio))
-        reframed.append(cseq[gamut_pos])
-    return reframed
-
+    positions = ctab.round_half_up(numpy.arange(frames) * ratio).astype(int)
+    return cseq[numpy.minimum(positions, len(cseq) - 1)]
 
-def run_color_sequence(lighting, colors, sleepinterval):
-    """
-    run a breathing type change sequence through once
-    sleepinterval is in seconds or fractions of seconds
-    """
-    for colr in colors:
-        lighting.set_color(colr)
-        sleep(sleepinterval)
 
-def continuous_cycle(lighti, startcolor, frames=32, sleepinterval=0.1):
-    """
-    breathe in color saturation
-    """
-    gam, orig_idx = make_gamut(startcolor)
-    seq = dim_up_down_up_sequence(gam, orig_idx, frames)
-    while True:
-        run_color_sequence(lighti, seq, sleepinterval)
+_SEQUENCES = OrderedDict()
 
-def run_triple_sequence(lightlist, colorlist, sleeptime):
+def breathing_sequence(color, frames, perceptual=False):
     """
-    do all 3 lights given list of all 3
+    the dim_up_down_up_sequence of frames for color's gamut, or with
+    perceptual the color_blend.breathing_curve, as a read-only uint32
+    array
+    The last SEQUENCE_CACHE_SIZE sequences made are cached, so breathing
+    again with the same settings costs nothing
     """
-    lli = lightlist[0]
-    rli = lightlist[1]
-    bli = lightlist[2]
-    lcol = colorlist[0]
-    rcol = colorlist[1]
-    bcol = colorlist[2]
-
-    for idx in range(len(lcol)):
-        lli.set_color(lcol[idx])
-        rli.set_color(rcol[idx])
-        bli.set_color(bcol[idx])
-        sleep(sleeptime)
+    key = (int(color), int(frames), bool(perceptual))
+    seq = _SEQUENCES.pop(key, None)
+    if seq is None:
+        if perceptual:
+            seq = cb.breathing_curve(color, frames)
+        else:
+            gam, orig_idx = make_gamut(color)
+            seq = dim_up_down_up_sequence(gam, orig_idx, frames)
+        seq.flags.writeable = False
+        while len(_SEQUENCES) >= SEQUENCE_CACHE_SIZE:
+            _SEQUENCES.popitem(last=False)
+    _SEQUENCES[key] = seq
+    return seq
 
 
-def all_cycle(scolors, frames=32, sleepinterval=0.1):
+def run_color_sequence(lighting, colors, sleepinterval, scheduler=None):
     """
-    all LED lighting do continuous cycle breathing
+    run a breathing type change sequence through once
+    sleepinterval is in seconds or fractions of seconds
+    pass the same scheduler to successive runs to keep them to the beat
+    returns the scheduler, whose achieved_rate is the rate kept
+    """
+    if scheduler is None:
+        scheduler = la.FrameScheduler(sleepinterval)
+    for idx in scheduler.ticks(len(colors)):
+        lighting.set_color(colors[idx])
+    return scheduler
+
+def continuous_cycle(lighti, startcolor, frames=32, sleepinterval=0.1,
+                     stop=None):
+    """
+    breathe in color saturation, until the stop token is set if given
+    colors go through a writer thread so the sleeps are not stretched
+    by the device calls
+    the rate achieved is recorded in the session's stats when it stops
+    """
+    seq = breathing_sequence(startcolor, frames)
+    lighti.session.stats.set_requested_rate(1.0 / sleepinterval)
+    writer = la.LatestValueWriter(lighti.session).start()
+    light = la.ASUSLighting(lighti.dll_path, lighti.lpos,
+                            session=lighti.session, writer=writer)
+    scheduler = la.FrameScheduler(sleepinterval, stop)
+    try:
+        while not scheduler.stopped():
+            run_color_sequence(light, seq, sleepinterval, scheduler)
+    finally:
+        writer.stop(flush=False)
+        lighti.session.stats.record_schedule(scheduler)
+
+def run_triple_sequence(lightlist, colorlist, sleeptime, scheduler=None):
     """
-    # make light and color lists
-    lights = [la.ASUSLighting(la.DPATH, la.LEFT_VERTICAL), \
-              la.ASUSLighting(la.DPATH, la.RIGHT_VERTICAL), \
-              la.ASUSLighting(la.DPATH, la.BASE_HORIZONTAL)]
-    clists = []
-    for idx in range(len(lights)):
-        gam, orig_idx = make_gamut(scolors[idx])
-        seq = dim_up_down_up_sequence(gam, orig_idx, frames)
-        clists.append(seq)
-
-    while True:
-        run_triple_sequence(lights, clists, sleepinterval)
-
+    do all 3 lights given list of all 3
+    each step is committed as one frame, so only changed lights are written
+    pass the same scheduler to successive runs to keep them to the beat
+    returns the scheduler, whose achieved_rate is the rate kept
+    """
+    if scheduler is None:
+        scheduler = la.FrameScheduler(sleeptime)
+    output = lightlist[0].output
+    positions = [light.lpos for light in lightlist]
+    frames = zip(*colorlist)
+
+    for idx in scheduler.ticks(len(frames)):
+        output.commit_frame(dict(zip(positions, frames[idx])))
+    return scheduler
+
+
+def all_cycle(scolors, frames=32, sleepinterval=0.1, stop=None, #pylint: disable-msg=R0913
+              perceptual=False, fade_seconds=0.0):
+    """
+    all LED lighting do continuous cycle breathing, until the stop token
+    is set if given
+    perceptual breathes with color_blend.breathing_curve, and
+    fade_seconds fades to the breathing from the colors last set
+    the rate achieved is recorded in the session's stats when it stops
+    """
+    # make light and color lists, the lights share one writer thread
+    session = la.get_session(la.DPATH)
+    session.stats.set_requested_rate(1.0 / sleepinterval)
+    writer = la.LatestValueWriter(session).start()
+    lights = [la.ASUSLighting(la.DPATH, la.LEFT_VERTICAL, writer=writer), \
+              la.ASUSLighting(la.DPATH, la.RIGHT_VERTICAL, writer=writer), \
+              la.ASUSLighting(la.DPATH, la.BASE_HORIZONTAL, writer=writer)]
+    clists = [breathing_sequence(color, frames, perceptual)
+              for color in scolors]
+
+    scheduler = la.FrameScheduler(sleepinterval, stop)
+    try:
+        steps = int(round(fade_seconds / sleepinterval))
+        if steps > 0:
+            starts = [session.requested.get(light.lpos, seq[0])
+                      for light, seq in zip(lights, clists)]
+            fade = cb.fade_sequence(starts, [seq[0] for seq in clists], steps)
+            run_triple_sequence(lights, fade.T, sleepinterval, scheduler)
+        while not scheduler.stopped():
+            run_triple_sequence(lights, clists, sleepinterval, scheduler)
+    finally:
+        writer.stop(flush=False)
+        session.stats.record_schedule(scheduler)
+
+
+def write_cycle_timeline(path, scolors, frames=32, sleepinterval=0.1,
+                         cycles=1):
+    """
+    write cycles of the all_cycle breathing to a timeline file
+    returns the number of frames written
+    """
+    zones = [la.LEFT_VERTICAL, la.RIGHT_VERTICAL, la.BASE_HORIZONTAL]
+    clists = [breathing_sequence(color, frames) for color in scolors]
+
+    def show():
+        """
+        (seconds, frame) of every step
+        """
+        step = 0
+        for _ in range(cycles):
+            for colors in zip(*clists):
+                yield step * sleepinterval, dict(zip(zones, colors))
+                step += 1
+
+    return timeline.write_timeline(path, show())
 
 
 if __name__ == '__main__':
     SCOL = 0x1111ff
     LLIGHT = la.ASUSLighting(la.DPATH, la.LEFT_VERTICAL)
-    continuous_cycle(LLIGHT, SCOL)
+    try:
+        continuous_cycle(LLIGHT, SCOL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        STATS = LLIGHT.session.stats
+        print "\n%.1f frames a second of %.1f requested, %d skipped" % (
+            STATS.scheduled_rate or 0.0, STATS.requested_rate,
+            STATS.schedule_skipped)
 
 
 
@@ -14,10 +14,122 @@ the G20aj LED lighting displays.
 The ASUS ACPI and dll's were analyzed by William Hererra, 2015
 """
 
-from ctypes import windll, create_string_buffer
+from ctypes import create_string_buffer
+from bisect import bisect_left
+from collections import deque
+import csv
+import json
 import os
+import sys
+import threading
+import time
+import traceback
 from time import sleep
 
+try:
+    from ctypes import windll
+except ImportError:
+    # not on Windows: only the simulated device backend is available
+    windll = None
+
+# best monotonic clock available: time.clock is the performance counter
+# on Windows under Python 2, but processor time elsewhere
+if hasattr(time, 'monotonic'):
+    timer = time.monotonic #pylint: disable-msg=C0103, E1101
+elif sys.platform == 'win32':
+    timer = time.clock #pylint: disable-msg=C0103
+else:
+    timer = time.time #pylint: disable-msg=C0103
+
+def sleep_until(deadline, stop=None):
+    """
+    sleep until the timer reaches deadline, returning at once if it has
+    with a stop token (see effect_worker), return early when it is set
+    returns whether it was set
+    """
+    while True:
+        remaining = deadline - timer()
+        if remaining <= 0:
+            return stop is not None and stop.stopped()
+        if stop is None:
+            sleep(remaining)
+        elif stop.wait(remaining):
+            return True
+
+class FrameScheduler(object):
+    """
+    Runs frames against absolute deadlines on the monotonic timer
+    Frame number n is due at interval * n after the first frame, counting
+    across every run of ticks, so time spent drawing a frame never delays
+    the ones after it. Frames whose time has passed are skipped, and
+    counted in skipped, rather than drawn late
+    With a stop token, ticks ends as soon as the token is set
+    """
+    def __init__(self, interval, stop=None):
+        self.interval = interval
+        self.stop = stop
+        self.start = None
+        self.index = 0
+        self.frames = 0
+        self.skipped = 0
+        self.first_frame = None
+        self.last_frame = None
+
+    def ticks(self, count=None):
+        """
+        generate frame numbers 0 to count - 1, or forever if count is
+        None, each at its deadline
+        frames may be skipped, but never the last one of a count
+        """
+        if self.start is None:
+            self.start = timer()
+        local = 0
+        while count is None or local < count:
+            if self.stopped():
+                return
+            if self.interval > 0:
+                if sleep_until(self.start + self.index * self.interval,
+                               self.stop):
+                    return
+                behind = int((timer() - self.start) / self.interval) - \
+                         self.index
+                if count is not None:
+                    behind = min(behind, count - 1 - local)
+                if behind > 0:
+                    self.skipped += behind
+                    self.index += behind
+                    local += behind
+            self.frames += 1
+            self.last_frame = timer()
+            if self.first_frame is None:
+                self.first_frame = self.last_frame
+            yield local
+            local += 1
+            self.index += 1
+
+    def stopped(self):
+        """
+        whether the stop token is set
+        """
+        return self.stop is not None and self.stop.stopped()
+
+    def elapsed(self):
+        """
+        seconds since the first frame
+        """
+        if self.start is None:
+            return 0.0
+        return timer() - self.start
+
+    def achieved_rate(self):
+        """
+        frames actually drawn per second from the first to the last,
+        None before two were
+        """
+        if self.frames < 2 or self.last_frame <= self.first_frame:
+            return None
+        return (self.frames - 1) / (self.last_frame - self.first_frame)
+
 # A convenient directory context management from stack overflow posting
 class ChangeDir(object): #pylint: disable-msg=C0103, R0903
     """
@@ -57,17 +169,500 @@ OEM-UNDOCUMENTED ASUS DLL API NOTES
 RIGHT_VERTICAL = 0xc00d0000
 LEFT_VERTICAL = 0xc00e0000
 BASE_HORIZONTAL = 0xc00c0000
+ZONES = (LEFT_VERTICAL, RIGHT_VERTICAL, BASE_HORIZONTAL)
+ZONE_NAMES = {LEFT_VERTICAL: 'left', RIGHT_VERTICAL: 'right',
+              BASE_HORIZONTAL: 'base'}
 
 # might not always be this
 DPATH = '/Program Files (x86)/ASUS/ASUS Manager/Lighting'
+DLLNAME = 'ACPIWMI.dll'
+# per-zone gamma and brightness caps, see color_tables, applied by every
+# session get_session opens if the file exists
+CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'calibration.json')
+
+
+class ACPIBackend(object):
+    """
+    Device backend calling ACPIWMI.dll
+    The dll is loaded and opened once, and its function pointers are kept,
+    so a write is a single foreign function call
+    """
+    def __init__(self, dll_path):
+        self.dll_path = dll_path
+        self.handle = None
+        self._device_control = None
+        self._device_status = None
+
+    def open(self):
+        """
+        load the dll from its directory and open the ACPI for calls
+        """
+        # the dll finds its own dependencies in the current directory
+        with ChangeDir(self.dll_path):
+            lib = windll.LoadLibrary(os.path.join(os.getcwd(), DLLNAME))
+            self.handle = lib.AsWMI_Open()
+        self._device_control = lib.AsWMI_DeviceControl
+        self._device_status = lib.AsWMI_GetDeviceStatus
+        return self.handle
+
+    def device_control(self, device, color):
+        """
+        change the lighting of one device
+        """
+        return self._device_control(device, color)
+
+    def get_device_status(self):
+        """
+        FIXME-- not working atm
+        """
+        buf = create_string_buffer('abcdefg')
+        self._device_status(self.handle, repr(buf.raw))
+
+    def close(self):
+        """
+        forget the dll function pointers
+        """
+        self._device_control = None
+        self._device_status = None
+        self.handle = None
+
+
+class SimulatedBackend(object):
+    """
+    In-process stand-in for ACPIWMI.dll, for machines without the hardware
+    Keeps the last color of each device and a count of writes, and can
+    sleep write_latency seconds per write to mimic the ACPI call
+    """
+    def __init__(self, write_latency=0.0):
+        self.write_latency = write_latency
+        self.handle = None
+        self.colors = {}
+        self.writes = 0
+
+    def open(self):
+        """
+        open the simulated device
+        """
+        self.handle = 1
+        return self.handle
+
+    def device_control(self, device, color):
+        """
+        record a lighting change
+        """
+        if self.write_latency > 0:
+            sleep(self.write_latency)
+        self.colors[device] = color
+        self.writes += 1
+        return 1
+
+    def get_device_status(self):
+        """
+        the real device status call is broken, so neither does this
+        """
+        return None
+
+    def close(self):
+        """
+        close the simulated device
+        """
+        self.handle = None
+
+
+def rgb_color(reds, greens, blues):
+    """
+    pack separate red, green, and blue values as a 0x00rrggbb color
+    """
+    return (blues & 255) + ((greens & 255) * 0x100) + ((reds & 255) * 0x10000)
+
+def make_backend(dll_path):
+    """
+    get the dll backend, or the simulated one where there is no windll
+    """
+    if windll is None:
+        return SimulatedBackend()
+    return ACPIBackend(dll_path)
+
+
+# upper bounds in seconds of the write latency histogram buckets,
+# doubling from 10 microseconds to about 1.3 seconds, then overflow
+LATENCY_BUCKETS = [0.00001 * 2 ** i for i in range(18)]
+
+def percentile(ordered, pct):
+    """
+    nearest rank percentile of a sorted list, None if it is empty
+    """
+    if not ordered:
+        return None
+    rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
+
+class DeviceStats(object): #pylint: disable-msg=R0902
+    """
+    Instrumentation of the device writes of a session:
+    per device call counts and latency histograms, frames committed
+    against the requested frame rate and the rate the effect's
+    FrameScheduler achieved, and coalesced or dropped writes
+    Latency percentiles are taken over the last max_samples writes
+    """
+    def __init__(self, max_samples=4096):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        clear all counts
+        """
+        with self.lock:
+            self.calls = {}
+            self.histograms = {}
+            self.samples = {}
+            self.frames = 0
+            self.coalesced = 0
+            self.dropped = 0
+            self.requested_rate = None
+            self.first_frame = None
+            self.last_frame = None
+            self.scheduled_rate = None
+            self.schedule_skipped = 0
+
+    def set_requested_rate(self, rate):
+        """
+        the frame rate in frames per second the effect is aiming for
+        """
+        self.requested_rate = rate
+
+    def record_write(self, device, seconds):
+        """
+        count one device call and its latency
+        """
+        with self.lock:
+            if device not in self.calls:
+                self.calls[device] = 0
+                self.histograms[device] = [0] * (len(LATENCY_BUCKETS) + 1)
+                self.samples[device] = deque(maxlen=self.max_samples)
+            self.calls[device] += 1
+            self.histograms[device][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.samples[device].append(seconds)
+
+    def record_frame(self, skipped=0):
+        """
+        count one committed frame, and the device writes it skipped
+        """
+        now = timer()
+        with self.lock:
+            if self.first_frame is None:
+                self.first_frame = now
+            self.last_frame = now
+            self.frames += 1
+            self.coalesced += skipped
+
+    def record_schedule(self, scheduler):
+        """
+        note the rate a FrameScheduler driving the frames achieved, and
+        the frames it skipped
+        """
+        with self.lock:
+            self.scheduled_rate = scheduler.achieved_rate()
+            self.schedule_skipped = scheduler.skipped
+
+    def record_dropped(self, count=1):
+        """
+        count colors replaced before they were written
+        """
+        with self.lock:
+            self.dropped += count
+
+    def achieved_rate(self):
+        """
+        frames per second actually committed, None before two frames
+        """
+        if self.frames < 2 or self.last_frame <= self.first_frame:
+            return None
+        return (self.frames - 1) / (self.last_frame - self.first_frame)
+
+    def latency_summary(self, device):
+        """
+        calls, mean and p50/p95/p99 latency in seconds for a device
+        """
+        with self.lock:
+            ordered = sorted(self.samples.get(device, ()))
+            calls = self.calls.get(device, 0)
+            histogram = list(self.histograms.get(device, ()))
+        mean = sum(ordered) / len(ordered) if ordered else None
+        return {'calls': calls,
+                'mean': mean,
+                'p50': percentile(ordered, 50),
+                'p95': percentile(ordered, 95),
+                'p99': percentile(ordered, 99),
+                'histogram': histogram}
+
+    def summary(self):
+        """
+        all of the numbers as a dict, zones keyed by name
+        """
+        zones = {}
+        for device in list(self.calls):
+            name = ZONE_NAMES.get(device, hex(device))
+            zones[name] = self.latency_summary(device)
+        return {'zones': zones,
+                'frames': self.frames,
+                'requested_rate': self.requested_rate,
+                'achieved_rate': self.achieved_rate(),
+                'scheduled_rate': self.scheduled_rate,
+                'schedule_skipped': self.schedule_skipped,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'latency_buckets': LATENCY_BUCKETS}
+
+    def dump(self, path):
+        """
+        write the summary to path, as CSV if it ends in .csv, else JSON
+        """
+        summ = self.summary()
+        if not path.lower().endswith('.csv'):
+            with open(path, 'w') as outfile:
+                json.dump(summ, outfile, indent=2, sort_keys=True)
+            return
+        with open(path, 'wb') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(['zone', 'calls', 'mean', 'p50', 'p95', 'p99'])
+            for name, zone in sorted(summ['zones'].items()):
+                writer.writerow([name, zone['calls'], zone['mean'],
+                                 zone['p50'], zone['p95'], zone['p99']])
+            for key in ('frames', 'requested_rate', 'achieved_rate',
+                        'scheduled_rate', 'schedule_skipped', 'coalesced',
+                        'dropped'):
+                writer.writerow([key, summ[key]])
+
+
+class DeviceSession(object):
+    """
+    Long-lived open device shared by all of the lighting zones
+    Keeps a shadow copy of the last color written to each device, and
+    DeviceStats of the writes
+    With a calibration, such as a color_tables.ZoneCalibration, every
+    color is passed through its apply_color before it is written;
+    requested keeps the last color each device was given before that
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.handle = backend.open()
+        self.calibration = None
+        self.shadow = {}
+        self.requested = {}
+        self.stats = DeviceStats()
+        self.lock = threading.Lock()
+
+    def _write(self, device, color):
+        """
+        one timed device call, with the lock held
+        """
+        start = timer()
+        self.backend.device_control(device, color)
+        self.stats.record_write(device, timer() - start)
+        self.shadow[device] = color
+
+    def set_color(self, device, color):
+        """
+        set color of one device's LED light
+        """
+        color = int(color)
+        self.requested[device] = color
+        if self.calibration is not None:
+            color = self.calibration.apply_color(device, color)
+        with self.lock:
+            self._write(device, color)
+
+    def commit_frame(self, frame, force=False):
+        """
+        set a whole frame, a dict of device to color, at once
+        Only devices whose color differs from the last one written are
+        sent to the backend, unless force is set
+        Returns the number of device writes made
+        """
+        writes = 0
+        with self.lock:
+            for device, color in frame.items():
+                color = int(color)
+                self.requested[device] = color
+                if self.calibration is not None:
+                    color = self.calibration.apply_color(device, color)
+                if not force and self.shadow.get(device) == color:
+                    continue
+                self._write(device, color)
+                writes += 1
+        self.stats.record_frame(len(frame) - writes)
+        return writes
+
+    def invalidate(self):
+        """
+        forget the shadow colors, so the next frame writes every device
+        """
+        with self.lock:
+            self.shadow.clear()
+
+    def get_device_status(self):
+        """
+        query the device status
+        """
+        return self.backend.get_device_status()
+
+    def close(self):
+        """
+        release the backend
+        """
+        self.backend.close()
+
+
+class LatestValueWriter(object):
+    """
+    Background thread committing the newest color of each device
+    Producers never block on the device: there is one slot per device, and
+    a color submitted before the previous one was written replaces it and
+    is counted in dropped
+    Has the set_color and commit_frame calls of a DeviceSession, so it can
+    stand in for one
+    A write that raises is reported, counted in errors and kept in
+    last_error, and the thread goes on writing
+    """
+    def __init__(self, session):
+        self.session = session
+        self.pending = {}
+        self.submitted = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self.running = False
+        self.thread = None
+        self.cond = threading.Condition()
+
+    def start(self):
+        """
+        start the writer thread
+        """
+        with self.cond:
+            if self.running:
+                return self
+            self.running = True
+        self.thread = threading.Thread(target=self._write_loop,
+                                       name='LatestValueWriter')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def commit_frame(self, frame):
+        """
+        queue a frame, a dict of device to color, without waiting
+        """
+        with self.cond:
+            dropped = 0
+            for device, color in frame.items():
+                if device in self.pending:
+                    dropped += 1
+                self.pending[device] = color
+            self.submitted += len(frame)
+            self.dropped += dropped
+            self.cond.notify()
+        if dropped:
+            self.session.stats.record_dropped(dropped)
+
+    def set_color(self, device, color):
+        """
+        queue one device's color without waiting
+        """
+        self.commit_frame({device: color})
+
+    def _write_loop(self):
+        """
+        take whatever is in the slots and write it, until stopped
+        """
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                frame = self.pending
+                self.pending = {}
+            try:
+                self.session.commit_frame(frame)
+            except Exception as error: #pylint: disable-msg=W0703
+                # a failed write must not stop the later ones
+                self.errors += 1
+                self.last_error = error
+                traceback.print_exc()
+
+    def stop(self, flush=True):
+        """
+        stop the writer thread, writing the last queued colors if flush
+        """
+        with self.cond:
+            self.running = False
+            if not flush:
+                self.pending = {}
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+_SESSIONS = {}
+
+def get_session(dll_path=None, backend=None):
+    """
+    get the shared session for the dll in dll_path, opening it if needed
+    A backend given here replaces the session for that path
+    """
+    if dll_path is None:
+        dll_path = DPATH
+    session = _SESSIONS.get(dll_path)
+    if session is None or backend is not None:
+        if session is not None:
+            session.close()
+        if backend is None:
+            backend = make_backend(dll_path)
+        session = DeviceSession(backend)
+        session.calibration = load_calibration()
+        _SESSIONS[dll_path] = session
+    return session
+
+def load_calibration(path=None):
+    """
+    the color_tables.ZoneCalibration in the JSON file at path, by default
+    CALIBRATION_PATH, or None if there is no such file
+    """
+    if path is None:
+        path = CALIBRATION_PATH
+    if not os.path.exists(path):
+        return None
+    # color_tables needs numpy, and imports this module
+    import color_tables as ctab
+    return ctab.ZoneCalibration.load(path)
+
+def close_sessions():
+    """
+    close all open device sessions
+    """
+    for session in _SESSIONS.values():
+        session.close()
+    _SESSIONS.clear()
+
 
 class ASUSLighting(object): #pylint: disable-msg=C0103
     """
     Class to set ASUS G20aj lighting colors
+    With a LatestValueWriter, colors are queued to it instead of written
     """
-    def __init__(self, dll_path, light_position):
+    def __init__(self, dll_path, light_position, session=None, writer=None):
         self.dll_path = dll_path
         self.lpos = light_position
+        if session is None:
+            session = get_session(dll_path)
+        self.session = session
+        self.output = session if writer is None else writer
         self.color = self.get_color()
 
     def get_color(self):
@@ -75,10 +670,7 @@ class ASUSLighting(object): #pylint: disable-msg=C0103
         Get current color of the LED light
         FIXME-- not working atm
         """
-        with ChangeDir(self.dll_path):
-            dhand = windll.ACPIWMI.AsWMI_Open()
-            buf = create_string_buffer('abcdefg')
-            windll.ACPIWMI.AsWMI_GetDeviceStatus(dhand, repr(buf.raw))
+        return self.session.get_device_status()
 
     def set_color(self, color):
         """
@@ -87,17 +679,13 @@ class ASUSLighting(object): #pylint: disable-msg=C0103
           and bb the blue values of an RGB coded color
         Black is 0, white is 0x00ffffff
         """
-        with ChangeDir(self.dll_path):
-            windll.ACPIWMI.AsWMI_DeviceControl(self.lpos, color)
+        self.output.set_color(self.lpos, color)
 
     def set_rgb(self, reds, greens, blues):
         """
         Set RGB color as separate red, green, and blue values
         """
-        rgb_color = (blues & 255) + \
-                    ((greens & 255) * 0x100) + \
-                    ((reds & 255) * 0x10000)
-        self.set_color(rgb_color)
+        self.set_color(rgb_color(reds, greens, blues))
 
 
 if __name__ == '__main__':
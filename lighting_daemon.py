@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 lighting daemon for the ASUS G20aj, sharing the lights
+between effects
+
+IMPORTANT: run as administrator
+
+Effects run together in one process as generators, stepped in turn by a
+single event loop, and are assigned to zones with priorities: a zone
+shows the highest priority effect assigned to it, and falls back to the
+next one when that effect is removed. Only the daemon writes to the
+device, through one writer thread, so effects never fight over
+AsWMI_DeviceControl or write colors nobody sees.
+
+An effect is a generator yielding (frame, wait) pairs: frame is a dict
+of light position to color, or None for no change, and wait is the
+seconds until the effect wants to run again.
+
+Usage:
+    python lighting_daemon.py --sound base --clock left,right
+    python lighting_daemon.py --breathe all --colors ff0000,0000ff,00ff00
+    python lighting_daemon.py --clock all --stats clock_stats.json
+
+"""
+
+import argparse
+import heapq
+import sys
+import threading
+import time
+
+import light_acpi as la
+import asus_light_clock as alc
+import asus_soundlighting as asl
+import audio_capture as acap
+import color_blend as cb
+import color_tables as ctab
+import hyperventilate as hv
+
+ZONES_BY_NAME = {'left': la.LEFT_VERTICAL, 'right': la.RIGHT_VERTICAL,
+                 'base': la.BASE_HORIZONTAL}
+# longest sleep of the event loop, so stop and new effects are noticed
+MAX_WAIT = 0.1
+
+
+def clock_effect(table=None):
+    """
+    the asus_light_clock colors, changing at each wall clock second
+    """
+    if table is None:
+        table = alc.make_day_table()
+    while True:
+        now = time.time()
+        cbase, cleft, cright = table[alc.second_of_day(time.localtime(now))]
+        yield {la.LEFT_VERTICAL: cleft,
+               la.RIGHT_VERTICAL: cright,
+               la.BASE_HORIZONTAL: cbase}, int(now) + 1 - time.time()
+
+def breathing_effect(scolors, frames=30, bpm=15, perceptual=False):
+    """
+    the hyperventilate.all_cycle breathing of the left, right and base
+    start colors, at bpm breaths a minute
+    Frames are taken from the time since the effect started, so the
+    rate holds however late the effect is run
+    """
+    zones = (la.LEFT_VERTICAL, la.RIGHT_VERTICAL, la.BASE_HORIZONTAL)
+    clists = [hv.breathing_sequence(color, frames, perceptual)
+              for color in scolors]
+    interval = 60.0 / (bpm * frames)
+    start = la.timer()
+    while True:
+        beat = (la.timer() - start) / interval
+        idx = int(beat) % frames
+        yield (dict((zone, seq[idx]) for zone, seq in zip(zones, clists)),
+               (int(beat) + 1 - beat) * interval)
+
+def sound_effect(capture, stereo=None):
+    """
+    the asus_soundlighting colors for each hop of an
+    audio_capture.CallbackCapture, which is closed with the effect
+    """
+    maker = asl.SoundFrameMaker(capture.samplerate, stereo=stereo,
+                                hop=capture.hop)
+    poll_wait = capture.hop / (4.0 * capture.samplerate)
+    try:
+        while True:
+            frames = capture.poll()
+            if frames is None:
+                yield None, poll_wait
+            else:
+                yield maker.make_frame(frames), 0
+    finally:
+        capture.close()
+
+
+class EffectSlot(object): #pylint: disable-msg=R0903
+    """
+    An effect, the zones it is assigned, and the colors it last gave them
+    """
+    def __init__(self, name, effect, zones, priority, order): #pylint: disable-msg=R0913
+        self.name = name
+        self.effect = effect
+        self.zones = frozenset(zones)
+        self.priority = priority
+        self.order = order
+        self.colors = {}
+
+
+class LightingDaemon(object):
+    """
+    Event loop stepping effects and committing their colors to output,
+    a light_acpi session or LatestValueWriter that only it writes to
+    Effects may be added and removed from other threads while it runs
+    """
+    def __init__(self, output):
+        self.output = output
+        self.slots = {}
+        self.owners = {}
+        self.queue = []
+        self.frame = {}
+        self.closing = []
+        self.order = 0
+        self.running = False
+        self.lock = threading.Lock()
+
+    def add_effect(self, name, effect, zones, priority=0, fade=0.0): #pylint: disable-msg=R0913
+        """
+        run effect on zones, replacing any effect of the same name
+        among effects on a zone, the highest priority one is shown, or
+        if they are equal the one added last
+        fade is the seconds to cross-fade from the effect replaced
+        """
+        with self.lock:
+            if name in self.slots:
+                old = self.slots.pop(name)
+                if fade > 0:
+                    effect = cb.crossfade_effect(old.effect, effect, fade)
+                else:
+                    self.closing.append(old)
+            self.order += 1
+            slot = EffectSlot(name, effect, zones, priority, self.order)
+            self.slots[name] = slot
+            heapq.heappush(self.queue, (la.timer(), slot.order, slot))
+            self._reassign()
+        return slot
+
+    def remove_effect(self, name):
+        """
+        stop the named effect, its zones fall back to other effects
+        """
+        with self.lock:
+            slot = self.slots.pop(name, None)
+            if slot is not None:
+                self.closing.append(slot)
+                self._reassign()
+
+    def _reassign(self):
+        """
+        find the owner of each zone, showing its colors if it has any
+        """
+        owners = {}
+        for slot in self.slots.values():
+            for zone in slot.zones:
+                best = owners.get(zone)
+                if best is None or (slot.priority, slot.order) > \
+                        (best.priority, best.order):
+                    owners[zone] = slot
+        for zone, slot in owners.items():
+            if self.owners.get(zone) is not slot and zone in slot.colors:
+                self.frame[zone] = slot.colors[zone]
+        self.owners = owners
+
+    def step(self):
+        """
+        run every effect that is due, commit the zones that changed, and
+        return the timer value when the next effect is due, or None
+        """
+        with self.lock:
+            closing, self.closing = self.closing, []
+        for slot in closing:
+            slot.effect.close()
+
+        now = la.timer()
+        ran = []
+        while True:
+            with self.lock:
+                if not self.queue or self.queue[0][0] > now:
+                    break
+                _, _, slot = heapq.heappop(self.queue)
+                if self.slots.get(slot.name) is not slot:
+                    continue
+            try:
+                frame, wait = next(slot.effect)
+            except StopIteration:
+                self.remove_effect(slot.name)
+                continue
+            with self.lock:
+                if frame:
+                    for zone, color in frame.items():
+                        if zone not in slot.zones:
+                            continue
+                        slot.colors[zone] = color
+                        if self.owners.get(zone) is slot:
+                            self.frame[zone] = color
+            ran.append((now + max(wait, 0), slot.order, slot))
+
+        with self.lock:
+            # effects run again on a later step, even if they did not wait
+            for entry in ran:
+                if self.slots.get(entry[2].name) is entry[2]:
+                    heapq.heappush(self.queue, entry)
+            frame, self.frame = self.frame, {}
+            next_due = self.queue[0][0] if self.queue else None
+        if frame:
+            self.output.commit_frame(frame)
+        return next_due
+
+    def run(self):
+        """
+        step the effects until stop is called
+        """
+        self.running = True
+        try:
+            while self.running:
+                next_due = self.step()
+                wait = MAX_WAIT if next_due is None else \
+                       min(next_due - la.timer(), MAX_WAIT)
+                if wait > 0:
+                    time.sleep(wait)
+        finally:
+            self.close()
+
+    def stop(self):
+        """
+        make run return, from another thread
+        """
+        self.running = False
+
+    def close(self):
+        """
+        close every effect
+        """
+        with self.lock:
+            slots = self.closing + self.slots.values()
+            self.closing = []
+            self.slots = {}
+            self.owners = {}
+            self.queue = []
+        for slot in slots:
+            slot.effect.close()
+
+
+def parse_zones(text):
+    """
+    list of light positions for comma separated zone names, or all
+    """
+    if text == 'all':
+        return list(la.ZONES)
+    return [ZONES_BY_NAME[name.strip()] for name in text.split(',')]
+
+def main(argv=None):
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sound', metavar='ZONES',
+                        help='zones for sound lighting, e.g. base')
+    parser.add_argument('--breathe', metavar='ZONES',
+                        help='zones for breathing, e.g. all')
+    parser.add_argument('--clock', metavar='ZONES',
+                        help='zones for the clock, e.g. left,right')
+    parser.add_argument('--colors', default='ff0000,0000ff,00ff00',
+                        help='left, right and base breathing colors')
+    parser.add_argument('--bpm', type=int, default=15,
+                        help='breaths per minute')
+    parser.add_argument('--perceptual', action='store_true',
+                        help='breathe evenly in brightness, in 20 frames')
+    parser.add_argument('--device', type=int, default=asl.DEVICE_NUMBER,
+                        help='audio input device number')
+    parser.add_argument('--stereo', action='store_true',
+                        help='sound lights left and right by channel')
+    parser.add_argument('--calibration', metavar='FILE',
+                        help='JSON of per-zone gamma and brightness caps, '
+                        'instead of calibration.json')
+    parser.add_argument('--stats', metavar='FILE',
+                        help='on exit, write the device write stats here, '
+                        'as CSV if it ends in .csv, else JSON')
+    args = parser.parse_args(argv)
+
+    session = la.get_session(la.DPATH)
+    if args.calibration:
+        session.calibration = ctab.ZoneCalibration.load(args.calibration)
+    writer = la.LatestValueWriter(session).start()
+    daemon = LightingDaemon(writer)
+    # sound over breathing over the clock, where they share zones
+    if args.clock:
+        daemon.add_effect('clock', clock_effect(), parse_zones(args.clock))
+    if args.breathe:
+        colors = [int(color, 16) for color in args.colors.split(',')]
+        frames = 20 if args.perceptual else 30
+        daemon.add_effect('breathe',
+                          breathing_effect(colors, frames, args.bpm,
+                                           args.perceptual),
+                          parse_zones(args.breathe), priority=1)
+    if args.sound:
+        samplerate = 44100
+        capture = acap.CallbackCapture(
+            args.device, samplerate, asl.CHANNELS, 2**asl.CHUNK_EXPONENT,
+            int(samplerate * (asl.HOP_MS or 25) / 1000.0))
+        daemon.add_effect('sound', sound_effect(capture, args.stereo),
+                          parse_zones(args.sound), priority=2)
+
+    print "Lighting daemon running, use Ctrl+C to stop"
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+        writer.stop()
+        if args.stats:
+            session.stats.dump(args.stats)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
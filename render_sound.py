@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 code to render the ASUS G20 sound lighting of an audio file
+
+Streams a WAV or raw 16 bit PCM file through the asus_soundlighting
+analysis one hop at a time, without playing it, and writes the lighting
+as a timeline of per-zone colors. Runs faster than real time, and needs
+neither pyaudio nor the lighting hardware.
+
+Usage:
+    python render_sound.py song.wav song_lights.csv
+    python render_sound.py --raw --rate 44100 --channels 2 song.pcm out.csv
+    python render_sound.py song.wav song.lights   binary timeline to play
+
+"""
+
+import argparse
+import sys
+import wave
+
+import numpy
+
+import light_acpi as lacpi
+import asus_soundlighting as asl
+import timeline
+from audio_capture import pcm_frames
+
+
+def pcm_windows(read_frames, channels, window, hop):
+    """
+    generate (end, window) pairs every hop frames from read_frames(count),
+    which returns up to count frames of raw PCM data and an empty string
+    at the end of the file
+    each window is a (window, channels) array of the frames before the
+    frame numbered end, and is reused for the next one
+    """
+    if hop <= 0:
+        hop = window
+    buf = numpy.zeros((window, channels), dtype='<i2')
+    have = 0
+    while True:
+        frames = pcm_frames(read_frames(hop), channels)
+        count = len(frames)
+        if count == 0:
+            return
+        if count >= window:
+            buf[:] = frames[-window:]
+        else:
+            buf[:-count] = buf[count:]
+            buf[-count:] = frames
+        have += count
+        if have >= window:
+            yield have, buf
+        if count < hop:
+            return
+
+def wav_windows(path, window=2**asl.CHUNK_EXPONENT, hop_ms=0):
+    """
+    (samplerate, hop, windows) for a 16 bit WAV file, where windows
+    generates its pcm_windows and closes the file at the end
+    """
+    wav = wave.open(path, 'rb')
+    if wav.getsampwidth() != 2:
+        wav.close()
+        raise ValueError("%s is not 16 bit PCM" % path)
+    samplerate = wav.getframerate()
+    hop = int(samplerate * hop_ms / 1000.0)
+
+    def generate():
+        """
+        the windows, closing the file at the end
+        """
+        try:
+            for item in pcm_windows(wav.readframes, wav.getnchannels(),
+                                    window, hop):
+                yield item
+        finally:
+            wav.close()
+
+    return samplerate, hop, generate()
+
+def raw_windows(path, samplerate=44100, channels=asl.CHANNELS,
+                window=2**asl.CHUNK_EXPONENT, hop_ms=0):
+    """
+    (samplerate, hop, windows) for a headerless little-endian 16 bit
+    PCM file, as for wav_windows
+    """
+    hop = int(samplerate * hop_ms / 1000.0)
+    framesize = 2 * channels
+
+    def generate():
+        """
+        the windows, closing the file at the end
+        """
+        with open(path, 'rb') as infile:
+            for item in pcm_windows(
+                    lambda count: infile.read(count * framesize),
+                    channels, window, hop):
+                yield item
+
+    return samplerate, hop, generate()
+
+def render_timeline(windows, samplerate, **settings):
+    """
+    generate (seconds, frame) from (end, window) pairs, timed at the end
+    of each window
+    frame is a dict of light position to color, as for the live effect,
+    and settings are asus_soundlighting.SoundFrameMaker keyword arguments
+    """
+    ends = []
+
+    def arrays():
+        """
+        the windows, noting where each one ends
+        """
+        for end, frames in windows:
+            ends.append(end)
+            yield frames
+
+    for frame in asl.sound_frames(arrays(), samplerate, **settings):
+        seconds = float(ends.pop()) / samplerate
+        yield seconds, dict((pos, int(color)) for pos, color in frame.items())
+
+def write_timeline_csv(timeline, outfile):
+    """
+    write (seconds, frame) entries as CSV, colors as 0xrrggbb
+    returns the number of frames written
+    """
+    outfile.write("seconds,base,left,right\n")
+    count = 0
+    for seconds, frame in timeline:
+        outfile.write("%.6f,0x%06x,0x%06x,0x%06x\n" % (
+            seconds, frame[lacpi.BASE_HORIZONTAL],
+            frame[lacpi.LEFT_VERTICAL], frame[lacpi.RIGHT_VERTICAL]))
+        count += 1
+    return count
+
+def main(argv=None):
+    """
+    command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('infile', help='WAV, or raw PCM with --raw')
+    parser.add_argument('outfile', help='timeline to write, binary if it '
+                        'ends in ' + timeline.TIMELINE_EXT + ', else CSV')
+    parser.add_argument('--raw', action='store_true',
+                        help='input is headerless 16 bit little-endian PCM')
+    parser.add_argument('--rate', type=int, default=44100,
+                        help='samplerate of raw input')
+    parser.add_argument('--channels', type=int, default=asl.CHANNELS,
+                        help='channels of raw input')
+    parser.add_argument('--chunk-exponent', type=int,
+                        default=asl.CHUNK_EXPONENT,
+                        help='analysis window is 2**this frames')
+    parser.add_argument('--hop-ms', type=float, default=asl.HOP_MS,
+                        help='milliseconds between frames, 0 for a window')
+    parser.add_argument('--stereo', action='store_true',
+                        help='light left and right from their own channels')
+    parser.add_argument('--beats', action='store_true',
+                        help='flash the lights on beats')
+    parser.add_argument('--attack-ms', type=float, default=0.0,
+                        help='milliseconds for the levels to rise')
+    parser.add_argument('--release-ms', type=float, default=0.0,
+                        help='milliseconds for the levels to fall')
+    parser.add_argument('--layout', default='classic',
+                        help='band layout, one of %s, or comma separated '
+                        'edges in Hz' % ', '.join(asl.BAND_LAYOUTS))
+    parser.add_argument('--bands', type=int, default=asl.SEGMENTS,
+                        help='number of log or mel bands')
+    args = parser.parse_args(argv)
+
+    window = 2**args.chunk_exponent
+    if args.raw:
+        samplerate, hop, windows = raw_windows(args.infile, args.rate,
+                                               args.channels, window,
+                                               args.hop_ms)
+    else:
+        samplerate, hop, windows = wav_windows(args.infile, window,
+                                               args.hop_ms)
+
+    layout = args.layout
+    if ',' in layout:
+        layout = [float(edge) for edge in layout.split(',')]
+    frames = render_timeline(windows, samplerate, stereo=args.stereo,
+                             band_edges=asl.make_band_edges(
+                                 layout, args.bands, samplerate=samplerate),
+                             beats=args.beats, hop=hop or None,
+                             attack=args.attack_ms / 1000.0,
+                             release=args.release_ms / 1000.0)
+    if args.outfile.endswith(timeline.TIMELINE_EXT):
+        count = timeline.write_timeline(args.outfile, frames)
+    else:
+        with open(args.outfile, 'w') as outfile:
+            count = write_timeline_csv(frames, outfile)
+    print "Rendered %d frames to %s" % (count, args.outfile)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+tests of analysis_process without a sound card, the sound streams of
+SoundPipeline coming from a stand-in for pyaudio
+"""
+
+import multiprocessing
+import threading
+import time
+import unittest
+
+import numpy
+
+import light_acpi as la
+import audio_devices as adev
+import asus_soundlighting as asl
+import analysis_process as ap
+from effect_worker import StopToken
+
+
+class StubStream(object):
+    """
+    input stream of StubPyAudio, given sound by feed instead of a device
+    """
+    def __init__(self, device, channels, callback):
+        self.device = device
+        self.channels = channels
+        self.callback = callback
+        self.active = True
+        self.closed = False
+
+    def feed(self, frames):
+        """
+        pass frames of a quiet chord to the stream callback
+        """
+        times = numpy.arange(frames) / 44100.0
+        wave = 3000 * numpy.sin(2 * numpy.pi * 440.0 * times) + \
+               1000 * numpy.sin(2 * numpy.pi * 3000.0 * times)
+        data = numpy.repeat(wave.astype('<i2'), self.channels)
+        self.callback(data.tostring(), frames, None, 0)
+
+    def stop_stream(self):
+        if self.closed:
+            raise RuntimeError("stream is closed")
+        self.active = False
+
+    def start_stream(self):
+        if self.closed:
+            raise RuntimeError("stream is closed")
+        self.active = True
+
+    def close(self):
+        self.active = False
+        self.closed = True
+
+
+class StubPyAudio(object):
+    """
+    stand-in for the pyaudio module and its PyAudio class, opening
+    StubStreams, and failing for the devices in failing
+    """
+    paInt16 = 8
+    paInputOverflow = 2
+    paContinue = 0
+
+    def __init__(self):
+        self.streams = []
+        self.failing = set()
+
+    def PyAudio(self): #pylint: disable-msg=C0103
+        return self
+
+    def open(self, **settings):
+        device = settings['input_device_index']
+        if device in self.failing:
+            raise IOError("Invalid input device %d" % device)
+        stream = StubStream(device, settings['channels'],
+                            settings['stream_callback'])
+        self.streams.append(stream)
+        return stream
+
+    def terminate(self):
+        pass
+
+
+class CommandQueue(object):
+    """
+    the receiving end of a connection, with the commands put on it
+    """
+    def __init__(self):
+        self.commands = []
+
+    def put(self, name, config=None):
+        self.commands.append((name, config))
+
+    def poll(self, timeout=0.0):
+        if not self.commands:
+            time.sleep(timeout)
+        return bool(self.commands)
+
+    def recv(self):
+        return self.commands.pop(0)
+
+
+class FrameRingTest(unittest.TestCase):
+    """
+    the ring of frames in shared memory
+    """
+    def test_latest(self):
+        ring = ap.FrameRing(capacity=4)
+        self.assertTrue(ring.latest() is None)
+        for idx in range(6):
+            ring.append(dict((zone, idx) for zone in la.ZONES))
+        written, frame = ring.latest()
+        self.assertEqual(written, 6)
+        self.assertEqual(set(frame.values()), set([5]))
+        self.assertTrue(ring.latest(6) is None)
+
+
+class ConfigCheckTest(unittest.TestCase):
+    """
+    settings checked before they are sent to the child
+    """
+    def test_check_config(self):
+        config = asl.make_config(window=ap.MAX_WINDOW, hop=44100)
+        ap.check_config(config)
+        self.assertRaises(ValueError, ap.check_config,
+                          config._replace(window=2 * ap.MAX_WINDOW))
+        self.assertRaises(ValueError, ap.check_config,
+                          config._replace(hop=44101))
+
+    def test_update_keeps_config_on_error(self):
+        session = ap.SoundLightSession(asl.make_config(hop=1024))
+        self.assertRaises(ValueError, session.update, hop=100000)
+        self.assertRaises(ValueError, session.update, stereo='maybe')
+        self.assertRaises(ValueError, session.update, samplerate=150,
+                          band_layout='log')
+        self.assertEqual(session.config.hop, 1024)
+        self.assertEqual(session.update(stereo='true').stereo, True)
+        self.assertTrue(session.take_error() is None)
+
+
+
+class SoundPipelineTest(unittest.TestCase):
+    """
+    SoundPipeline changing its config while it runs
+    """
+    def setUp(self):
+        self.saved_pyaudio = adev.pyaudio
+        self.pyaudio = StubPyAudio()
+        adev.pyaudio = self.pyaudio
+        self.config = asl.make_config(device=1, window=4096, hop=1024)
+        self.errors, self.error_sender = multiprocessing.Pipe(duplex=False)
+        self.pipeline = ap.SoundPipeline(self.config, self.error_sender)
+
+    def tearDown(self):
+        self.pipeline.close()
+        adev.pyaudio = self.saved_pyaudio
+
+    def stream(self):
+        """
+        the stream the pipeline is taking sound from
+        """
+        return self.pipeline.capture.stream
+
+    def test_retime_keeps_stream(self):
+        stream = self.stream()
+        config = asl.make_config(self.config, window=8192, hop=441,
+                                 release=0.1)
+        self.assertFalse(self.pipeline.command('config', config))
+        self.assertIs(self.stream(), stream)
+        self.assertEqual(len(self.pyaudio.streams), 1)
+        capture = self.pipeline.capture
+        self.assertEqual((capture.window, capture.hop), (8192, 441))
+        self.assertEqual(self.pipeline.maker.hop, 441)
+        self.assertEqual(self.pipeline.maker.release, 0.1)
+        self.assertEqual(self.pipeline.config, config)
+
+    def test_device_change_reopens(self):
+        old = self.stream()
+        config = asl.make_config(self.config, device=3)
+        self.assertTrue(self.pipeline.command('config', config))
+        self.assertTrue(old.closed)
+        self.assertEqual(self.stream().device, 3)
+        self.assertTrue(self.stream().active)
+        self.assertEqual(self.pipeline.config, config)
+        self.assertFalse(self.errors.poll())
+
+    def test_bad_device_restores_stream(self):
+        self.pyaudio.failing.add(99)
+        config = asl.make_config(self.config, device=99)
+        # the windows end, as the stream was opened again
+        self.assertTrue(self.pipeline.command('config', config))
+        self.assertEqual(self.stream().device, 1)
+        self.assertFalse(self.stream().closed)
+        self.assertEqual(self.pipeline.config, self.config)
+        self.assertTrue(self.errors.poll(1.0))
+        self.assertEqual(self.errors.recv(),
+                         "IOError: Invalid input device 99")
+
+    def test_bad_retime_keeps_config(self):
+        config = asl.make_config(self.config, window=2 * ap.MAX_WINDOW,
+                                 rotation_interval=5)
+        self.assertFalse(self.pipeline.command('config', config))
+        self.assertEqual(self.pipeline.config, self.config)
+        self.assertEqual(self.pipeline.maker.rotation_interval,
+                         self.config.rotation_interval)
+        self.assertTrue(self.errors.recv().startswith("ValueError"))
+
+    def test_error_raised_without_connection(self):
+        pipeline = ap.SoundPipeline(self.config)
+        try:
+            self.pyaudio.failing.add(99)
+            self.assertRaises(IOError, pipeline.command, 'config',
+                              asl.make_config(self.config, device=99))
+        finally:
+            pipeline.close()
+
+    def test_pause_resume(self):
+        stream = self.stream()
+        self.assertTrue(self.pipeline.command('pause', None))
+        self.assertFalse(stream.active)
+        self.assertTrue(self.pipeline.paused)
+        # a new device while paused opens a paused stream
+        config = asl.make_config(self.config, device=2)
+        self.pipeline.command('config', config)
+        self.assertFalse(self.stream().active)
+        self.assertTrue(self.pipeline.command('resume', config))
+        self.assertTrue(self.stream().active)
+        self.assertFalse(self.pipeline.paused)
+
+    def test_paused_restore_failure(self):
+        self.pipeline.command('pause', None)
+        self.pyaudio.failing.update([1, 99])
+        config = asl.make_config(self.config, device=99)
+        self.pipeline.errors = None
+        # the error of opening the old device again, not one of pausing
+        # the closed stream
+        self.assertRaises(IOError, self.pipeline.command, 'config', config)
+        self.assertTrue(self.pipeline.capture.closed)
+
+    def later(self, action):
+        """
+        run action soon, from another thread, as the stream callback is
+        """
+        timer = threading.Timer(0.1, action)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def feed_newest(self):
+        """
+        feed a window of sound to the newest stream
+        """
+        self.pyaudio.streams[-1].feed(4096)
+
+    def test_frames_follow_commands(self):
+        commands = CommandQueue()
+        stop = StopToken()
+        frames = self.pipeline.frames(stop, commands)
+        self.stream().feed(4096)
+        self.assertEqual(sorted(next(frames)), sorted(la.ZONES))
+        # the next frame comes from the new stream
+        config = asl.make_config(self.config, device=2)
+        commands.put('config', config)
+        self.later(self.feed_newest)
+        self.assertEqual(sorted(next(frames)), sorted(la.ZONES))
+        self.assertEqual(self.stream().device, 2)
+        commands.put('pause')
+        commands.put('resume', config)
+        self.later(self.feed_newest)
+        next(frames)
+        self.assertEqual(len(self.pyaudio.streams), 2)
+        self.assertFalse(self.pipeline.paused)
+        # paused, the frames wait for a command or the stop token
+        commands.put('pause')
+        self.later(stop.stop)
+        self.assertEqual(list(frames), [])
+        self.assertTrue(self.pipeline.paused)
+        self.assertFalse(self.stream().active)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the clock's day table against the per-second color code
+"""
+
+import time
+import unittest
+
+import asus_light_clock as alc
+
+
+class DayTableTest(unittest.TestCase):
+    """
+    make_day_table and second_of_day
+    """
+    def test_table_matches_localtime_colors(self):
+        chrs, cmins, csecs = alc.hrminsec_colors()
+        table = alc.make_day_table(chrs, cmins, csecs)
+        self.assertEqual(table.shape, (86400, 3))
+        for second in range(0, 86400, 7):
+            hrs, mins, secs = second // 3600, second // 60 % 60, second % 60
+            self.assertEqual(table[second].tolist(),
+                             [chrs[hrs],
+                              alc.pulsate_hour(cmins[mins], hrs, secs),
+                              csecs[secs]])
+
+    def test_second_of_day(self):
+        self.assertEqual(alc.second_of_day((2015, 9, 30, 0, 0, 0)), 0)
+        self.assertEqual(alc.second_of_day((2015, 9, 30, 23, 59, 59)), 86399)
+        # a leap second shows as the second before it
+        self.assertEqual(alc.second_of_day((2015, 6, 30, 23, 59, 60)), 86399)
+        now = time.localtime()
+        self.assertEqual(alc.second_of_day(now),
+                         now.tm_hour * 3600 + now.tm_min * 60 +
+                         min(now.tm_sec, 59))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the OKLab color mixing of color_blend
+"""
+
+import unittest
+
+import numpy
+
+import light_acpi as la
+import color_blend as cb
+import color_tables as ctab
+
+
+def random_colors(count, seed=7):
+    """
+    reproducible uint32 0x00rrggbb colors
+    """
+    rand = numpy.random.RandomState(seed)
+    return rand.randint(0, 0x1000000, count).astype(numpy.uint32)
+
+
+class OKLabTest(unittest.TestCase):
+    """
+    conversion to and from OKLab
+    """
+    def test_transfer_tables_round_trip(self):
+        index = numpy.rint(cb.SRGB_TO_LINEAR * cb.LINEAR_STEPS).astype(int)
+        self.assertEqual(cb.LINEAR_TO_SRGB[index].tolist(), range(256))
+
+    def test_colors_round_trip(self):
+        grays = numpy.arange(256, dtype=numpy.uint32) * 0x010101
+        colors = numpy.concatenate([grays, random_colors(20000)])
+        self.assertEqual(cb.from_oklab(cb.to_oklab(colors)).tolist(),
+                         colors.tolist())
+
+    def test_white_lightness(self):
+        lab = cb.to_oklab(0xffffff)
+        self.assertAlmostEqual(lab[0], 1.0, places=4)
+        self.assertAlmostEqual(abs(lab[1]) + abs(lab[2]), 0.0, places=4)
+
+
+class MixTest(unittest.TestCase):
+    """
+    mixing, fading and breathing
+    """
+    def test_mix_ends(self):
+        start, end = random_colors(10, 8), random_colors(10, 9)
+        self.assertEqual(cb.mix_colors(start, end, 0.0).tolist(),
+                         start.tolist())
+        self.assertEqual(cb.mix_colors(start, end, 1.0).tolist(),
+                         end.tolist())
+
+    def test_mix_broadcasts(self):
+        start, end = random_colors(3, 8), random_colors(3, 9)
+        amounts = numpy.linspace(0, 1, 5)[:, numpy.newaxis]
+        mixed = cb.mix_colors(start, end, amounts)
+        self.assertEqual(mixed.shape, (5, 3))
+        self.assertEqual(mixed[2].tolist(),
+                         cb.mix_colors(start, end, 0.5).tolist())
+
+    def test_fade_sequence_ends_on_end(self):
+        fade = cb.fade_sequence([0xff0000, 0], [0x0000ff, 0xffffff], 8)
+        self.assertEqual(fade.shape, (8, 2))
+        self.assertEqual(fade[-1].tolist(), [0x0000ff, 0xffffff])
+        # eased, and even in lightness, so it never overshoots
+        lightness = cb.to_oklab(fade[:, 1])[:, 0]
+        self.assertTrue((numpy.diff(lightness) >= 0).all())
+
+    def test_breathing_curve(self):
+        for color in (0xff0000, 0x00ff00, 0x204080, 0x808080, 0x010203):
+            curve = cb.breathing_curve(color, 20)
+            self.assertEqual(len(curve), 20)
+            self.assertEqual(int(curve[0]), color)
+            # up to near full brightness and down to near black, between
+            # frames
+            chans = ctab.split_colors(curve)
+            self.assertTrue(chans.max() >= 240, chans.max())
+            self.assertTrue(chans.sum(axis=-1).min() <= 3)
+        self.assertEqual(cb.breathing_curve(0, 4).tolist(), [0, 0, 0, 0])
+
+    def test_breathing_keeps_hue(self):
+        lab = cb.to_oklab(cb.breathing_curve(0x3060c0, 40)).astype(float)
+        bright = lab[lab[:, 0] > 0.3]
+        hues = numpy.arctan2(bright[:, 2], bright[:, 1])
+        self.assertTrue(numpy.ptp(hues) < 0.05)
+
+
+class FrameTest(unittest.TestCase):
+    """
+    blending and fading frames and effects
+    """
+    def test_blend_frames(self):
+        start = {la.LEFT_VERTICAL: 0xff0000, la.BASE_HORIZONTAL: 0x00ff00}
+        end = {la.LEFT_VERTICAL: 0x0000ff, la.RIGHT_VERTICAL: 0xffffff}
+        frame = cb.blend_frames(start, end, 0.5)
+        self.assertEqual(frame[la.BASE_HORIZONTAL], 0x00ff00)
+        self.assertEqual(frame[la.RIGHT_VERTICAL], 0xffffff)
+        self.assertEqual(frame[la.LEFT_VERTICAL],
+                         int(cb.mix_colors(0xff0000, 0x0000ff, 0.5)))
+        self.assertEqual(cb.blend_frames(start, end, 1.0)[la.LEFT_VERTICAL],
+                         0x0000ff)
+
+    def test_fade_frames(self):
+        ticks = iter([0.0, 0.0, 0.5, 1.0, 2.0])
+        start = {la.LEFT_VERTICAL: 0}
+        frames = [{la.LEFT_VERTICAL: 0xffffff}] * 4
+        faded = list(cb.fade_frames(frames, start, 1.0,
+                                    timer=lambda: next(ticks)))
+        levels = [frame[la.LEFT_VERTICAL] for frame in faded]
+        self.assertEqual(levels[0], 0)
+        self.assertTrue(0 < levels[1] < 0xffffff)
+        self.assertEqual(levels[2:], [0xffffff, 0xffffff])
+
+    def test_crossfade_effect(self):
+        closed = []
+
+        def effect(color, count=None):
+            """
+            an effect giving one color every millisecond
+            """
+            try:
+                sent = 0
+                while count is None or sent < count:
+                    sent += 1
+                    yield {la.LEFT_VERTICAL: color}, 0.001
+            finally:
+                closed.append(color)
+
+        fade = cb.crossfade_effect(effect(0xff0000), effect(0x0000ff, 100),
+                                   0.02)
+        frames = [frame[la.LEFT_VERTICAL] for frame, _ in fade]
+        self.assertEqual(frames[0], 0xff0000)
+        self.assertTrue(len(set(frames)) > 2)
+        self.assertEqual(frames[-1], 0x0000ff)
+        self.assertEqual(sorted(closed), [0x0000ff, 0xff0000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the color tables and per-zone calibration of color_tables
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import light_acpi as la
+import color_tables as ctab
+
+
+class TableTest(unittest.TestCase):
+    """
+    gamma tables and color packing
+    """
+    def test_gamma_table(self):
+        self.assertEqual(ctab.gamma_table().tolist(), range(256))
+        table = ctab.gamma_table(2.2, 200)
+        self.assertEqual((table[0], table[255]), (0, 200))
+        self.assertEqual(table[128], int(round(200 * (128 / 255.0) ** 2.2)))
+        self.assertTrue((numpy.diff(table.astype(int)) >= 0).all())
+
+    def test_round_half_up(self):
+        values = [0.0, 0.5, 1.5, 2.5, 2.49, 254.5]
+        rounded = ctab.round_half_up(values)
+        self.assertEqual(rounded.dtype, numpy.float64)
+        self.assertEqual(rounded.tolist(), [round(value) for value in values])
+
+    def test_split_join_round_trip(self):
+        colors = numpy.random.RandomState(5).randint(0, 0x1000000, 100)
+        chans = ctab.split_colors(colors)
+        self.assertEqual(chans.shape, (100, 3))
+        self.assertEqual(ctab.join_colors(chans).tolist(), colors.tolist())
+        self.assertEqual(ctab.split_colors(0x123456).tolist(),
+                         [0x12, 0x34, 0x56])
+
+
+class CalibrationTest(unittest.TestCase):
+    """
+    ZoneCalibration, and its use by the device sessions
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'calibration.json')
+        with open(self.path, 'w') as outfile:
+            json.dump({'left': {'gamma': 2.2, 'cap': 200},
+                       'base': {'gamma': [2.0, 2.4, 2.2]}}, outfile)
+        self.saved_path = la.CALIBRATION_PATH
+
+    def tearDown(self):
+        la.CALIBRATION_PATH = self.saved_path
+        la.close_sessions()
+        shutil.rmtree(self.dir)
+
+    def test_apply_forms_agree(self):
+        calibration = ctab.ZoneCalibration.load(self.path)
+        colors = numpy.random.RandomState(6).randint(0, 0x1000000, 50)
+        for zone in la.ZONES:
+            calibrated = calibration.apply_colors(zone, colors).tolist()
+            self.assertEqual(calibrated,
+                             [calibration.apply_color(zone, int(color))
+                              for color in colors])
+        frame = calibration.apply({la.LEFT_VERTICAL: 0xffffff,
+                                   la.RIGHT_VERTICAL: 0xffffff,
+                                   la.BASE_HORIZONTAL: 0x808080})
+        self.assertEqual(frame[la.LEFT_VERTICAL], 0xc8c8c8)
+        # a zone without a calibration is unchanged
+        self.assertEqual(frame[la.RIGHT_VERTICAL], 0xffffff)
+        self.assertEqual(ctab.split_colors(frame[la.BASE_HORIZONTAL]).tolist(),
+                         [ctab.gamma_table(gamma)[0x80]
+                          for gamma in (2.0, 2.4, 2.2)])
+
+    def test_unknown_zone(self):
+        with open(self.path, 'w') as outfile:
+            json.dump({'top': {'gamma': 2.0}}, outfile)
+        self.assertRaises(ValueError, ctab.ZoneCalibration.load, self.path)
+
+    def test_every_session_calibrated(self):
+        la.CALIBRATION_PATH = self.path
+        backend = la.SimulatedBackend()
+        session = la.get_session('test', backend=backend)
+        la.ASUSLighting('test', la.LEFT_VERTICAL).set_color(0xffffff)
+        self.assertEqual(backend.colors[la.LEFT_VERTICAL], 0xc8c8c8)
+        session.commit_frame({la.LEFT_VERTICAL: 0x000000,
+                              la.RIGHT_VERTICAL: 0xffffff})
+        self.assertEqual(backend.colors[la.RIGHT_VERTICAL], 0xffffff)
+        # requested keeps the colors before calibration, for fades
+        self.assertEqual(session.requested[la.LEFT_VERTICAL], 0)
+        writer = la.LatestValueWriter(session).start()
+        writer.commit_frame({la.LEFT_VERTICAL: 0xffffff})
+        writer.stop()
+        self.assertEqual(backend.colors[la.LEFT_VERTICAL], 0xc8c8c8)
+
+    def test_no_file_no_calibration(self):
+        la.CALIBRATION_PATH = os.path.join(self.dir, 'missing.json')
+        session = la.get_session('test', backend=la.SimulatedBackend())
+        self.assertTrue(session.calibration is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+tests of running effects on the EffectWorker thread
+"""
+
+import threading
+import unittest
+
+from effect_worker import EffectWorker, StopToken
+
+
+def waiting_effect(runs, stop):
+    """
+    effect noting its token and waiting until it is stopped
+    """
+    runs.append(stop)
+    while not stop.wait(0.01):
+        pass
+
+
+def stubborn_effect(release, stop):
+    """
+    effect ignoring its token until released
+    """
+    release.wait(5)
+
+
+class EffectWorkerTest(unittest.TestCase):
+    """
+    EffectWorker and StopToken
+    """
+    def test_start_stops_previous_effect(self):
+        worker = EffectWorker()
+        runs = []
+        first = worker.start(waiting_effect, runs)
+        second = worker.start(waiting_effect, runs)
+        self.assertTrue(first.stopped())
+        self.assertFalse(second.stopped())
+        thread = worker.thread
+        self.assertTrue(worker.shutdown())
+        self.assertTrue(second.stopped())
+        self.assertIs(worker.thread, thread)
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertRaises(ValueError, worker.start, waiting_effect, runs)
+
+    def test_shutdown_reports_late_effect(self):
+        worker = EffectWorker()
+        release = threading.Event()
+        worker.start(stubborn_effect, release)
+        while not worker.busy:
+            release.wait(0.001)
+        self.assertFalse(worker.shutdown(timeout=0.1))
+        release.set()
+        worker.thread.join(1)
+        self.assertFalse(worker.running())
+
+    def test_stop_token_wait(self):
+        token = StopToken()
+        self.assertFalse(token.wait(0.001))
+        token.stop()
+        self.assertTrue(token.wait(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the breathing sequences against the original per-color code
+"""
+
+import unittest
+
+import numpy
+
+import hyperventilate as hv
+
+
+def loop_gamut(color):
+    """
+    make_gamut as it was, one color at a time
+    """
+    cred, cgreen, cblue = hv.split_rgb(color)
+    rred, rgreen, rblue = hv.make_ratios(cred, cgreen, cblue)
+    sequence256 = [hv.make_rgb(i * rred, i * rgreen, i * rblue)
+                   for i in range(256)]
+    if color in sequence256:
+        return sequence256, sequence256.index(color)
+    distances = [(hv.split_rgb(col)[0] - cred) ** 2 +
+                 (hv.split_rgb(col)[1] - cgreen) ** 2 +
+                 (hv.split_rgb(col)[2] - cblue) ** 2 for col in sequence256]
+    return sequence256, distances.index(min(distances))
+
+def loop_sequence(gamut, idex, frames):
+    """
+    dim_up_down_up_sequence as it was, one frame at a time
+    """
+    cseq = list(gamut[idex:]) + list(gamut[::-1]) + list(gamut[:idex])
+    ratio = 512.0 / frames
+    return [cseq[min(int(round(i * ratio)), len(cseq) - 1)]
+            for i in range(frames)]
+
+
+class BreathingTest(unittest.TestCase):
+    """
+    vectorized gamut and sequences
+    """
+    COLORS = (0xff0000, 0x1111ff, 0x808000, 0x010203, 0x7f3f1f, 0x00ff01)
+
+    def test_gamut_matches_loop(self):
+        for color in self.COLORS:
+            gamut, idx = hv.make_gamut(color)
+            expected, expected_idx = loop_gamut(color)
+            self.assertEqual(gamut.tolist(), expected)
+            self.assertEqual(idx, expected_idx)
+
+    def test_sequence_matches_loop(self):
+        for color in self.COLORS:
+            gamut, idx = hv.make_gamut(color)
+            for frames in (20, 30, 32, 100):
+                self.assertEqual(
+                    hv.dim_up_down_up_sequence(gamut, idx, frames).tolist(),
+                    loop_sequence(gamut.tolist(), idx, frames))
+
+    def test_black_gamut(self):
+        gamut, idx = hv.make_gamut(0)
+        self.assertEqual(idx, 0)
+        self.assertFalse(numpy.any(gamut))
+
+    def test_sequence_cache(self):
+        first = hv.breathing_sequence(0x1111ff, 32)
+        self.assertIs(hv.breathing_sequence(0x1111ff, 32), first)
+        self.assertFalse(first.flags.writeable)
+        self.assertIsNot(hv.breathing_sequence(0x1111ff, 32, True), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
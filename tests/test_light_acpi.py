@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the device session and writer on the simulated backend
+"""
+
+from StringIO import StringIO
+import sys
+import threading
+import time
+import unittest
+
+import light_acpi as la
+
+
+class CountingBackend(la.SimulatedBackend):
+    """
+    SimulatedBackend counting opens and closes
+    """
+    def __init__(self, write_latency=0.0):
+        la.SimulatedBackend.__init__(self, write_latency)
+        self.opens = 0
+        self.closes = 0
+
+    def open(self):
+        self.opens += 1
+        return la.SimulatedBackend.open(self)
+
+    def close(self):
+        self.closes += 1
+        la.SimulatedBackend.close(self)
+
+
+class SessionTest(unittest.TestCase):
+    """
+    get_session and DeviceSession
+    """
+    def tearDown(self):
+        la.close_sessions()
+
+    def test_session_opened_once(self):
+        backend = CountingBackend()
+        session = la.get_session('test', backend=backend)
+        for zone in la.ZONES:
+            light = la.ASUSLighting('test', zone)
+            self.assertIs(light.session, session)
+            light.set_color(0x123456)
+        self.assertIs(la.get_session('test'), session)
+        self.assertEqual(backend.opens, 1)
+        self.assertEqual(backend.writes, 3)
+        la.close_sessions()
+        self.assertEqual(backend.closes, 1)
+
+    def test_commit_frame_skips_unchanged_zones(self):
+        backend = CountingBackend()
+        session = la.DeviceSession(backend)
+        frame = {la.LEFT_VERTICAL: 1, la.RIGHT_VERTICAL: 2,
+                 la.BASE_HORIZONTAL: 3}
+        self.assertEqual(session.commit_frame(frame), 3)
+        self.assertEqual(session.commit_frame(frame), 0)
+        frame[la.BASE_HORIZONTAL] = 4
+        self.assertEqual(session.commit_frame(frame), 1)
+        self.assertEqual(session.commit_frame(frame, force=True), 3)
+        session.invalidate()
+        self.assertEqual(session.commit_frame(frame), 3)
+        self.assertEqual(backend.writes, 10)
+        self.assertEqual(backend.colors[la.BASE_HORIZONTAL], 4)
+        self.assertEqual(session.stats.frames, 5)
+        self.assertEqual(session.stats.coalesced, 5)
+
+    def test_stats_count_writes(self):
+        session = la.DeviceSession(la.SimulatedBackend())
+        for color in range(10):
+            session.set_color(la.LEFT_VERTICAL, color)
+        summary = session.stats.summary()
+        left = summary['zones'][la.ZONE_NAMES[la.LEFT_VERTICAL]]
+        self.assertEqual(left['calls'], 10)
+        self.assertEqual(sum(left['histogram']), 10)
+
+
+class BlockedBackend(la.SimulatedBackend):
+    """
+    SimulatedBackend whose writes wait until released
+    """
+    def __init__(self):
+        la.SimulatedBackend.__init__(self)
+        self.release = threading.Event()
+        self.entered = threading.Event()
+
+    def device_control(self, device, color):
+        self.entered.set()
+        self.release.wait()
+        return la.SimulatedBackend.device_control(self, device, color)
+
+
+class WriterTest(unittest.TestCase):
+    """
+    LatestValueWriter
+    """
+    def test_latest_value_wins(self):
+        backend = BlockedBackend()
+        session = la.DeviceSession(backend)
+        writer = la.LatestValueWriter(session).start()
+        writer.set_color(la.LEFT_VERTICAL, 1)
+        self.assertTrue(backend.entered.wait(5))
+        # the first color is being written, these wait in the one slot
+        for color in range(2, 7):
+            writer.set_color(la.LEFT_VERTICAL, color)
+        backend.release.set()
+        writer.stop()
+        self.assertEqual(writer.submitted, 6)
+        self.assertEqual(writer.dropped, 4)
+        self.assertEqual(session.stats.dropped, 4)
+        self.assertEqual(backend.writes, 2)
+        self.assertEqual(backend.colors[la.LEFT_VERTICAL], 6)
+
+    def test_stop_without_flush_discards(self):
+        backend = BlockedBackend()
+        session = la.DeviceSession(backend)
+        writer = la.LatestValueWriter(session).start()
+        writer.set_color(la.LEFT_VERTICAL, 1)
+        self.assertTrue(backend.entered.wait(5))
+        writer.set_color(la.LEFT_VERTICAL, 2)
+        # stop before the first write returns, so 2 is still queued
+        stopper = threading.Thread(target=writer.stop, args=(False,))
+        stopper.start()
+        while writer.running:
+            time.sleep(0.001)
+        backend.release.set()
+        stopper.join()
+        self.assertEqual(backend.colors[la.LEFT_VERTICAL], 1)
+
+    def test_failed_write_keeps_writer_alive(self):
+        session = la.DeviceSession(FailingBackend())
+        writer = la.LatestValueWriter(session).start()
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            writer.set_color(la.LEFT_VERTICAL, 1)
+            for _ in range(500):
+                if writer.errors:
+                    break
+                time.sleep(0.01)
+            writer.set_color(la.LEFT_VERTICAL, 2)
+            writer.stop()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(writer.errors, 1)
+        self.assertIsInstance(writer.last_error, IOError)
+        self.assertEqual(session.backend.colors[la.LEFT_VERTICAL], 2)
+
+
+class FailingBackend(la.SimulatedBackend):
+    """
+    SimulatedBackend whose first write fails
+    """
+    def device_control(self, device, color):
+        if self.writes == 0:
+            self.writes += 1
+            raise IOError("simulated write failure")
+        return la.SimulatedBackend.device_control(self, device, color)
+
+
+class SchedulerTest(unittest.TestCase):
+    """
+    FrameScheduler
+    """
+    def test_achieved_rate_recorded(self):
+        session = la.DeviceSession(la.SimulatedBackend())
+        scheduler = la.FrameScheduler(0.01)
+        for idx in scheduler.ticks(20):
+            session.set_color(la.LEFT_VERTICAL, idx)
+        self.assertEqual(scheduler.frames + scheduler.skipped, 20)
+        # 20 frames due over 19 intervals
+        self.assertTrue(80 < scheduler.achieved_rate() < 105)
+        session.stats.record_schedule(scheduler)
+        summary = session.stats.summary()
+        self.assertEqual(summary['scheduled_rate'], scheduler.achieved_rate())
+        self.assertEqual(summary['schedule_skipped'], scheduler.skipped)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+tests of sharing the zones between effects in the lighting daemon, on
+the simulated backend
+"""
+
+import threading
+import time
+import unittest
+
+import light_acpi as la
+import lighting_daemon as ld
+
+
+def solid_effect(color, closed, wait=0.0, count=None):
+    """
+    effect giving every zone color, count times or forever, noting its
+    color in closed when it is closed
+    """
+    try:
+        sent = 0
+        while count is None or sent < count:
+            sent += 1
+            yield dict((zone, color) for zone in la.ZONES), wait
+    finally:
+        closed.append(color)
+
+
+class DaemonTest(unittest.TestCase):
+    """
+    LightingDaemon assigning zones to its EffectSlots
+    """
+    def setUp(self):
+        self.backend = la.SimulatedBackend()
+        self.daemon = ld.LightingDaemon(la.DeviceSession(self.backend))
+        self.closed = []
+
+    def tearDown(self):
+        self.daemon.close()
+
+    def add(self, name, color, zones=la.ZONES, priority=0, wait=0.0, #pylint: disable-msg=R0913
+            fade=0.0):
+        """
+        add a solid_effect of color to the daemon
+        """
+        return self.daemon.add_effect(name,
+                                      solid_effect(color, self.closed, wait),
+                                      zones, priority, fade)
+
+    def colors(self):
+        """
+        step the daemon and return the colors of the left, right and base
+        """
+        self.daemon.step()
+        return [self.backend.colors.get(zone) for zone in
+                (la.LEFT_VERTICAL, la.RIGHT_VERTICAL, la.BASE_HORIZONTAL)]
+
+    def test_highest_priority_owns_zones(self):
+        self.add('clock', 0x0000ff, priority=0)
+        slot = self.add('sound', 0xff0000, [la.LEFT_VERTICAL], priority=2)
+        # added later, but lower
+        self.add('breathe', 0x00ff00, [la.LEFT_VERTICAL, la.BASE_HORIZONTAL],
+                 priority=1)
+        self.assertEqual(self.colors(), [0xff0000, 0x0000ff, 0x00ff00])
+        self.assertIs(self.daemon.owners[la.LEFT_VERTICAL], slot)
+        # an effect only colors the zones it is assigned
+        self.assertEqual(slot.colors, {la.LEFT_VERTICAL: 0xff0000})
+
+    def test_equal_priority_last_added_wins(self):
+        self.add('first', 0x0000ff)
+        self.add('second', 0x00ff00, [la.RIGHT_VERTICAL])
+        self.assertEqual(self.colors(), [0x0000ff, 0x00ff00, 0x0000ff])
+
+    def test_removed_effect_falls_back(self):
+        self.add('clock', 0x0000ff)
+        self.add('sound', 0xff0000, [la.LEFT_VERTICAL], priority=2)
+        self.assertEqual(self.colors(), [0xff0000, 0x0000ff, 0x0000ff])
+        self.daemon.remove_effect('sound')
+        # the clock's last colors are shown at once
+        self.assertEqual(self.daemon.frame, {la.LEFT_VERTICAL: 0x0000ff})
+        self.assertEqual(self.colors(), [0x0000ff] * 3)
+        self.assertEqual(self.closed, [0xff0000])
+        self.assertEqual(sorted(self.daemon.slots), ['clock'])
+        self.daemon.remove_effect('missing')
+
+    def test_ended_effect_falls_back(self):
+        self.add('clock', 0x0000ff)
+        self.daemon.add_effect('flash', solid_effect(0xffffff, self.closed,
+                                                     count=1),
+                               [la.BASE_HORIZONTAL], priority=1)
+        self.assertEqual(self.colors(), [0x0000ff, 0x0000ff, 0xffffff])
+        self.assertEqual(self.colors(), [0x0000ff] * 3)
+        self.assertEqual(self.closed, [0xffffff])
+
+    def test_reassign_priority(self):
+        self.add('clock', 0x0000ff, priority=0)
+        self.add('breathe', 0x00ff00, priority=1)
+        self.assertEqual(self.colors(), [0x00ff00] * 3)
+        # adding an effect again under its name gives it a new priority
+        # and order, and closes the one it replaces
+        self.add('clock', 0xff0000, [la.LEFT_VERTICAL, la.RIGHT_VERTICAL],
+                 priority=2)
+        self.assertEqual(self.colors(), [0xff0000, 0xff0000, 0x00ff00])
+        self.assertEqual(self.closed, [0x0000ff])
+        self.add('breathe', 0xffff00, priority=2)
+        self.assertEqual(self.colors(), [0xffff00] * 3)
+        self.add('clock', 0x00ffff, [la.LEFT_VERTICAL], priority=2)
+        self.assertEqual(self.colors(), [0x00ffff, 0xffff00, 0xffff00])
+        self.assertEqual(sorted(self.closed),
+                         [0x0000ff, 0x00ff00, 0xff0000])
+
+    def test_replacement_crossfades(self):
+        self.add('breathe', 0xff0000, [la.LEFT_VERTICAL], wait=0.005)
+        self.assertEqual(self.colors()[0], 0xff0000)
+        self.add('breathe', 0x0000ff, [la.LEFT_VERTICAL], fade=0.1)
+        # both run while they fade
+        self.assertEqual(self.closed, [])
+        seen = []
+        deadline = time.time() + 2.0
+        while not self.closed and time.time() < deadline:
+            seen.append(self.colors()[0])
+            time.sleep(0.005)
+        # the old effect is closed when the fade ends on the new colors
+        self.assertEqual(self.closed, [0xff0000])
+        self.assertEqual(seen[-1], 0x0000ff)
+        between = [color for color in seen if color not in
+                   (0xff0000, 0x0000ff)]
+        self.assertTrue(len(between) > 2, seen)
+
+    def test_run_and_stop(self):
+        self.add('clock', 0x0000ff, wait=0.01)
+        thread = threading.Thread(target=self.daemon.run)
+        thread.start()
+        deadline = time.time() + 2.0
+        while self.backend.writes < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.daemon.stop()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.backend.colors.get(la.BASE_HORIZONTAL),
+                         0x0000ff)
+        # run closes the effects it ran
+        self.assertEqual(self.closed, [0x0000ff])
+        self.assertEqual(self.daemon.slots, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+tests of rendering sound files to lighting timelines
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+
+import numpy
+
+import light_acpi as la
+import render_sound
+from tests.test_sound_analysis import pack, reference_cutouts, \
+     reference_shape
+
+
+def write_wav(path, samplerate, seconds=1.0, channels=2):
+    """
+    write a 16 bit WAV of a chord in noise
+    """
+    times = numpy.arange(int(samplerate * seconds)) / float(samplerate)
+    wave_data = 0.3 * numpy.sin(2 * numpy.pi * 220.0 * times) + \
+                0.2 * numpy.sin(2 * numpy.pi * 1500.0 * times) + \
+                0.05 * numpy.random.RandomState(3).standard_normal(len(times))
+    samples = numpy.repeat((wave_data * 20000).astype('<i2'), channels)
+    wav = wave.open(path, 'wb')
+    wav.setnchannels(channels)
+    wav.setsampwidth(2)
+    wav.setframerate(samplerate)
+    wav.writeframes(samples.tostring())
+    wav.close()
+
+
+class RenderTest(unittest.TestCase):
+    """
+    render_sound at the common sample rates
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def render(self, samplerate, **settings):
+        path = os.path.join(self.tmpdir, 'sound%d.wav' % samplerate)
+        write_wav(path, samplerate)
+        rate, hop, windows = render_sound.wav_windows(path, 4096, 25)
+        self.assertEqual(rate, samplerate)
+        shows = list(render_sound.render_timeline(windows, rate, hop=hop,
+                                                  **settings))
+        # a frame every 25 ms hop once the first window is full, and one
+        # for the partial hop at the end
+        self.assertTrue((samplerate - 4096) // hop + 1 <= len(shows) <=
+                        (samplerate - 4096) // hop + 2)
+        return shows
+
+    def check_rate(self, samplerate):
+        shows = self.render(samplerate)
+        for seconds, frame in shows:
+            self.assertTrue(0 < seconds <= 1.0)
+            self.assertEqual(sorted(frame), sorted(la.ZONES))
+        colors = [(frame[la.BASE_HORIZONTAL], frame[la.RIGHT_VERTICAL],
+                   frame[la.LEFT_VERTICAL]) for _, frame in shows]
+        # the chord lights the zones in their own colors, and the noise
+        # changes them from frame to frame
+        self.assertTrue(len(set(colors)) > 1)
+        for frame_colors in colors:
+            self.assertNotEqual(frame_colors, (0xfefefe,) * 3)
+        # the first window, ending on the first whole hop after 4096
+        # frames, through the original list chain
+        end = int(round(shows[0][0] * samplerate))
+        wav = wave.open(os.path.join(self.tmpdir,
+                                     'sound%d.wav' % samplerate), 'rb')
+        data = numpy.frombuffer(wav.readframes(end), dtype='<i2')
+        wav.close()
+        mix = data.reshape(-1, 2)[-4096:].astype(int).sum(axis=1)
+        expected = pack(reference_shape(reference_cutouts(mix, samplerate),
+                                        0))
+        self.assertEqual(list(colors[0]), expected)
+
+    def test_render_44100(self):
+        self.check_rate(44100)
+
+    def test_render_16000(self):
+        self.check_rate(16000)
+
+    def test_render_8000(self):
+        self.check_rate(8000)
+
+    def test_render_stereo_beats_16000(self):
+        shows = self.render(16000, stereo=True, beats=True)
+        colors = set(tuple(sorted(frame.items())) for _, frame in shows)
+        self.assertTrue(len(colors) > 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the sound analysis of asus_soundlighting
+"""
+
+import unittest
+
+import numpy
+
+import asus_soundlighting as asl
+import color_tables as ctab
+
+
+def direct_band_levels(signal, samplerate, nfft, edges):
+    """
+    band sums of the one-sided Hanning window power spectral density,
+    as mlab.psd gave them, one bin at a time
+    """
+    window = numpy.hanning(nfft)
+    nseg = max(len(signal) // nfft, 1)
+    padded = numpy.zeros(max(len(signal), nfft))
+    padded[:len(signal)] = signal
+    power = numpy.zeros(nfft // 2 + 1)
+    for seg in range(nseg):
+        spec = numpy.fft.rfft(padded[seg * nfft:(seg + 1) * nfft] * window)
+        power += numpy.abs(spec) ** 2 / nseg
+    power *= 2.0 / (samplerate * (window ** 2).sum())
+    power[0] /= 2.0
+    power[-1] /= 2.0
+    freqs = numpy.arange(nfft // 2 + 1) * float(samplerate) / nfft
+    return numpy.array([power[(freqs > low) & (freqs <= high)].sum()
+                        for low, high in zip(edges[:-1], edges[1:])])
+
+
+def noise(frames, channels=2, seed=1):
+    """
+    reproducible (frames, channels) int16 noise
+    """
+    rand = numpy.random.RandomState(seed)
+    return (rand.standard_normal((frames, channels)) * 3000).astype('<i2')
+
+
+class SpectrumAnalyzerTest(unittest.TestCase):
+    """
+    SpectrumAnalyzer band sums
+    """
+    def check_band_levels(self, samplerate, edges=asl.BAND_EDGES):
+        signal = noise(8192, 1)[:, 0].astype(float)
+        analyzer = asl.get_analyzer(samplerate, band_edges=edges)
+        expected = direct_band_levels(signal, samplerate, 2048, edges)
+        numpy.testing.assert_allclose(analyzer.band_levels(signal),
+                                      expected, rtol=1e-9)
+        return expected
+
+    def test_band_levels_44100(self):
+        self.check_band_levels(44100)
+
+    def test_bands_above_nyquist_are_zero(self):
+        levels = self.check_band_levels(16000)
+        self.assertEqual(levels[-1], 0.0)
+        self.check_band_levels(8000)
+        self.check_band_levels(44100, (100, 1000, 20000, 30000, 40000))
+
+    def test_frame_at_16000(self):
+        maker = asl.SoundFrameMaker.from_config(
+            asl.make_config(samplerate=16000, window=4096, hop=400))
+        frame = maker.make_frame(noise(4096))
+        self.assertEqual(sorted(frame), sorted(asl.lacpi.ZONES))
+
+    def test_mix_keeps_total(self):
+        analyzer = asl.get_analyzer(44100,
+                                    band_edges=asl.make_band_edges('mel', 40))
+        levels = analyzer.band_levels(noise(4096, 1)[:, 0])
+        self.assertAlmostEqual(analyzer.mix(levels).sum() / levels.sum(),
+                               1.0)
+
+
+class BandEdgesTest(unittest.TestCase):
+    """
+    make_band_edges against the samplerate
+    """
+    def test_log_and_mel_end_at_nyquist(self):
+        for layout in ('log', 'mel'):
+            edges = asl.make_band_edges(layout, 24, samplerate=16000)
+            self.assertEqual(len(edges), 25)
+            self.assertEqual(edges[-1], 8000.0)
+            self.assertEqual(asl.make_band_edges(layout, 24, samplerate=44100),
+                             asl.make_band_edges(layout, 24))
+
+    def test_edges_above_nyquist(self):
+        self.assertRaises(ValueError, asl.make_band_edges, (9000, 12000),
+                          samplerate=16000)
+        self.assertRaises(ValueError, asl.make_band_edges, 'mel',
+                          samplerate=100)
+        self.assertRaises(ValueError, asl.SpectrumAnalyzer, 16000,
+                          band_edges=(8000, 9000))
+        # a band partly below the Nyquist frequency is kept
+        self.assertEqual(asl.make_band_edges((100, 9000), samplerate=16000),
+                         (100.0, 9000.0))
+
+    def test_config_band_edges(self):
+        config = asl.make_config(samplerate=16000, band_layout='log',
+                                 nbands=12)
+        self.assertEqual(asl.config_band_edges(config)[-1], 8000.0)
+
+
+def reference_shape(levels, rtype):
+    """
+    the levels through equalize, scaling by 255 / max, saturate_color and
+    rotate_levels one at a time, as sound_frames did before shape_levels
+    """
+    levs = asl.equalize(list(levels))
+    l_max = max(levs)
+    levs = [int(round(lev * 255.0 / l_max)) for lev in levs]
+    asl.saturate_color(levs)
+    return asl.rotate_levels(levs, rtype)
+
+
+class ConfigTest(unittest.TestCase):
+    """
+    make_config conversions and checks
+    """
+    def test_bools_parsed(self):
+        config = asl.make_config(stereo='False', beats='yes')
+        self.assertEqual((config.stereo, config.beats), (False, True))
+        config = asl.make_config(config, stereo=1, beats='OFF')
+        self.assertEqual((config.stereo, config.beats), (True, False))
+        self.assertRaises(ValueError, asl.make_config, stereo='maybe')
+        self.assertRaises(ValueError, asl.make_config, beats=2)
+
+    def test_bad_values(self):
+        self.assertRaises(ValueError, asl.make_config, hop='x')
+        self.assertRaises(ValueError, asl.make_config, window=None)
+        self.assertRaises(ValueError, asl.make_config, bogus=1)
+        self.assertRaises(ValueError, asl.make_config, release=-1)
+
+    def test_band_edges_under_nyquist(self):
+        self.assertRaises(ValueError, asl.make_config, samplerate=150,
+                          band_layout='log')
+
+
+class ShapeLevelsTest(unittest.TestCase):
+    """
+    shape_levels against the list functions it replaced
+    """
+    def setUp(self):
+        rand = numpy.random.RandomState(3)
+        # levels over many decades, so equalize doubles them, some under
+        # its floor of 0.0001 and some frames hitting its 100 doublings
+        self.batch = 10.0 ** rand.uniform(-12, 2, (200, asl.SEGMENTS))
+        self.batch[:5] = 1.0
+        self.batch[5:10, ::2] = 0.0
+        self.rtypes = rand.randint(0, 3, len(self.batch))
+
+    def test_frames_match(self):
+        for levels, rtype in zip(self.batch, self.rtypes):
+            self.assertEqual(asl.shape_levels(levels, rtype).tolist(),
+                             reference_shape(levels, rtype))
+
+    def test_batch_matches_frames(self):
+        shaped = asl.shape_levels(self.batch, self.rtypes)
+        for idx, (levels, rtype) in enumerate(zip(self.batch, self.rtypes)):
+            self.assertEqual(shaped[idx].tolist(),
+                             asl.shape_levels(levels, rtype).tolist())
+
+    def test_saturation_table_matches_sat_trip(self):
+        trips = numpy.random.RandomState(4).randint(0, 256, (500, 3))
+        trips[0] = 0
+        expected = [list(asl.sat_trip(*trip)) if max(trip) else [0, 0, 0]
+                    for trip in trips.tolist()]
+        self.assertEqual(ctab.saturate_levels(trips).tolist(), expected)
+
+
+def chord(frames=4096, samplerate=44100, seed=5):
+    """
+    (frames, 2) int16 chord in noise, louder bass on the left and treble
+    on the right
+    """
+    rand = numpy.random.RandomState(seed)
+    tsec = numpy.arange(frames) / float(samplerate)
+    chans = numpy.zeros((frames, 2))
+    for freq, left, right in ((110.0, 0.3, 0.1), (440.0, 0.2, 0.2),
+                              (1760.0, 0.1, 0.2), (7040.0, 0.02, 0.1)):
+        wave = numpy.sin(2.0 * numpy.pi * freq * tsec)
+        chans += wave[:, numpy.newaxis] * [left, right]
+    chans += 0.05 * rand.standard_normal(chans.shape)
+    return (chans * 20000).astype('<i2')
+
+
+def reference_cutouts(signal, samplerate=44100):
+    """
+    the band sums of the original get_cutouts for a signal: divided by
+    its sum with Python 2 integer division, then the mlab.psd band sums
+    """
+    signal = numpy.asarray(signal, dtype=int)
+    total = int(signal.sum())
+    if total != 0:
+        signal = numpy.array([sample // total for sample in signal.tolist()])
+    return direct_band_levels(signal, samplerate, 2048, asl.BAND_EDGES)
+
+
+def pack(levels):
+    """
+    0x00rrggbb colors of the base, right and left of 9 shaped levels
+    """
+    return [(levels[idx] << 16) | (levels[idx + 1] << 8) | levels[idx + 2]
+            for idx in (0, 3, 6)]
+
+
+class CutoutsTest(unittest.TestCase):
+    """
+    sound frames against the original chain on the mix of the channels,
+    whose band levels are on the scale of the floor of equalize
+    """
+    def test_frame_matches_original_chain(self):
+        data = chord()
+        frame = asl.sound_frames([data], 44100).next()
+        expected = pack(reference_shape(
+            reference_cutouts(data.astype(int).sum(axis=1)), 0))
+        self.assertEqual([frame[asl.lacpi.BASE_HORIZONTAL],
+                          frame[asl.lacpi.RIGHT_VERTICAL],
+                          frame[asl.lacpi.LEFT_VERTICAL]], expected)
+        self.assertNotEqual(expected, [0xfefefe] * 3)
+
+    def test_levels_above_floor(self):
+        # only bands without a note of the chord may fall under it
+        levels = asl.band_levels(chord())
+        self.assertTrue(numpy.count_nonzero(levels > 0.0001) >= 7,
+                        levels.tolist())
+
+    def test_stereo_levels(self):
+        data = chord()
+        levels = asl.stereo_band_levels(data)
+        numpy.testing.assert_allclose(levels[0], asl.band_levels(data))
+        for row, chan in ((1, 1), (2, 0)):
+            numpy.testing.assert_allclose(levels[row],
+                                          reference_cutouts(data[:, chan]),
+                                          rtol=1e-9)
+
+
+class EnvelopeFollowerTest(unittest.TestCase):
+    """
+    attack and release smoothing of the levels
+    """
+    def test_first_levels_followed(self):
+        envelope = asl.EnvelopeFollower(0.01, 0.05, 0.2)
+        self.assertEqual(envelope.update([1.0, 2.0]).tolist(), [1.0, 2.0])
+
+    def test_time_constants(self):
+        # after a time constant, a step has closed all but 1 / e of its gap
+        envelope = asl.EnvelopeFollower(0.01, 0.05, 0.2)
+        envelope.update([0.0, 1.0])
+        for _ in range(5):
+            levels = envelope.update([1.0, 1.0])
+        self.assertAlmostEqual(levels[0], 1.0 - numpy.exp(-1.0))
+        for _ in range(20):
+            levels = envelope.update([0.0, 0.0])
+        self.assertAlmostEqual(levels[1], numpy.exp(-1.0))
+
+    def test_zero_follows_at_once(self):
+        envelope = asl.EnvelopeFollower(0.01, 0.0, [0.0, 0.2])
+        envelope.update([0.0, 0.0])
+        self.assertEqual(envelope.update([1.0, 1.0]).tolist(), [1.0, 1.0])
+        levels = envelope.update([0.0, 0.0])
+        self.assertEqual(levels[0], 0.0)
+        self.assertTrue(0.9 < levels[1] < 1.0)
+
+    def test_retime_keeps_levels(self):
+        envelope = asl.EnvelopeFollower(0.01, 0.0, 0.2)
+        envelope.update([1.0])
+        envelope.retime(0.02, 0.0, 0.02)
+        levels = envelope.update([0.0])
+        self.assertAlmostEqual(levels[0], numpy.exp(-1.0))
+
+
+def click_track(samplerate, seconds, bpm, start=0.25, seed=2):
+    """
+    (frames, 2) int16 quiet noise with a decaying click every beat, and
+    the click times
+    """
+    rand = numpy.random.RandomState(seed)
+    signal = rand.standard_normal(int(samplerate * seconds)) * 30
+    length = int(0.03 * samplerate)
+    click = rand.standard_normal(length) * 8000 * \
+            numpy.exp(-numpy.arange(length) / (0.005 * samplerate))
+    times = numpy.arange(start, seconds - 0.05, 60.0 / bpm)
+    for time in times:
+        first = int(time * samplerate)
+        signal[first:first + length] += click
+    return numpy.repeat(signal[:, numpy.newaxis], 2, axis=1).astype('<i2'), \
+           times
+
+
+class BeatTest(unittest.TestCase):
+    """
+    beats of SoundFrameMaker, found in the newest sound of each window
+    """
+    def beats(self, window, hop=441, samplerate=44100):
+        """
+        click times and (end, Beat) of the beats found in windows of a
+        120 beats a minute click track ending every hop
+        """
+        data, times = click_track(samplerate, 8, 120)
+        maker = asl.SoundFrameMaker(samplerate, beats=True, hop=hop)
+        found = []
+        for end in range(window, len(data) + 1, hop):
+            maker.make_frame(data[end - window:end])
+            if maker.last_beat is not None:
+                found.append((end / float(samplerate), maker.last_beat))
+        return times, found
+
+    def check_clicks(self, window):
+        times, found = self.beats(window)
+        # the detector's threshold settles over the first second
+        settled = window / 44100.0 + 1.0
+        found = [(end, beat) for end, beat in found if end >= settled]
+        lags = [end - times[times <= end].max() for end, _ in found]
+        self.assertTrue(max(lags) < 0.02, lags)
+        self.assertEqual(len(found), numpy.count_nonzero(times >= settled))
+        self.assertAlmostEqual(found[-1][1].bpm, 120.0, delta=2.0)
+
+    def test_clicks_short_window(self):
+        self.check_clicks(4096)
+
+    def test_clicks_long_window(self):
+        # a click stays in a long window for most of a second, and must
+        # not count again as it moves through it
+        self.check_clicks(2**15)
+
+    def test_beat_window(self):
+        self.assertEqual(asl.beat_window(441), 512)
+        self.assertEqual(asl.beat_window(1024), 1024)
+        self.assertEqual(asl.beat_window(4410), asl.BEAT_WINDOW)
+
+
+if __name__ == '__main__':
+    unittest.main()
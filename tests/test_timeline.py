@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+tests of timeline files and their playback on the simulated backend
+"""
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import light_acpi as la
+import timeline as tl
+
+
+def color_frames(count, interval):
+    """
+    (seconds, frame) of count frames interval seconds apart, each zone a
+    different color in each frame
+    """
+    return [(idx * interval,
+             dict((zone, (idx * 0x010203 + zone) & 0xffffff)
+                  for zone in la.ZONES))
+            for idx in xrange(count)]
+
+
+class RecordingSession(la.DeviceSession):
+    """
+    DeviceSession keeping each frame committed to it
+    """
+    def __init__(self, backend):
+        la.DeviceSession.__init__(self, backend)
+        self.frames = []
+
+    def commit_frame(self, frame, force=False):
+        self.frames.append(frame)
+        return la.DeviceSession.commit_frame(self, frame, force)
+
+
+class TimelineFileTest(unittest.TestCase):
+    """
+    writing and reading timeline files
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'show' + tl.TIMELINE_EXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        frames = color_frames(50, 0.0125)
+        self.assertEqual(tl.write_timeline(self.path, frames), 50)
+        with tl.Timeline(self.path) as show:
+            self.assertEqual(show.zones, la.ZONES)
+            self.assertEqual(len(show), 50)
+            for (seconds, frame), (read_seconds, read_frame) in \
+                    zip(frames, show):
+                self.assertAlmostEqual(read_seconds, seconds, places=6)
+                self.assertEqual(read_frame, frame)
+            self.assertEqual(show.colors.shape, (50, len(la.ZONES)))
+            self.assertEqual(show[-1][1], frames[-1][1])
+
+    def test_missing_zones_black(self):
+        tl.write_timeline(self.path, [(0.0, {la.LEFT_VERTICAL: 0x1ff0000})])
+        with tl.Timeline(self.path) as show:
+            frame = show[0][1]
+        self.assertEqual(frame[la.LEFT_VERTICAL], 0xff0000)
+        self.assertEqual(frame[la.RIGHT_VERTICAL], 0)
+        self.assertEqual(frame[la.BASE_HORIZONTAL], 0)
+
+    def test_header(self):
+        with tl.TimelineWriter(self.path) as writer:
+            for seconds, frame in color_frames(7, 0.5):
+                writer.append(seconds, frame)
+        with open(self.path, 'rb') as infile:
+            data = infile.read()
+        magic, version, nzones, count, _ = tl.HEADER.unpack_from(data)
+        self.assertEqual((magic, version, nzones, count),
+                         (tl.MAGIC, tl.VERSION, len(la.ZONES), 7))
+        self.assertEqual(len(data), tl.data_offset(nzones) +
+                         7 * tl.record_dtype(nzones).itemsize)
+        with tl.Timeline(self.path) as show:
+            self.assertEqual(show.duration(), 3.0)
+
+    def test_empty(self):
+        self.assertEqual(tl.write_timeline(self.path, []), 0)
+        with tl.Timeline(self.path) as show:
+            self.assertEqual(len(show), 0)
+            self.assertEqual(show.duration(), 0.0)
+            self.assertEqual(list(show), [])
+            self.assertEqual(tl.play_timeline(show, None), (0, 0))
+
+    def test_not_a_timeline(self):
+        with open(self.path, 'wb') as outfile:
+            outfile.write(struct.pack('<4sHHII', 'RIFF', 1, 3, 0, 0))
+        self.assertRaises(ValueError, tl.Timeline, self.path)
+
+
+class PlayTest(unittest.TestCase):
+    """
+    play_timeline keeping to the frame deadlines
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'show' + tl.TIMELINE_EXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def play(self, frames, write_latency=0.0, start=0):
+        """
+        play frames on a simulated backend, returning the result of
+        play_timeline and the session played on
+        """
+        tl.write_timeline(self.path, frames)
+        session = RecordingSession(la.SimulatedBackend(write_latency))
+        with tl.Timeline(self.path) as show:
+            result = tl.play_timeline(show, session, start)
+        return result, session
+
+    def test_plays_every_frame_in_time(self):
+        frames = color_frames(5, 0.03)
+        (played, skipped), session = self.play(frames)
+        self.assertEqual((played, skipped), (5, 0))
+        self.assertEqual(session.frames, [frame for _, frame in frames])
+        self.assertEqual(session.backend.colors, frames[-1][1])
+
+    def test_skips_late_frames(self):
+        # each frame takes three writes of 10ms, so frames 5ms apart fall
+        # behind
+        frames = color_frames(40, 0.005)
+        (played, skipped), session = self.play(frames, write_latency=0.01)
+        self.assertEqual(played + skipped, 40)
+        self.assertTrue(skipped > played, (played, skipped))
+        self.assertEqual(len(session.frames), played)
+        # the frames played are in order, and the show ends on its last
+        order = [[frame for _, frame in frames].index(played_frame)
+                 for played_frame in session.frames]
+        self.assertEqual(order, sorted(order))
+        self.assertEqual(order[0], 0)
+        self.assertEqual(session.backend.colors, frames[-1][1])
+
+    def test_start(self):
+        frames = color_frames(6, 0.01)
+        (played, skipped), session = self.play(frames, start=4)
+        self.assertEqual((played, skipped), (2, 0))
+        self.assertEqual(session.frames, [frame for _, frame in frames[4:]])
+        self.assertEqual(self.play(frames, start=6)[0], (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
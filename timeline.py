@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+
+"""
+Python 2.7 code for lighting shows stored as binary timelines
+
+IMPORTANT: run as administrator to play a show on the lights
+
+A timeline file is a 16 byte header, the light positions of its zones,
+padded to 8 bytes, and then fixed size frame records, all little-endian:
+
+    header:  magic 'ASLT', uint16 version, uint16 zone count,
+             uint32 frame count, uint32 reserved
+    zones:   uint32 light position (as in light_acpi) for each zone
+    records: uint64 frame time in microseconds from the show start,
+             then a uint32 0x00rrggbb color for each zone
+
+Timelines are opened with mmap, so a show of any length starts at once
+and plays in constant memory.
+
+Usage:
+    python timeline.py show.lights      play a show on the lights
+
+"""
+
+import mmap
+import struct
+import sys
+
+import numpy
+
+import light_acpi as la
+
+MAGIC = 'ASLT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+TIMELINE_EXT = '.lights'
+
+def record_dtype(nzones):
+    """
+    numpy dtype of one frame record
+    """
+    return numpy.dtype([('time', '<u8'), ('colors', '<u4', (nzones,))])
+
+def data_offset(nzones):
+    """
+    file offset of the first record
+    """
+    size = HEADER.size + 4 * nzones
+    return (size + 7) // 8 * 8
+
+
+class TimelineWriter(object):
+    """
+    Writes frames to a new timeline file, one record at a time
+    """
+    def __init__(self, path, zones=la.ZONES):
+        self.path = path
+        self.zones = tuple(zones)
+        self.count = 0
+        self.record = struct.Struct('<Q%dI' % len(self.zones))
+        self.outfile = open(path, 'wb')
+        self._write_header()
+        self.outfile.write(struct.pack('<%dI' % len(self.zones), *self.zones))
+        self.outfile.write('\0' * (data_offset(len(self.zones)) -
+                                   HEADER.size - 4 * len(self.zones)))
+
+    def _write_header(self):
+        """
+        write the header with the current frame count
+        """
+        self.outfile.write(HEADER.pack(MAGIC, VERSION, len(self.zones),
+                                       self.count, 0))
+
+    def append(self, seconds, frame):
+        """
+        add a frame, a dict of light position to color, at seconds from
+        the start of the show
+        zones missing from the frame are written black
+        """
+        colors = [int(frame.get(zone, 0)) & 0xffffff for zone in self.zones]
+        self.outfile.write(self.record.pack(int(round(seconds * 1e6)),
+                                            *colors))
+        self.count += 1
+
+    def close(self):
+        """
+        write the final frame count and close the file
+        """
+        if self.outfile is None:
+            return
+        self.outfile.seek(0)
+        self._write_header()
+        self.outfile.close()
+        self.outfile = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+
+def write_timeline(path, frames, zones=la.ZONES):
+    """
+    write an iterable of (seconds, frame) to a timeline file
+    returns the number of frames written
+    """
+    with TimelineWriter(path, zones) as writer:
+        for seconds, frame in frames:
+            writer.append(seconds, frame)
+    return writer.count
+
+
+class Timeline(object):
+    """
+    A timeline file opened read-only with mmap
+    times and colors are arrays viewing the file: frame times in seconds
+    are computed from times on use, and colors is (frames, zones)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.infile = open(path, 'rb')
+        self.mmap = mmap.mmap(self.infile.fileno(), 0,
+                              access=mmap.ACCESS_READ)
+        magic, version, nzones, count, _ = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s is not a version %d lighting timeline" %
+                             (path, VERSION))
+        self.zones = struct.unpack_from('<%dI' % nzones, self.mmap,
+                                        HEADER.size)
+        records = numpy.frombuffer(self.mmap, dtype=record_dtype(nzones),
+                                   count=count, offset=data_offset(nzones))
+        self.times = records['time']
+        self.colors = records['colors']
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, idx):
+        """
+        (seconds, frame) of the frame at idx
+        """
+        return self.times[idx] / 1e6, dict(zip(self.zones,
+                                               self.colors[idx].tolist()))
+
+    def __iter__(self):
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+    def duration(self):
+        """
+        seconds from the start to the last frame
+        """
+        if len(self) == 0:
+            return 0.0
+        return self.times[-1] / 1e6
+
+    def close(self):
+        """
+        drop the views of the file and unmap it
+        """
+        self.times = self.colors = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.infile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+
+def play_timeline(show, output, start=0):
+    """
+    commit each frame of a Timeline to output, a light_acpi session or
+    writer, at its deadline measured from when play starts
+    A frame whose deadline has passed when the next frame is also due is
+    skipped rather than played late, so the show never drifts behind
+    Returns (frames played, frames skipped)
+    """
+    played = skipped = 0
+    if start >= len(show):
+        return played, skipped
+    times = show.times
+    t_zero = la.timer() - times[start] / 1e6
+    nframes = len(show)
+    idx = start
+    while idx < nframes:
+        la.sleep_until(t_zero + times[idx] / 1e6)
+        # skip ahead to the newest frame that is already due
+        now = la.timer() - t_zero
+        while idx + 1 < nframes and times[idx + 1] / 1e6 <= now:
+            idx += 1
+            skipped += 1
+        output.commit_frame(show[idx][1])
+        played += 1
+        idx += 1
+    return played, skipped
+
+
+if __name__ == '__main__':
+    # python timeline.py show.lights [stats.json or stats.csv]
+    SHOW = Timeline(sys.argv[1])
+    SESSION = la.get_session(la.DPATH)
+    print "Playing %d frames, %.1f seconds" % (len(SHOW), SHOW.duration())
+    try:
+        print "%d frames played, %d skipped" % play_timeline(SHOW, SESSION)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        SHOW.close()
+        if len(sys.argv) > 2:
+            SESSION.stats.dump(sys.argv[2])